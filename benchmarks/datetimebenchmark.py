@@ -0,0 +1,83 @@
+"""
+Micro-benchmark for the wire format datetime conversions used by the APIs (see classes/DateTimeCodec.py)
+
+Compares strptime / strftime with the DateTimeCodec on a set of meal times like the ones in a large history response,
+both the first time the values are seen (empty memo) and when the same values repeat (warm memo).
+Also checks that the codec gives exactly the same results as strptime / strftime for every value it is timed on
+
+Usage: python benchmarks/datetimebenchmark.py [--values 2000] [--repeat 5]
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from classes.DateTimeCodec import DateTimeCodec, WIRE_FORMAT
+
+DEFAULT_NUM_VALUES = 2000
+DEFAULT_REPEAT = 5
+DEFAULT_SEED = 2016
+
+
+"""
+Generates meal times (on the minute, like the ones clients send) spread over a school year
+"""
+def generateDateTimes(numValues, randomGen):
+	yearStart = datetime.datetime(2015, 9, 1)
+	return [yearStart + datetime.timedelta(days = randomGen.randint(0, 270), minutes = randomGen.randint(7 * 60, 20 * 60)) for indx in xrange(numValues)]
+
+def clearMemos():
+	DateTimeCodec.parseMemo.clear()
+	DateTimeCodec.formatMemo.clear()
+
+"""
+Runs the conversion over all of the values repeat times (clearing the memos first every time if coldMemo)
+Returns the best time per conversion in microseconds
+"""
+def timeConversion(convert, values, repeat, coldMemo):
+	bestTime = None
+	for indx in xrange(repeat):
+		if (coldMemo):
+			clearMemos()
+		startTime = time.time()
+		for value in values:
+			convert(value)
+		elapsed = time.time() - startTime
+		if (bestTime is None or elapsed < bestTime):
+			bestTime = elapsed
+	return bestTime * 1000000.0 / len(values)
+
+
+def main():
+	parser = argparse.ArgumentParser(description = 'Benchmark the wire format datetime codec against strptime / strftime')
+	parser.add_argument('--values', type = int, default = DEFAULT_NUM_VALUES, help = 'number of distinct datetimes to convert')
+	parser.add_argument('--repeat', type = int, default = DEFAULT_REPEAT, help = 'number of runs to take the best of')
+	parser.add_argument('--seed', type = int, default = DEFAULT_SEED)
+	args = parser.parse_args()
+
+	dateTimes = generateDateTimes(args.values, random.Random(args.seed))
+	dateTimeStrings = [dateTimeOb.strftime(WIRE_FORMAT) for dateTimeOb in dateTimes]
+
+	clearMemos()
+	for dateTimeOb, dateTimeString in zip(dateTimes, dateTimeStrings):
+		if (DateTimeCodec.format(dateTimeOb) != dateTimeString or DateTimeCodec.parse(dateTimeString) != datetime.datetime.strptime(dateTimeString, WIRE_FORMAT)):
+			sys.exit('DateTimeCodec does not match strptime / strftime for ' + dateTimeString)
+
+	print '%-10s %-22s %14s' % ('direction', 'converter', 'usec / value')
+	rows = [
+		['parse', 'strptime', lambda value: datetime.datetime.strptime(value, WIRE_FORMAT), dateTimeStrings, True],
+		['parse', 'DateTimeCodec (cold)', DateTimeCodec.parse, dateTimeStrings, True],
+		['parse', 'DateTimeCodec (warm)', DateTimeCodec.parse, dateTimeStrings, False],
+		['format', 'strftime', lambda value: value.strftime(WIRE_FORMAT), dateTimes, True],
+		['format', 'DateTimeCodec (cold)', DateTimeCodec.format, dateTimes, True],
+		['format', 'DateTimeCodec (warm)', DateTimeCodec.format, dateTimes, False]
+	]
+	for direction, converterName, convert, values, coldMemo in rows:
+		print '%-10s %-22s %14.2f' % (direction, converterName, timeConversion(convert, values, args.repeat, coldMemo))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,143 @@
+"""
+Benchmark for the meal matching engine used by the /mealmatching cron
+
+Generates synthetic campus workloads of unmatched meal requests and runs the (datastore free)
+matchers over them, reporting throughput, peak memory and match rate for each workload and matcher.
+Every run happens in its own process so the peak memory of one run doesn't hide the next one.
+Workloads are generated from a fixed seed so results are reproducible between runs
+
+Usage: python benchmarks/matchingbenchmark.py [--sizes 1000,10000] [--workloads uniform,lunchrush] [--matchers greedy,maximum]
+"""
+import argparse
+import datetime
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from classes.MatchingEngine import MealRecord, matchMeals, maximumMatchMeals
+
+"""
+Constants that mirror the values used by the app
+"""
+MINIMUM_MEAL_LENGTH = 30
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+DEFAULT_SEED = 2016
+
+"""
+The (hour, minute) the dining hall opens and how long it stays open (minutes) for each meal type
+0 = breakfast, 1 = lunch, 2 = dinner
+"""
+MEAL_HOURS = {
+	0: [(7, 0), 150],
+	1: [(10, 30), 180],
+	2: [(16, 30), 210]
+}
+
+"""
+Workload generators. Each one returns a list of MealRecords spread over a single day
+starting at dayStart with roughly one user for every three requests
+"""
+def generateUniformWorkload(numRequests, dayStart, randomGen):
+	numUsers = max(2, numRequests / 3)
+	records = []
+	for indx in xrange(numRequests):
+		mealType = randomGen.randint(0, 2)
+		(openHour, openMinute), openLength = MEAL_HOURS[mealType]
+		startOffset = randomGen.randint(0, openLength - MINIMUM_MEAL_LENGTH)
+		records.append(createRecord(dayStart, mealType, openHour, openMinute, startOffset, randomGen, numUsers))
+	return records
+
+def generateLunchRushWorkload(numRequests, dayStart, randomGen):
+	numUsers = max(2, numRequests / 3)
+	records = []
+	for indx in xrange(numRequests):
+		#most requests are for lunch and pile up around noon
+		mealType = 1 if randomGen.random() < 0.7 else randomGen.choice([0, 2])
+		(openHour, openMinute), openLength = MEAL_HOURS[mealType]
+		peakOffset = openLength / 2
+		startOffset = int(randomGen.gauss(peakOffset, openLength / 8.0))
+		startOffset = min(max(startOffset, 0), openLength - MINIMUM_MEAL_LENGTH)
+		records.append(createRecord(dayStart, mealType, openHour, openMinute, startOffset, randomGen, numUsers))
+	return records
+
+def createRecord(dayStart, mealType, openHour, openMinute, startOffset, randomGen, numUsers):
+	startRange = dayStart + datetime.timedelta(hours = openHour, minutes = openMinute + startOffset)
+	endRange = startRange + datetime.timedelta(minutes = randomGen.choice([30, 45, 60, 90, 120]))
+	#most people want to eat with one other person but some want bigger groups
+	numPeople = 2 if randomGen.random() < 0.85 else randomGen.choice([3, 4])
+	return MealRecord(mealType, startRange, endRange, numPeople, randomGen.randint(0, numUsers))
+
+WORKLOADS = {
+	'uniform': generateUniformWorkload,
+	'lunchrush': generateLunchRushWorkload
+}
+
+MATCHERS = {
+	'greedy': matchMeals,
+	'maximum': maximumMatchMeals
+}
+
+
+"""
+Runs a single workload and puts [seconds, peak memory increase in KB, number matched, number expired] on the queue
+"""
+def runWorkload(workloadName, matcherName, numRequests, seed, resultQueue):
+	randomGen = random.Random(seed)
+	dayStart = datetime.datetime(2016, 1, 4)
+	records = WORKLOADS[workloadName](numRequests, dayStart, randomGen)
+	#run the matcher a little after breakfast opens so a few requests have already expired
+	currentTime = dayStart + datetime.timedelta(hours = 7, minutes = 45)
+
+	memoryBefore = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	startTime = time.time()
+	mealGroups, expiredMeals = MATCHERS[matcherName](records, currentTime, MINIMUM_MEAL_LENGTH)
+	elapsed = time.time() - startTime
+	memoryAfter = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+	numMatched = sum(len(group) for group in mealGroups)
+	resultQueue.put([elapsed, memoryAfter - memoryBefore, numMatched, len(expiredMeals)])
+
+def runInOwnProcess(workloadName, matcherName, numRequests, seed):
+	resultQueue = multiprocessing.Queue()
+	process = multiprocessing.Process(target = runWorkload, args = (workloadName, matcherName, numRequests, seed, resultQueue))
+	process.start()
+	result = resultQueue.get()
+	process.join()
+	return result
+
+
+def main():
+	parser = argparse.ArgumentParser(description = 'Benchmark the meal matching engine')
+	parser.add_argument('--sizes', default = ','.join(str(size) for size in DEFAULT_SIZES), help = 'comma separated number of requests per workload')
+	parser.add_argument('--workloads', default = ','.join(sorted(WORKLOADS)), help = 'comma separated workloads to run: ' + ', '.join(sorted(WORKLOADS)))
+	parser.add_argument('--matchers', default = ','.join(sorted(MATCHERS)), help = 'comma separated matchers to compare: ' + ', '.join(sorted(MATCHERS)))
+	parser.add_argument('--seed', type = int, default = DEFAULT_SEED)
+	args = parser.parse_args()
+
+	sizes = [int(size) for size in args.sizes.split(',')]
+	workloadNames = args.workloads.split(',')
+	for workloadName in workloadNames:
+		if (workloadName not in WORKLOADS):
+			parser.error('unknown workload ' + workloadName)
+	matcherNames = args.matchers.split(',')
+	for matcherName in matcherNames:
+		if (matcherName not in MATCHERS):
+			parser.error('unknown matcher ' + matcherName)
+
+	print '%-10s %-8s %10s %12s %14s %12s %10s' % ('workload', 'matcher', 'requests', 'seconds', 'requests/sec', 'peak mem KB', 'match %')
+	for workloadName in workloadNames:
+		for numRequests in sizes:
+			for matcherName in matcherNames:
+				elapsed, peakMemory, numMatched, numExpired = runInOwnProcess(workloadName, matcherName, numRequests, args.seed)
+				numMatchable = numRequests - numExpired
+				matchRate = 100.0 * numMatched / numMatchable if numMatchable else 0.0
+				throughput = numRequests / elapsed if elapsed else float('inf')
+				print '%-10s %-8s %10d %12.3f %14.0f %12d %10.1f' % (workloadName, matcherName, numRequests, elapsed, throughput, peakMemory, matchRate)
+
+
+if __name__ == '__main__':
+	main()
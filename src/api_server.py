@@ -1,6 +1,7 @@
 import endpoints
 from apis.UserApi import UserApi
 from apis.MealApi import MealApi
+from classes.Instrumentation import Instrumentation
 
 
-API_SERVER = endpoints.api_server([UserApi, MealApi], restricted = False)
\ No newline at end of file
+API_SERVER = Instrumentation.instrumentApplication(endpoints.api_server([UserApi, MealApi], restricted = False))
\ No newline at end of file
@@ -1,11 +1,15 @@
 import endpoints
+from google.appengine.ext import ndb
 from protorpc import messages
 from protorpc import message_types
+from protorpc import protobuf
 from protorpc import remote
 
 import classes.Ratings
 from classes.Meal import *
 from classes.User import User
+from classes.Compliment import Compliment
+from classes.UpcomingMealsCache import UpcomingMealsCache
 from classes.Utilities import *
 
 
@@ -16,6 +20,7 @@ Application Specific Error Numbers
 -3 => At least two people are required for a meal
 -4 => Invalid meal type ( < 0 or > 2)
 -5 => Not a valid date range
+-6 => The unmatched meal doesn't exist anymore (it was matched or deleted)
 -100 => User was unable to be validated as logged in
 -101 => User is not in good standing with the community (was reported / downvoted)
 """
@@ -27,6 +32,7 @@ errorMessages = {
     -3: "There must be at least two people to have a meal.",
     -4: "That is not a valid meal type.",
     -5: "That is not a valid date range.",
+    -6: "That meal has already been matched or deleted.",
     -100: "You are not logged in.",
     -101: "You have been reported negatively by the community. Please contact CafBuddy directly to continue enjoying these services."
 }
@@ -55,6 +61,10 @@ class GetAllUpcomingMealsRequestMessage(messages.Message):
     authToken = messages.StringField(1, required = True)
     emailAddress = messages.StringField(2, required = True)
 
+class GetDashboardRequestMessage(messages.Message):
+    authToken = messages.StringField(1, required = True)
+    emailAddress = messages.StringField(2, required = True)
+
 class GetMatchedMealsInRangeRequestMessage(messages.Message):
     authToken = messages.StringField(1, required = True)
     emailAddress = messages.StringField(2, required = True)
@@ -108,6 +118,7 @@ class CreateNewMealResponseMessage(messages.Message):
     errorNumber = messages.IntegerField(1, required = False)
     errorMessage = messages.StringField(2, required = False)
     mealKey = messages.StringField(3, required = False)
+    matched = messages.BooleanField(4, required = False)
 
 class GetUpcomingMatchedMealsResponseMessage(messages.Message):
     errorNumber = messages.IntegerField(1, required = False)
@@ -125,6 +136,14 @@ class GetAllUpcomingMealsResponseMessage(messages.Message):
     matchedMeals = messages.MessageField(MatchedMealMessage, 3, repeated = True)
     unMatchedMeals = messages.MessageField(UnMatchedMealMessage, 4, repeated = True)
 
+class GetDashboardResponseMessage(messages.Message):
+    errorNumber = messages.IntegerField(1, required = False)
+    errorMessage = messages.StringField(2, required = False)
+    matchedMeals = messages.MessageField(MatchedMealMessage, 3, repeated = True)
+    unMatchedMeals = messages.MessageField(UnMatchedMealMessage, 4, repeated = True)
+    numComplimentsReceived = messages.IntegerField(5, required = False)
+    numComplimentsGiven = messages.IntegerField(6, required = False)
+
 class GetMatchedMealsInRangeResponseMessage(messages.Message):
     errorNumber = messages.IntegerField(1, required = False)
     errorMessage = messages.StringField(2, required = False)
@@ -137,6 +156,8 @@ class DeleteUnMatchedMealResponseMessage(messages.Message):
 class EditUnMatchedMealResponseMessage(messages.Message):
     errorNumber = messages.IntegerField(1, required = False)
     errorMessage = messages.StringField(2, required = False)
+    matched = messages.BooleanField(3, required = False)
+    matchedMealKey = messages.StringField(4, required = False)
 
 
 @endpoints.api(name='mealService', version='v1.0', description='API for dealing with meals', hostname='cafbuddy.appspot.com')  
@@ -146,6 +167,9 @@ class MealApi(remote.Service):
     Creates a new unmatched meal that will try to be matched with someone else
     startRange and endRange must be given in UTC time. They must be of the format:
     'Month Day Year Hour(24):Minute:Second' (e.g. 'January 03 2016 00:43:58')
+    If someone is already waiting for a compatible meal the new meal is matched right away
+    (and shows up with the matched meals instead of the unmatched meals). matched is true then and mealKey is the key of
+    the new matched meal, otherwise mealKey is the key of the new unmatched meal
     On Error: -1, -2, -3, -4, -100, -101
     """
     @endpoints.method(CreateNewMealRequestMessage, CreateNewMealResponseMessage, name='createNewMeal', path='createNewMeal', http_method='POST')
@@ -157,7 +181,7 @@ class MealApi(remote.Service):
         success, errorNumOrMealOb = UnMatchedMeal.createNewUnMatchedMeal(userOb, request.mealType, request.startRange, request.endRange, request.numPeople)
         if (not success):
             return CreateNewMealResponseMessage(errorMessage = errorMessages[errorNumOrMealOb], errorNumber = errorNumOrMealOb)
-        return CreateNewMealResponseMessage(errorNumber = 200, mealKey = errorNumOrMealOb.key.urlsafe())
+        return CreateNewMealResponseMessage(errorNumber = 200, mealKey = errorNumOrMealOb.key.urlsafe(), matched = isinstance(errorNumOrMealOb, Meal))
 
 
     """
@@ -169,11 +193,18 @@ class MealApi(remote.Service):
         isLoggedIn, userOb = User.validateLogIn(request.emailAddress, request.authToken)
         if (not isLoggedIn):
             return GetUpcomingMatchedMealsResponseMessage(errorMessage = errorMessages[-100], errorNumber = -100)
+
+        #clients poll this while they wait for a match so answer from the cache if nothing changed
+        generation, cachedResponse = UpcomingMealsCache.getResponse(userOb.key, 'getUpcomingMatchedMeals')
+        if (cachedResponse is not None):
+            return protobuf.decode_message(GetUpcomingMatchedMealsResponseMessage, cachedResponse)
         
-        upcomingMealsList = Meal.getUpcomingMealsForUser(userOb.key)
+        upcomingMealsList = Meal.getUpcomingMealsForUser(userOb.key, userOb.schoolKey)
         matchedMealsMessageList = self.convertMatchedListToMatchedMessageList(upcomingMealsList)
 
-        return GetUpcomingMatchedMealsResponseMessage(errorNumber = 200, matchedMeals = matchedMealsMessageList)
+        responseMessage = GetUpcomingMatchedMealsResponseMessage(errorNumber = 200, matchedMeals = matchedMealsMessageList)
+        self.cacheUpcomingResponse(userOb, 'getUpcomingMatchedMeals', generation, responseMessage, [theMeal.startTime for theMeal in upcomingMealsList])
+        return responseMessage
 
     """
     Gets all the upcoming unmatched meals for the validated user (potential meals which have yet to be matched with others)
@@ -184,11 +215,17 @@ class MealApi(remote.Service):
         isLoggedIn, userOb = User.validateLogIn(request.emailAddress, request.authToken)
         if (not isLoggedIn):
             return GetUpcomingUnMatchedMealsResponseMessage(errorMessage = errorMessages[-100], errorNumber = -100)
+
+        generation, cachedResponse = UpcomingMealsCache.getResponse(userOb.key, 'getUpcomingUnMatchedMeals')
+        if (cachedResponse is not None):
+            return protobuf.decode_message(GetUpcomingUnMatchedMealsResponseMessage, cachedResponse)
         
-        upcomingUnMatchedMealsList = UnMatchedMeal.getUpcomingUnMatchedMealsForUser(userOb.key)
+        upcomingUnMatchedMealsList = UnMatchedMeal.getUpcomingUnMatchedMealsForUser(userOb.key, userOb.schoolKey)
         unMatchedMealsMessageList = self.convertUnMatchedListToUnMatchedMessageList(upcomingUnMatchedMealsList)
 
-        return GetUpcomingUnMatchedMealsResponseMessage(errorNumber = 200, unMatchedMeals = unMatchedMealsMessageList)
+        responseMessage = GetUpcomingUnMatchedMealsResponseMessage(errorNumber = 200, unMatchedMeals = unMatchedMealsMessageList)
+        self.cacheUpcomingResponse(userOb, 'getUpcomingUnMatchedMeals', generation, responseMessage, [theMeal.startRange for theMeal in upcomingUnMatchedMealsList])
+        return responseMessage
 
 
     """
@@ -202,14 +239,50 @@ class MealApi(remote.Service):
         isLoggedIn, userOb = User.validateLogIn(request.emailAddress, request.authToken)
         if (not isLoggedIn):
             return GetAllUpcomingMealsResponseMessage(errorMessage = errorMessages[-100], errorNumber = -100)
+
+        generation, cachedResponse = UpcomingMealsCache.getResponse(userOb.key, 'getAllUpcomingMeals')
+        if (cachedResponse is not None):
+            return protobuf.decode_message(GetAllUpcomingMealsResponseMessage, cachedResponse)
         
-        upcomingMealsList = Meal.getUpcomingMealsForUser(userOb.key)
-        upcomingUnMatchedMealsList = UnMatchedMeal.getUpcomingUnMatchedMealsForUser(userOb.key)
+        upcomingMealsList = Meal.getUpcomingMealsForUser(userOb.key, userOb.schoolKey)
+        upcomingUnMatchedMealsList = UnMatchedMeal.getUpcomingUnMatchedMealsForUser(userOb.key, userOb.schoolKey)
 
         matchedMealsMessageList = self.convertMatchedListToMatchedMessageList(upcomingMealsList)
         unMatchedMealsMessageList = self.convertUnMatchedListToUnMatchedMessageList(upcomingUnMatchedMealsList)
 
-        return GetAllUpcomingMealsResponseMessage(errorNumber = 200, matchedMeals = matchedMealsMessageList, unMatchedMeals = unMatchedMealsMessageList)
+        responseMessage = GetAllUpcomingMealsResponseMessage(errorNumber = 200, matchedMeals = matchedMealsMessageList, unMatchedMeals = unMatchedMealsMessageList)
+        startTimes = [theMeal.startTime for theMeal in upcomingMealsList] + [theMeal.startRange for theMeal in upcomingUnMatchedMealsList]
+        self.cacheUpcomingResponse(userOb, 'getAllUpcomingMeals', generation, responseMessage, startTimes)
+        return responseMessage
+
+    """
+    Gets everything the home screen shows in one call: the upcoming matched meals (with the names of everyone in them),
+    the upcoming unmatched meals and the number of compliments the user has received and given
+    Once the user is logged in all of these are fetched at the same time so the call takes about as long as the slowest of them
+    On Error: -100
+    """
+    @endpoints.method(GetDashboardRequestMessage, GetDashboardResponseMessage, name='getDashboard', path='getDashboard', http_method='POST')
+    def getDashboard(self, request):
+        isLoggedIn, userOb = User.validateLogIn(request.emailAddress, request.authToken)
+        if (not isLoggedIn):
+            return GetDashboardResponseMessage(errorMessage = errorMessages[-100], errorNumber = -100)
+
+        matchedMealsFuture = self.getUpcomingMealsWithUserNamesAsync(userOb.key, userOb.schoolKey)
+        complimentsReceivedFuture = Compliment.countComplimentsGivenToUserAsync(userOb.key)
+        complimentsGivenFuture = Compliment.countComplimentsGivenByUserAsync(userOb.key)
+        unMatchedMealsFuture = UnMatchedMeal.getUpcomingUnMatchedMealsForUserAsync(userOb.key, userOb.schoolKey)
+
+        upcomingMealsList, keyStringToNames = matchedMealsFuture.get_result()
+        matchedMealsMessageList = self.convertMatchedListToMatchedMessageListWithUserNames(upcomingMealsList, keyStringToNames)
+        unMatchedMealsMessageList = self.convertUnMatchedListToUnMatchedMessageList(unMatchedMealsFuture.get_result())
+
+        return GetDashboardResponseMessage(
+            errorNumber = 200,
+            matchedMeals = matchedMealsMessageList,
+            unMatchedMeals = unMatchedMealsMessageList,
+            numComplimentsReceived = complimentsReceivedFuture.get_result(),
+            numComplimentsGiven = complimentsGivenFuture.get_result()
+        )
 
     """
     Gets all the matched meals (meals that have been paired with others) within the specified date range
@@ -249,7 +322,9 @@ class MealApi(remote.Service):
 
     """
     Edits the specified unmatched meal
-    On Error: -100, -2, -3, -4
+    If the edit makes it compatible with someone that is already waiting it is matched right away, matched is true then
+    and matchedMealKey is the key of the new matched meal
+    On Error: -100, -2, -3, -4, -6
     """
     @endpoints.method(EditUnMatchedMealRequestMessage, EditUnMatchedMealResponseMessage, name='editUnMatchedMeal', path='editUnMatchedMeal', http_method='POST')
     def editUnMatchedMeal(self, request):
@@ -273,17 +348,35 @@ class MealApi(remote.Service):
         if (request.numPeople != None):
             theNumPeople = request.numPeople
         
-        success, errorNum = UnMatchedMeal.editUnMatchedMeal(ndb.Key(urlsafe=request.mealKey), mealType = theMealType, startRange = theStartRange, endRange = theEndRange, numPeople = theNumPeople)
+        success, errorNumOrMealOb = UnMatchedMeal.editUnMatchedMeal(ndb.Key(urlsafe=request.mealKey), mealType = theMealType, startRange = theStartRange, endRange = theEndRange, numPeople = theNumPeople)
 
         if (not success):
-            return EditUnMatchedMealResponseMessage(errorMessage = errorMessages[errorNum], errorNumber = errorNum)
-        return EditUnMatchedMealResponseMessage(errorNumber = 200)
+            return EditUnMatchedMealResponseMessage(errorMessage = errorMessages[errorNumOrMealOb], errorNumber = errorNumOrMealOb)
+        if (errorNumOrMealOb is not None):
+            return EditUnMatchedMealResponseMessage(errorNumber = 200, matched = True, matchedMealKey = errorNumOrMealOb.key.urlsafe())
+        return EditUnMatchedMealResponseMessage(errorNumber = 200, matched = False)
 
 
     """
     Private methods
     """
 
+    """
+    Caches the serialized upcoming meals response of the user until the first of the meals in it starts (startTimes)
+    and is no longer upcoming, or until the user's meals change
+    Only responses built from strongly consistent reads (ancestor queries on the user's school) are cached, an eventually consistent
+    one could be missing a meal that was just matched and would then be served until the user's meals change again
+    (the root meals merged into the upcoming meals are read with an eventually consistent query but they were all matched long ago)
+    """
+    @classmethod
+    def cacheUpcomingResponse(cls, userOb, responseName, generation, responseMessage, startTimes):
+        if (userOb.schoolKey is None):
+            return
+        expiresAt = None
+        if (startTimes):
+            expiresAt = min(startTimes)
+        UpcomingMealsCache.setResponse(userOb.key, responseName, generation, protobuf.encode_message(responseMessage), expiresAt)
+
     @classmethod
     def convertUnMatchedListToUnMatchedMessageList(cls, unMatchedMealsList):
         unMatchedMealsMessageList = []
@@ -316,23 +409,39 @@ class MealApi(remote.Service):
         return matchedMealsMessageList
 
 
+    """
+    keyStringToNames can be given if the names of the users in the meals were already fetched
+    """
     @classmethod
-    def convertMatchedListToMatchedMessageListWithUserNames(cls, matchedMealsList):
+    def convertMatchedListToMatchedMessageListWithUserNames(cls, matchedMealsList, keyStringToNames = None):
+        #need the names of all the users in all of the meals, get them all at once
+        if (keyStringToNames is None):
+            keyStringToNames = User.getUserNamesForKeyList([personKey for theMeal in matchedMealsList for personKey in theMeal.people])
         matchedMealsMessageList = []
         for theMeal in matchedMealsList:
-            #need to get the user objects for all the users in the meal
-            keyStringToUserOb = User.getUserObjectsForKeyList(theMeal.people)
+            personKeyStrings = [personKey.urlsafe() for personKey in theMeal.people]
             theMatchedMeal = MatchedMealMessage(
                 mealType = theMeal.mealType,
                 startTime = dateTimeOjectToString(theMeal.startTime),
                 numPeople = theMeal.numPeople,
-                people = [UserMessage(userKey = stringKey, firstName = userOb.firstName, lastName = userOb.lastName) for stringKey, userOb in keyStringToUserOb.iteritems()],
+                people = [UserMessage(userKey = stringKey, firstName = keyStringToNames[stringKey][0], lastName = keyStringToNames[stringKey][1]) for stringKey in personKeyStrings if stringKey in keyStringToNames],
                 matchedDate = dateTimeOjectToString(theMeal.matchedDate),
                 mealKey = theMeal.key.urlsafe()
             )
             matchedMealsMessageList.append(theMatchedMeal)
         return matchedMealsMessageList
 
+    """
+    Gets the upcoming meals of the user and then the names of everyone in them
+    Returns a future for [list of Meal objects, dict of urlsafe userKey -> [firstName, lastName]]
+    """
+    @classmethod
+    @ndb.tasklet
+    def getUpcomingMealsWithUserNamesAsync(cls, userKey, schoolKey = None):
+        upcomingMealsList = yield Meal.getUpcomingMealsForUserAsync(userKey, schoolKey)
+        keyStringToNames = yield User.getUserNamesForKeyListAsync([personKey for theMeal in upcomingMealsList for personKey in theMeal.people])
+        raise ndb.Return([upcomingMealsList, keyStringToNames])
+
     """
     userOb is the user that we are checking if they have given feedback or not for the meals
     in the matchedMealList
@@ -340,9 +449,10 @@ class MealApi(remote.Service):
     @classmethod
     def convertMatchedListToMatchedMessageListWithUserNamesAndFeedback(cls, matchedMealsList, userKey):
         matchedMealsMessageList = cls.convertMatchedListToMatchedMessageListWithUserNames(matchedMealsList)
-        for theMatchedMealMessage in matchedMealsMessageList:
-            hasGivenFeedback = Ratings.Ratings.userHasGivenFeedbackForMeal(userKey,ndb.Key(urlsafe = theMatchedMealMessage.mealKey))
-            theMatchedMealMessage.feedbackGiven = hasGivenFeedback
+        #look up the feedback for all of the meals at once
+        ratedMealKeys = Ratings.Ratings.getMealsUserHasGivenFeedbackFor(userKey, [theMeal.key for theMeal in matchedMealsList])
+        for theMeal, theMatchedMealMessage in zip(matchedMealsList, matchedMealsMessageList):
+            theMatchedMealMessage.feedbackGiven = (theMeal.key in ratedMealKeys)
         return matchedMealsMessageList
 
 
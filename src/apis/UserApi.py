@@ -247,6 +247,8 @@ class UserApi(remote.Service):
 
 	"""
 	Sets a Positive rating on on the specified users
+	The ratings are written in parallel and the response waits for them, so a rating that couldn't be stored is returned as an error
+	the client can retry (a retried rating that was stored is ignored). Updating the users' standings is left to tasks
 	On Errror: -100
 	"""
 	@endpoints.method(IncrementPositiveRatingRequestMessage, IncrementPositiveRatingResponseMessage, name='incrementPositiveRating', path='incrementPositiveRating', http_method='POST')
@@ -255,13 +257,16 @@ class UserApi(remote.Service):
 		if (not isLoggedIn):
 			return IncrementPositiveRatingResponseMessage(errorMessage = errorMessages[-100], errorNumber = -100)
 
-		for userKey in request.userKeys:
-			Ratings.addPositiveRating(ndb.Key(urlsafe = userKey), ndb.Key(urlsafe = request.mealKey), ndb.Key(urlsafe = request.fromUserKey))
+		#the ratings of all of the users are written at the same time, the response waits for them so failures reach the client
+		ratingFutures = [Ratings.addPositiveRatingAsync(ndb.Key(urlsafe = userKey), ndb.Key(urlsafe = request.mealKey), ndb.Key(urlsafe = request.fromUserKey)) for userKey in request.userKeys]
+		for ratingFuture in ratingFutures:
+			ratingFuture.get_result()
 		return IncrementPositiveRatingResponseMessage(errorNumber = 200)
 
 
 	"""
 	Increments a Negative rating on the specified users
+	Waits for the ratings like incrementPositiveRating so a rating that couldn't be stored is returned as an error
 	On Errror: -100
 	"""
 	@endpoints.method(IncrementNegativeRatingRequestMessage, IncrementNegativeRatingResponseMessage, name='incrementNegativeRating', path='incrementNegativeRating', http_method='POST')
@@ -270,8 +275,10 @@ class UserApi(remote.Service):
 		if (not isLoggedIn):
 			return IncrementNegativeRatingResponseMessage(errorMessage = errorMessages[-100], errorNumber = -100)
 		
-		for userKey in request.userKeys:
-			Ratings.addNegativeRating(ndb.Key(urlsafe = userKey), ndb.Key(urlsafe = request.mealKey), ndb.Key(urlsafe = request.fromUserKey))
+		#the ratings of all of the users are written at the same time, the response waits for them so failures reach the client
+		ratingFutures = [Ratings.addNegativeRatingAsync(ndb.Key(urlsafe = userKey), ndb.Key(urlsafe = request.mealKey), ndb.Key(urlsafe = request.fromUserKey)) for userKey in request.userKeys]
+		for ratingFuture in ratingFutures:
+			ratingFuture.get_result()
 		return IncrementNegativeRatingResponseMessage(errorNumber = 200)
 
 
@@ -283,6 +290,8 @@ class UserApi(remote.Service):
 	1: Harrasment / Bullying
 	2: Unfriendly
 	********
+	Waits for the reports like incrementPositiveRating so a report that couldn't be stored is returned as an error
+	(the standings and the report emails are left to tasks)
 	On Errror: -3, -100
 	"""
 	@endpoints.method(AddReportToUserRequestMessage, AddReportToUserResponseMessage, name='addReportToUser', path='addReportToUser', http_method='POST')
@@ -291,8 +300,10 @@ class UserApi(remote.Service):
 		if (not isLoggedIn):
 			return AddReportToUserResponseMessage(errorMessage = errorMessages[-100], errorNumber = -100)
 
-		for userKey in request.userKeys:
-			Ratings.addReportToUser(ndb.Key(urlsafe = userKey), request.reportType, ndb.Key(urlsafe = request.fromUserKey), ndb.Key(urlsafe = request.mealKey), request.comments)
+		#the reports of all of the users are written at the same time, the response waits for them so failures reach the client
+		reportFutures = [Ratings.addReportToUserAsync(ndb.Key(urlsafe = userKey), request.reportType, ndb.Key(urlsafe = request.fromUserKey), ndb.Key(urlsafe = request.mealKey), request.comments) for userKey in request.userKeys]
+		for reportFuture in reportFutures:
+			reportFuture.get_result()
 		return AddReportToUserResponseMessage(errorNumber = 200)
 
 	"""
@@ -39,4 +39,20 @@ class Compliment(ndb.Model):
 	"""
 	@classmethod
 	def getComplimentsGivenByUser(cls, userKey):
-		return cls.query(cls.giver == userKey).order(cls.added).fetch()
\ No newline at end of file
+		return cls.query(cls.giver == userKey).order(cls.added).fetch()
+
+	"""
+	Counts the compliments given to a specific user without waiting for the count
+	Returns: a future for the number of compliments
+	"""
+	@classmethod
+	def countComplimentsGivenToUserAsync(cls, userKey):
+		return cls.query(cls.receiver == userKey).count_async()
+
+	"""
+	Counts the compliments given by a specific user without waiting for the count
+	Returns: a future for the number of compliments
+	"""
+	@classmethod
+	def countComplimentsGivenByUserAsync(cls, userKey):
+		return cls.query(cls.giver == userKey).count_async()
\ No newline at end of file
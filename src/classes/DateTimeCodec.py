@@ -0,0 +1,96 @@
+import datetime
+
+"""
+The wire format of every date sent to or received from the client: 'Month Day Year Hour(24):Minute:Second'
+(e.g. 'January 03 2016 00:43:58')
+"""
+WIRE_FORMAT = '%B %d %Y %H:%M:%S'
+
+"""
+Month names in the wire format (the C locale names strftime uses) and the month number of each name
+"""
+MONTH_NAMES = [None, 'January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
+MONTH_NUMBERS = dict((monthName, monthNumber) for monthNumber, monthName in enumerate(MONTH_NAMES) if monthName is not None)
+
+#zero padded strings of 0 to 99 for the day, hour, minute and second fields
+TWO_DIGITS = ['%02d' % number for number in range(100)]
+
+"""
+Maximum number of recently converted values each memo keeps (a memo is emptied once it gets bigger than this)
+"""
+DATETIME_MEMO_SIZE = 4096
+
+
+"""
+Converts between datetime objects and the wire format without going through strptime / strftime
+Only the canonical form of the format (the form strftime produces) is handled by hand, anything else (lowercase month names,
+single digit days, extra whitespace...) and years before 1900 are passed on to strptime / strftime so the results and
+errors are always exactly the same as theirs. Recently converted values are remembered since the same meal times
+show up over and over again in a response
+"""
+class DateTimeCodec(object):
+	parseMemo = {}
+	formatMemo = {}
+
+	"""
+	Converts a wire format string into a datetime object
+	Raises ValueError if the string isn't in the wire format (just like strptime)
+	"""
+	@classmethod
+	def parse(cls, dateTimeString):
+		dateTimeOb = cls.parseMemo.get(dateTimeString)
+		if (dateTimeOb is not None):
+			return dateTimeOb
+
+		dateTimeOb = cls.__parseCanonical(dateTimeString)
+		if (dateTimeOb is None):
+			dateTimeOb = datetime.datetime.strptime(dateTimeString, WIRE_FORMAT)
+		if (len(cls.parseMemo) >= DATETIME_MEMO_SIZE):
+			cls.parseMemo.clear()
+		cls.parseMemo[dateTimeString] = dateTimeOb
+		return dateTimeOb
+
+	"""
+	Converts a datetime object into a wire format string (microseconds and time zones are dropped, just like strftime)
+	Raises ValueError for years before 1900 (just like strftime)
+	"""
+	@classmethod
+	def format(cls, dateTimeOb):
+		#aware datetimes in different time zones can be equal so they aren't remembered
+		if (dateTimeOb.year < 1900 or dateTimeOb.tzinfo is not None):
+			return dateTimeOb.strftime(WIRE_FORMAT)
+
+		dateTimeString = cls.formatMemo.get(dateTimeOb)
+		if (dateTimeString is not None):
+			return dateTimeString
+		dateTimeString = MONTH_NAMES[dateTimeOb.month] + ' ' + TWO_DIGITS[dateTimeOb.day] + ' ' + str(dateTimeOb.year) + ' ' + TWO_DIGITS[dateTimeOb.hour] + ':' + TWO_DIGITS[dateTimeOb.minute] + ':' + TWO_DIGITS[dateTimeOb.second]
+		if (len(cls.formatMemo) >= DATETIME_MEMO_SIZE):
+			cls.formatMemo.clear()
+		cls.formatMemo[dateTimeOb] = dateTimeString
+		return dateTimeString
+
+	"""
+	Parses the string if it is exactly in the form strftime produces: 'Month DD YYYY HH:MM:SS'
+	Returns the datetime object or None if the string isn't in that form
+	"""
+	@classmethod
+	def __parseCanonical(cls, dateTimeString):
+		if (isinstance(dateTimeString, unicode)):
+			try:
+				dateTimeString = dateTimeString.encode('ascii')
+			except UnicodeEncodeError:
+				return None
+
+		parts = dateTimeString.split(' ')
+		if (len(parts) != 4):
+			return None
+		monthName, day, year, timeOfDay = parts
+		monthNumber = MONTH_NUMBERS.get(monthName)
+		if (monthNumber is None or len(day) != 2 or len(year) != 4 or len(timeOfDay) != 8 or timeOfDay[2] != ':' or timeOfDay[5] != ':'):
+			return None
+		hour = timeOfDay[0:2]
+		minute = timeOfDay[3:5]
+		second = timeOfDay[6:8]
+		if (not (day.isdigit() and year.isdigit() and hour.isdigit() and minute.isdigit() and second.isdigit())):
+			return None
+		return datetime.datetime(int(year), monthNumber, int(day), int(hour), int(minute), int(second))
@@ -0,0 +1,219 @@
+from google.appengine.api import apiproxy_stub_map
+
+import os
+import random
+import threading
+import time
+
+"""
+Fraction of requests (0 to 1) that are instrumented, the rest run without any overhead
+"""
+INSTRUMENTATION_SAMPLE_RATE = 1.0
+
+"""
+Upper bounds (milliseconds) of the wall time histogram buckets, slower requests go into a final overflow bucket
+"""
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+"""
+Most endpoints (paths) tracked per instance, requests to any others are all counted under OTHER_ENDPOINT
+"""
+MAX_TRACKED_ENDPOINTS = 200
+OTHER_ENDPOINT = 'other'
+
+#name the hooks are registered under so they are only ever added once
+INSTRUMENTATION_HOOK_KEY = 'instrumentation'
+
+
+"""
+What happened during a single instrumented request (or any other block of code that is recorded)
+Records nest: a block recorded inside a request has the request's record as its parent and every call is counted in both
+"""
+class RequestRecord(object):
+	def __init__(self, parent = None):
+		self.parent = parent
+		self.startTime = time.time()
+		#datastore call name (Get, Put, RunQuery...) -> [number of calls, total milliseconds]
+		self.datastoreCalls = {}
+		self.memcacheHits = 0
+		self.memcacheMisses = 0
+		self.pendingCalls = {}
+
+	def getNumDatastoreCalls(self):
+		return sum(callStats[0] for callStats in self.datastoreCalls.itervalues())
+
+	def getElapsedMs(self):
+		return (time.time() - self.startTime) * 1000.0
+
+
+"""
+Records wall time, datastore calls (counts and latency by call), memcache hits and misses and payload sizes of requests
+and aggregates them per endpoint in the memory of the instance
+Datastore and memcache calls are seen through apiproxy hooks, so everything (ndb, queries, tasklets...) is counted
+"""
+class Instrumentation(object):
+	requestState = threading.local()
+	statsLock = threading.Lock()
+	#endpoint -> aggregated stats (see getStats)
+	endpointStats = {}
+
+	"""
+	Wraps a WSGI application (an endpoints api server or a webapp2 application) so a sample of its requests are recorded
+	under their path
+	Returns the wrapped WSGI application
+	"""
+	@classmethod
+	def instrumentApplication(cls, application):
+		cls.installHooks()
+		def instrumentedApplication(environ, start_response):
+			if (random.random() >= INSTRUMENTATION_SAMPLE_RATE):
+				return application(environ, start_response)
+
+			record = cls.startRecording()
+			try:
+				result = application(environ, start_response)
+				try:
+					responseBody = list(result)
+				finally:
+					if (hasattr(result, 'close')):
+						result.close()
+			finally:
+				cls.stopRecording()
+			requestBytes = int(environ.get('CONTENT_LENGTH') or 0)
+			cls.addRecord(environ.get('PATH_INFO', ''), record, requestBytes, sum(len(chunk) for chunk in responseBody))
+			return responseBody
+		return instrumentedApplication
+
+	"""
+	Registers the apiproxy hooks that count the datastore and memcache calls (does nothing if they are already registered)
+	Returns: void
+	"""
+	@classmethod
+	def installHooks(cls):
+		apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(INSTRUMENTATION_HOOK_KEY, beforeApiCall)
+		apiproxy_stub_map.apiproxy.GetPostCallHooks().Append(INSTRUMENTATION_HOOK_KEY, afterApiCall)
+
+	"""
+	Starts recording the calls made by this thread into a new record (nested in the record already being recorded into, if any)
+	Returns the RequestRecord
+	"""
+	@classmethod
+	def startRecording(cls):
+		cls.installHooks()
+		cls.requestState.record = RequestRecord(cls.getCurrentRecord())
+		return cls.requestState.record
+
+	"""
+	Stops recording into the current record of this thread and goes back to recording into its parent (if any)
+	Returns the RequestRecord that was being recorded into (or None)
+	"""
+	@classmethod
+	def stopRecording(cls):
+		record = getattr(cls.requestState, 'record', None)
+		cls.requestState.record = record.parent if record is not None else None
+		return record
+
+	"""
+	Returns the RequestRecord the calls made by this thread are being recorded into (or None)
+	"""
+	@classmethod
+	def getCurrentRecord(cls):
+		return getattr(cls.requestState, 'record', None)
+
+	"""
+	Adds a finished record to the aggregated stats of the endpoint
+	Returns: void
+	"""
+	@classmethod
+	def addRecord(cls, endpoint, record, requestBytes = 0, responseBytes = 0):
+		elapsedMs = record.getElapsedMs()
+		bucketIndx = len(LATENCY_BUCKETS_MS)
+		for indx, bucketLimit in enumerate(LATENCY_BUCKETS_MS):
+			if (elapsedMs <= bucketLimit):
+				bucketIndx = indx
+				break
+
+		with cls.statsLock:
+			if (endpoint not in cls.endpointStats and len(cls.endpointStats) >= MAX_TRACKED_ENDPOINTS):
+				endpoint = OTHER_ENDPOINT
+			stats = cls.endpointStats.get(endpoint)
+			if (stats is None):
+				stats = {
+					'count': 0,
+					'wallMsTotal': 0.0,
+					'wallMsMax': 0.0,
+					'wallMsHistogram': [0] * (len(LATENCY_BUCKETS_MS) + 1),
+					'datastoreCalls': {},
+					'memcacheHits': 0,
+					'memcacheMisses': 0,
+					'requestBytes': 0,
+					'responseBytes': 0
+				}
+				cls.endpointStats[endpoint] = stats
+			stats['count'] += 1
+			stats['wallMsTotal'] += elapsedMs
+			stats['wallMsMax'] = max(stats['wallMsMax'], elapsedMs)
+			stats['wallMsHistogram'][bucketIndx] += 1
+			for callName, (numCalls, callMs) in record.datastoreCalls.iteritems():
+				callStats = stats['datastoreCalls'].setdefault(callName, [0, 0.0])
+				callStats[0] += numCalls
+				callStats[1] += callMs
+			stats['memcacheHits'] += record.memcacheHits
+			stats['memcacheMisses'] += record.memcacheMisses
+			stats['requestBytes'] += requestBytes
+			stats['responseBytes'] += responseBytes
+
+	"""
+	Returns a dict with the id of the instance, the sample rate, the upper bounds of the histogram buckets and
+	for every endpoint: the number of recorded requests, total and max wall time (ms), the wall time histogram,
+	[number of calls, total ms] for every datastore call, memcache hits and misses and total request and response bytes
+	"""
+	@classmethod
+	def getStats(cls):
+		with cls.statsLock:
+			endpoints = {}
+			for endpoint, stats in cls.endpointStats.iteritems():
+				endpointCopy = dict(stats)
+				endpointCopy['wallMsHistogram'] = list(stats['wallMsHistogram'])
+				endpointCopy['datastoreCalls'] = dict((callName, list(callStats)) for callName, callStats in stats['datastoreCalls'].iteritems())
+				endpoints[endpoint] = endpointCopy
+		return {
+			'instanceId': os.environ.get('INSTANCE_ID'),
+			'sampleRate': INSTRUMENTATION_SAMPLE_RATE,
+			'latencyBucketsMs': LATENCY_BUCKETS_MS,
+			'endpoints': endpoints
+		}
+
+	@classmethod
+	def clearStats(cls):
+		with cls.statsLock:
+			cls.endpointStats = {}
+
+
+"""
+apiproxy hooks, they only do anything while the calling thread is recording
+"""
+def beforeApiCall(service, call, request, response):
+	record = Instrumentation.getCurrentRecord()
+	if (record is not None and service == 'datastore_v3'):
+		record.pendingCalls[id(request)] = time.time()
+
+def afterApiCall(service, call, request, response):
+	record = Instrumentation.getCurrentRecord()
+	if (record is None):
+		return
+	if (service == 'datastore_v3'):
+		#the call was started while recording into the innermost record, so that is where its start time is
+		startTime = record.pendingCalls.pop(id(request), None)
+		while (record is not None):
+			callStats = record.datastoreCalls.setdefault(call, [0, 0.0])
+			callStats[0] += 1
+			if (startTime is not None):
+				callStats[1] += (time.time() - startTime) * 1000.0
+			record = record.parent
+	elif (service == 'memcache' and call == 'Get'):
+		numHits = response.item_size()
+		while (record is not None):
+			record.memcacheHits += numHits
+			record.memcacheMisses += request.key_size() - numHits
+			record = record.parent
@@ -0,0 +1,56 @@
+import collections
+import threading
+import time
+
+
+"""
+Least recently used cache held in the memory of a single instance
+Entries are dropped once there are more than maxSize of them or, if a ttl (in seconds) is given, once they are older than that
+Keeps count of its hits and misses
+"""
+class LocalCache(object):
+	def __init__(self, maxSize, ttl = None):
+		self.maxSize = maxSize
+		self.ttl = ttl
+		self.entries = collections.OrderedDict()
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+	"""
+	Returns the value cached for the key or None if there isn't one (or it expired)
+	"""
+	def get(self, key):
+		with self.lock:
+			entry = self.entries.pop(key, None)
+			if (entry is None or (self.ttl is not None and entry[1] < time.time())):
+				self.misses += 1
+				return None
+			#put it back at the end since it was just used
+			self.entries[key] = entry
+			self.hits += 1
+			return entry[0]
+
+	def set(self, key, value):
+		expires = None
+		if (self.ttl is not None):
+			expires = time.time() + self.ttl
+		with self.lock:
+			self.entries.pop(key, None)
+			self.entries[key] = [value, expires]
+			while (len(self.entries) > self.maxSize):
+				self.entries.popitem(last = False)
+
+	def delete(self, key):
+		with self.lock:
+			self.entries.pop(key, None)
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+
+	"""
+	Returns a dict with the number of hits, misses and entries of the cache
+	"""
+	def getStats(self):
+		return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
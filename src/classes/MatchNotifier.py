@@ -0,0 +1,81 @@
+from google.appengine.api import memcache
+
+from Utilities import *
+
+"""
+Prefix of the memcache keys each user's recent match events are kept under, how long they are kept (seconds)
+and the most that are kept per user
+"""
+MATCH_EVENTS_MEMCACHE_PREFIX = 'match-events:'
+MATCH_EVENTS_TTL = 3600
+MAX_MATCH_EVENTS_PER_USER = 20
+
+
+"""
+Stand-in for a push service that keeps the pushed batches in memory so notifications can be checked offline
+"""
+class LocalPushSink(object):
+	def __init__(self):
+		self.pushedBatches = []
+
+	def push(self, keyStringToEvents):
+		self.pushedBatches.append(keyStringToEvents)
+
+
+"""
+Tells users about their new matched meals
+Every match becomes an event (a dict of the meal's key, type and start time) for each person in the meal. The events are kept
+in memcache for the long-polling notification endpoint (see send_notification.py) and handed to the pusher, if there is one,
+in one batch per call. The user's upcoming meals generation is what tells a client something changed, the meal keys in the
+events let it get the new meals by key (strongly consistent) instead of querying for them while the query might not return them yet
+"""
+class MatchNotifier(object):
+	#when set, every batch of events is also pushed with pusher.push(dict of urlsafe user key -> list of events)
+	#no push service is wired up in production so clients only learn about matches by polling
+	pusher = None
+
+	"""
+	Sends all of the following events to the given pusher (e.g. a LocalPushSink) or stops pushing them if None
+	Returns: void
+	"""
+	@classmethod
+	def usePusher(cls, pusher):
+		cls.pusher = pusher
+
+	"""
+	Records a match event for everyone in each of the new meals and pushes them all in one batch
+	Returns: void
+	"""
+	@classmethod
+	def notifyMatches(cls, newMeals):
+		keyStringToEvents = {}
+		for theMeal in newMeals:
+			matchEvent = {
+				'mealKey': theMeal.key.urlsafe(),
+				'mealType': theMeal.mealType,
+				'startTime': dateTimeOjectToString(theMeal.startTime)
+			}
+			for personKey in theMeal.people:
+				keyStringToEvents.setdefault(personKey.urlsafe(), []).append(matchEvent)
+		if (not keyStringToEvents):
+			return
+
+		storedEvents = memcache.get_multi(keyStringToEvents.keys(), key_prefix = MATCH_EVENTS_MEMCACHE_PREFIX)
+		eventsToStore = {}
+		for keyString, matchEvents in keyStringToEvents.iteritems():
+			eventsToStore[keyString] = (storedEvents.get(keyString, []) + matchEvents)[-MAX_MATCH_EVENTS_PER_USER:]
+		memcache.set_multi(eventsToStore, time = MATCH_EVENTS_TTL, key_prefix = MATCH_EVENTS_MEMCACHE_PREFIX)
+
+		if (cls.pusher is not None):
+			cls.pusher.push(keyStringToEvents)
+
+	"""
+	Gets the recent match events of the user (oldest first)
+	Returns a list of event dicts
+	"""
+	@classmethod
+	def getMatchEvents(cls, userKey):
+		matchEvents = memcache.get(MATCH_EVENTS_MEMCACHE_PREFIX + userKey.urlsafe())
+		if (matchEvents is None):
+			return []
+		return matchEvents
@@ -0,0 +1,416 @@
+"""
+This file contains the engine used by the meal matching cron to pair up unmatched meals
+
+Meals can only ever be matched with meals of the same meal type and the same number of people
+so the meals are first split into buckets by (mealType, numPeople). Each bucket is then matched
+with a single sweep over the meals ordered by startRange. Meals that have already been matched are
+skipped using a "next meal still available" pointer structure (union find with path compression)
+so the whole pass is O(n log n) for the sort and close to linear for the sweep itself
+Nothing in here touches the datastore so the engine can be run and profiled outside of App Engine
+"""
+import collections
+import datetime
+import heapq
+import time
+
+
+"""
+Plain record describing an unmatched meal (creator can be anything comparable such as a user key)
+The engine only reads these attributes so UnMatchedMeal entities can be passed in directly as well
+"""
+MealRecord = collections.namedtuple('MealRecord', ['mealType', 'startRange', 'endRange', 'numPeople', 'creator'])
+
+
+"""
+Values tagging what each result yielded by matchMealStream is
+"""
+MATCHED_MEALS = 'matched'
+EXPIRED_MEAL = 'expired'
+
+"""
+How many meals at the front of a bucket have to have been dealt with before they are dropped from memory
+"""
+BUCKET_COMPACT_SIZE = 1024
+
+"""
+Limits for maximumMatchMeals: the number of seconds it may spend improving on its fast matching and the largest group
+of overlapping meals it will try to improve (the exact matching is cubic in the number of meals)
+"""
+MAXIMUM_MATCHING_TIME_BUDGET = 5
+EXACT_MATCHING_COMPONENT_LIMIT = 400
+
+
+"""
+Matches all of the given unmatched meals (MealRecords or any objects with the same attributes)
+Meals are matched first-fit: going through the meals in order of startRange, each meal is grouped
+with the earliest later starting meals that are compatible with it. Meals are compatible if they
+have the same meal type and number of people, were created by different people and all of their
+time ranges overlap for at least minimumMealLength minutes
+Returns [list of groups of meals that should become a meal, list of meals that have expired]
+"""
+def matchMeals(unMatchedMeals, currentTime, minimumMealLength):
+	mealGroups = []
+	mealsToExpire = []
+	#sorted is stable so meals that start at the same time stay in the order they were given in
+	orderedMeals = sorted(unMatchedMeals, key = lambda meal: meal.startRange)
+	for resultType, result in matchMealStream(orderedMeals, currentTime, minimumMealLength):
+		if (resultType == MATCHED_MEALS):
+			mealGroups.append(result)
+		else:
+			mealsToExpire.append(result)
+	return [mealGroups, mealsToExpire]
+
+"""
+Matches a stream of unmatched meals that MUST already be ordered by startRange (e.g. pages of a query)
+Results are yielded as soon as they are known as [MATCHED_MEALS, list of meals] or [EXPIRED_MEAL, meal]
+A meal is only held onto while a meal starting after it could still overlap with it so memory grows with the
+number of overlapping requests rather than the total number of requests
+"""
+def matchMealStream(orderedUnMatchedMeals, currentTime, minimumMealLength):
+	minimumLength = datetime.timedelta(minutes = minimumMealLength)
+	buckets = {}
+	lastStartRange = None
+	for theMeal in orderedUnMatchedMeals:
+		if (lastStartRange is not None and theMeal.startRange < lastStartRange):
+			raise ValueError("Meals must be ordered by startRange to be matched as a stream")
+		lastStartRange = theMeal.startRange
+
+		#if the meal has already "happened" but never got matched it should be deleted
+		if (theMeal.endRange < currentTime):
+			yield [EXPIRED_MEAL, theMeal]
+			continue
+
+		bucketKey = (theMeal.mealType, theMeal.numPeople)
+		bucket = buckets.get(bucketKey)
+		if (bucket is None):
+			bucket = buckets[bucketKey] = MealBucket(minimumLength)
+		#no meal in the bucket can match with anything starting after this one so finish off the ones that are done
+		for mealGroup in bucket.matchMealsEndingBefore(theMeal.startRange):
+			yield [MATCHED_MEALS, mealGroup]
+		bucket.addMeal(theMeal)
+
+	#there are no more meals coming so everything left can be finished off
+	for bucket in buckets.itervalues():
+		for mealGroup in bucket.matchMealsEndingBefore(None):
+			yield [MATCHED_MEALS, mealGroup]
+
+
+"""
+The meals of a single bucket (all the meals have the same meal type and number of people) in order of startRange
+that haven't been dealt with yet. Meals that have already been matched are skipped using nextAvailable, where
+nextAvailable[indx] points towards the first meal at or after indx that hasn't been matched yet
+(the last entry is a sentinel standing for "no more meals")
+"""
+class MealBucket(object):
+	def __init__(self, minimumLength):
+		self.minimumLength = minimumLength
+		self.meals = []
+		self.nextAvailable = [0]
+		#index of the next meal that has to be matched
+		self.firstIndx = 0
+
+	def addMeal(self, theMeal):
+		#the old sentinel becomes the new meal (which is available) and a new sentinel is added after it
+		self.meals.append(theMeal)
+		self.nextAvailable.append(len(self.meals))
+
+	def findAvailable(self, indx):
+		nextAvailable = self.nextAvailable
+		root = indx
+		while (nextAvailable[root] != root):
+			root = nextAvailable[root]
+		#compress the path so later lookups jump straight to the available meal
+		while (nextAvailable[indx] != root):
+			nextIndx = nextAvailable[indx]
+			nextAvailable[indx] = root
+			indx = nextIndx
+		return root
+
+	"""
+	Matches the meals at the front of the bucket whose possible matches have all been added already,
+	i.e. every meal that would have to start before startRange in order to have a long enough meal
+	If startRange is None every meal left in the bucket is matched
+	Returns a list of the groups of meals that were matched
+	"""
+	def matchMealsEndingBefore(self, startRange):
+		meals = self.meals
+		numMeals = len(meals)
+		mealGroups = []
+		indx = self.findAvailable(self.firstIndx)
+		while (indx < numMeals and (startRange is None or meals[indx].endRange - self.minimumLength < startRange)):
+			mealGroup = self.matchMeal(indx)
+			if (mealGroup is not None):
+				mealGroups.append(mealGroup)
+			indx = self.findAvailable(indx + 1)
+		self.firstIndx = indx
+		if (self.firstIndx >= BUCKET_COMPACT_SIZE and self.firstIndx * 2 >= numMeals):
+			self.compact()
+		return mealGroups
+
+	"""
+	Tries to match the meal at indx with the earliest starting available meals after it
+	Returns the list of meals in the group if enough matches were found, otherwise None
+	"""
+	def matchMeal(self, indx):
+		meals = self.meals
+		numMeals = len(meals)
+		theMeal = meals[indx]
+		groupEndRange = theMeal.endRange
+		groupCreators = set([theMeal.creator])
+		matchedIndxs = []
+		searchIndx = self.findAvailable(indx + 1)
+		# continue while we have fewer matched meals than we want, we haven't gone through all meals in the bucket
+		# and we haven't hit the point where any meals after that wont match because their start time is later than
+		# the end time of the group minus the minimum length of a meal
+		while (len(matchedIndxs) + 1 < theMeal.numPeople and searchIndx < numMeals and meals[searchIndx].startRange <= groupEndRange - self.minimumLength):
+			searchMeal = meals[searchIndx]
+			notSameCreator = (searchMeal.creator not in groupCreators)
+			longEnough = (min(groupEndRange, searchMeal.endRange) - self.minimumLength >= searchMeal.startRange)
+			if (notSameCreator and longEnough):
+				matchedIndxs.append(searchIndx)
+				groupCreators.add(searchMeal.creator)
+				groupEndRange = min(groupEndRange, searchMeal.endRange)
+			searchIndx = self.findAvailable(searchIndx + 1)
+
+		# weren't able to find enough matches for the meal so it is skipped :/
+		if (len(matchedIndxs) + 1 < theMeal.numPeople):
+			return None
+		#mark the matched meals as used so no one else can match with them
+		mealGroup = [theMeal]
+		for matchedIndx in matchedIndxs:
+			mealGroup.append(meals[matchedIndx])
+			self.nextAvailable[matchedIndx] = matchedIndx + 1
+		return mealGroup
+
+	"""
+	Drops the meals before firstIndx since they have all been dealt with
+	Every pointer at or after firstIndx points at or after firstIndx so they can just be shifted down
+	"""
+	def compact(self):
+		firstIndx = self.firstIndx
+		self.meals = self.meals[firstIndx:]
+		self.nextAvailable = [pointer - firstIndx for pointer in self.nextAvailable[firstIndx:]]
+		self.firstIndx = 0
+
+
+"""
+Finds the meals a single (new or just edited) meal can be grouped with right away
+The candidates must be ordered by startRange and are taken first-fit in that order as long as the whole group
+stays compatible (same meal type and number of people, different creators, long enough time in common)
+Candidates that have already expired are ignored (the meal itself is never used since it has the same creator)
+Returns the list of meals to group theMeal with if enough were found, otherwise None
+"""
+def findMatchesForMeal(theMeal, orderedCandidateMeals, currentTime, minimumMealLength):
+	minimumLength = datetime.timedelta(minutes = minimumMealLength)
+	groupStartRange = theMeal.startRange
+	groupEndRange = theMeal.endRange
+	groupCreators = set([theMeal.creator])
+	matchedMeals = []
+	for candidateMeal in orderedCandidateMeals:
+		if (len(matchedMeals) + 1 >= theMeal.numPeople):
+			break
+		if (candidateMeal.endRange < currentTime):
+			continue
+		sameKind = (candidateMeal.mealType == theMeal.mealType and candidateMeal.numPeople == theMeal.numPeople)
+		notSameCreator = (candidateMeal.creator not in groupCreators)
+		newStartRange = max(groupStartRange, candidateMeal.startRange)
+		newEndRange = min(groupEndRange, candidateMeal.endRange)
+		if (sameKind and notSameCreator and newStartRange <= newEndRange - minimumLength):
+			matchedMeals.append(candidateMeal)
+			groupCreators.add(candidateMeal.creator)
+			groupStartRange = newStartRange
+			groupEndRange = newEndRange
+
+	if (len(matchedMeals) + 1 < theMeal.numPeople):
+		return None
+	return matchedMeals
+
+
+"""
+Alternative to matchMeals that matches as many meals as possible instead of going first-fit
+Meals for two people are matched with a maximum matching: two meals are compatible when [startRange, endRange - minimumMealLength]
+of both overlap so (ignoring creators) the compatible meals form an interval graph, which is matched exactly by repeatedly matching
+the meal whose window closes first with the compatible meal whose window closes next. When a user has several overlapping meals
+that matching might not be the best one, so groups of overlapping meals of up to EXACT_MATCHING_COMPONENT_LIMIT meals are then
+improved with augmenting paths (Edmonds' blossom algorithm) until timeBudget seconds have been used.
+Meals for more than two people are still matched first-fit
+Returns [list of groups of meals that should become a meal, list of meals that have expired]
+"""
+def maximumMatchMeals(unMatchedMeals, currentTime, minimumMealLength, timeBudget = MAXIMUM_MATCHING_TIME_BUDGET):
+	stopTime = time.time() + timeBudget
+	minimumLength = datetime.timedelta(minutes = minimumMealLength)
+	mealsToExpire = []
+	buckets = {}
+	for theMeal in sorted(unMatchedMeals, key = lambda meal: meal.startRange):
+		if (theMeal.endRange < currentTime):
+			mealsToExpire.append(theMeal)
+		else:
+			buckets.setdefault((theMeal.mealType, theMeal.numPeople), []).append(theMeal)
+
+	mealGroups = []
+	for (mealType, numPeople), bucketMeals in buckets.iteritems():
+		if (numPeople == 2):
+			mealGroups.extend(maximumMatchPairs(bucketMeals, minimumLength, stopTime))
+		else:
+			mealGroups.extend(matchMeals(bucketMeals, currentTime, minimumMealLength)[0])
+	mealGroups.sort(key = lambda mealGroup: mealGroup[0].startRange)
+	return [mealGroups, mealsToExpire]
+
+"""
+Maximum matching of the meals (all for two people with the same meal type, ordered by startRange) in a bucket
+Returns a list of the matched [earlier starting meal, later starting meal] pairs
+"""
+def maximumMatchPairs(orderedMeals, minimumLength, stopTime):
+	#split the meals into groups where each meal overlaps with at least one other, nothing overlaps between groups
+	components = []
+	component = []
+	componentEnd = None
+	for theMeal in orderedMeals:
+		latestStart = theMeal.endRange - minimumLength
+		if (latestStart < theMeal.startRange):
+			continue
+		if (component and theMeal.startRange > componentEnd):
+			components.append(component)
+			component = []
+		if (not component or latestStart > componentEnd):
+			componentEnd = latestStart
+		component.append(theMeal)
+	if (component):
+		components.append(component)
+
+	mealPairs = []
+	for component in components:
+		partners = matchByClosingTime(component, minimumLength)
+		numUnMatched = partners.count(-1)
+		#if everyone (but one) has a partner it can't get any better
+		if (numUnMatched > 1 and len(component) <= EXACT_MATCHING_COMPONENT_LIMIT and time.time() < stopTime):
+			creators = [theMeal.creator for theMeal in component]
+			if (len(set(creators)) < len(creators)):
+				improveMatching(component, partners, minimumLength, stopTime)
+		for indx, partnerIndx in enumerate(partners):
+			if (indx < partnerIndx):
+				mealPairs.append([component[indx], component[partnerIndx]])
+	return mealPairs
+
+"""
+Matches every meal, in order of when its window to start closes (endRange - minimumLength), with the compatible meal
+that hasn't been matched yet whose window closes next. This is a maximum matching as long as no user has two overlapping meals
+Returns a list where the entry for each meal is the index of its partner or -1 if it wasn't matched
+"""
+def matchByClosingTime(meals, minimumLength):
+	numMeals = len(meals)
+	closingTimes = [theMeal.endRange - minimumLength for theMeal in meals]
+	#meals is ordered by startRange so meals can be made candidates in order as the closing time moves on
+	closingOrder = sorted(range(numMeals), key = lambda indx: closingTimes[indx])
+	partners = [-1] * numMeals
+	candidates = []
+	nextCandidate = 0
+	for indx in closingOrder:
+		while (nextCandidate < numMeals and meals[nextCandidate].startRange <= closingTimes[indx]):
+			heapq.heappush(candidates, (closingTimes[nextCandidate], nextCandidate))
+			nextCandidate += 1
+		if (partners[indx] != -1):
+			continue
+
+		sameCreatorCandidates = []
+		while (candidates):
+			closingTime, candidateIndx = heapq.heappop(candidates)
+			#meals that closed before this one and are still unmatched don't overlap with anything that is left
+			if (candidateIndx == indx or partners[candidateIndx] != -1 or closingTime < closingTimes[indx]):
+				continue
+			if (meals[candidateIndx].creator == meals[indx].creator):
+				sameCreatorCandidates.append((closingTime, candidateIndx))
+				continue
+			partners[indx] = candidateIndx
+			partners[candidateIndx] = indx
+			break
+		for candidate in sameCreatorCandidates:
+			heapq.heappush(candidates, candidate)
+	return partners
+
+"""
+Grows the given matching (partners as returned by matchByClosingTime, changed in place) into a maximum matching by
+searching for augmenting paths from every unmatched meal with Edmonds' blossom algorithm, stopping once stopTime is reached
+"""
+def improveMatching(meals, partners, minimumLength, stopTime):
+	numMeals = len(meals)
+	closingTimes = [theMeal.endRange - minimumLength for theMeal in meals]
+	compatible = [[] for indx in range(numMeals)]
+	for indx in range(numMeals):
+		for otherIndx in range(indx + 1, numMeals):
+			if (meals[otherIndx].startRange > closingTimes[indx]):
+				break
+			if (meals[otherIndx].creator != meals[indx].creator and meals[indx].startRange <= closingTimes[otherIndx]):
+				compatible[indx].append(otherIndx)
+				compatible[otherIndx].append(indx)
+
+	for root in range(numMeals):
+		if (time.time() >= stopTime):
+			return
+		if (partners[root] == -1):
+			endIndx, parents = findAugmentingPath(root, compatible, partners)
+			#flip the matched and unmatched edges along the path
+			while (endIndx != -1):
+				parentIndx = parents[endIndx]
+				nextIndx = partners[parentIndx]
+				partners[endIndx] = parentIndx
+				partners[parentIndx] = endIndx
+				endIndx = nextIndx
+
+"""
+Breadth first search for an augmenting path starting at root, shrinking odd cycles (blossoms) into their base as they are found
+Returns [end of the path or -1 if there is none, parents along the path]
+"""
+def findAugmentingPath(root, compatible, partners):
+	numMeals = len(compatible)
+	used = [False] * numMeals
+	parents = [-1] * numMeals
+	bases = range(numMeals)
+
+	def lowestCommonBase(first, second):
+		seen = [False] * numMeals
+		while (True):
+			first = bases[first]
+			seen[first] = True
+			if (partners[first] == -1):
+				break
+			first = parents[partners[first]]
+		while (True):
+			second = bases[second]
+			if (seen[second]):
+				return second
+			second = parents[partners[second]]
+
+	def markPath(indx, base, child, inBlossom):
+		while (bases[indx] != base):
+			inBlossom[bases[indx]] = True
+			inBlossom[bases[partners[indx]]] = True
+			parents[indx] = child
+			child = partners[indx]
+			indx = parents[partners[indx]]
+
+	used[root] = True
+	queue = collections.deque([root])
+	while (queue):
+		indx = queue.popleft()
+		for otherIndx in compatible[indx]:
+			if (bases[indx] == bases[otherIndx] or partners[indx] == otherIndx):
+				continue
+			if (otherIndx == root or (partners[otherIndx] != -1 and parents[partners[otherIndx]] != -1)):
+				base = lowestCommonBase(indx, otherIndx)
+				inBlossom = [False] * numMeals
+				markPath(indx, base, otherIndx, inBlossom)
+				markPath(otherIndx, base, indx, inBlossom)
+				for blossomIndx in range(numMeals):
+					if (inBlossom[bases[blossomIndx]]):
+						bases[blossomIndx] = base
+						if (not used[blossomIndx]):
+							used[blossomIndx] = True
+							queue.append(blossomIndx)
+			elif (parents[otherIndx] == -1):
+				parents[otherIndx] = indx
+				if (partners[otherIndx] == -1):
+					return [otherIndx, parents]
+				used[partners[otherIndx]] = True
+				queue.append(partners[otherIndx])
+	return [-1, parents]
@@ -0,0 +1,53 @@
+from google.appengine.ext import ndb
+
+from Utilities import *
+
+
+# report of the latest matching run of a school, keyed by the school's id (its email domain)
+# it is a root entity so writing it never contends with the matching transactions on the school's entity group
+class MatchingRunStats(ndb.Model):
+	runTime = ndb.DateTimeProperty(required = True, indexed = False)
+	matchingMode = ndb.StringProperty(indexed = False)
+	#unmatched meals read, skipped because they expired, put into groups by the matcher and left waiting for a match
+	numScanned = ndb.IntegerProperty(default = 0, indexed = False)
+	numExpired = ndb.IntegerProperty(default = 0, indexed = False)
+	numMatched = ndb.IntegerProperty(default = 0, indexed = False)
+	numUnMatched = ndb.IntegerProperty(default = 0, indexed = False)
+	#groups the matcher found and meals that were actually created from them (groups that changed in the meantime are skipped)
+	numGroups = ndb.IntegerProperty(default = 0, indexed = False)
+	numMealsCreated = ndb.IntegerProperty(default = 0, indexed = False)
+	#groups that couldn't be written because their transaction kept failing (their meals are left for the next run)
+	numGroupsFailed = ndb.IntegerProperty(default = 0, indexed = False)
+	#milliseconds spent reading the unmatched meals, matching them and writing the new meals
+	fetchMs = ndb.IntegerProperty(default = 0, indexed = False)
+	matchMs = ndb.IntegerProperty(default = 0, indexed = False)
+	commitMs = ndb.IntegerProperty(default = 0, indexed = False)
+	#datastore calls made during the run, in total and by call name (Get, Put, RunQuery...)
+	numDatastoreCalls = ndb.IntegerProperty(default = 0, indexed = False)
+	datastoreCalls = ndb.JsonProperty(default = {}, indexed = False)
+
+	"""
+	Creates an empty report for a run of the school's matching (it still has to be put)
+	Returns the MatchingRunStats object
+	"""
+	@classmethod
+	def newRunForSchool(cls, schoolKey, runTime, matchingMode):
+		return cls(id = schoolKey.id(), runTime = runTime, matchingMode = matchingMode)
+
+	"""
+	Gets the report of the latest matching run of each of the schools with one get_multi
+	Returns a list of MatchingRunStats objects (schools that were never matched are left out)
+	"""
+	@classmethod
+	def getLatestRunsForSchools(cls, schoolKeyList):
+		runStats = ndb.get_multi([ndb.Key(cls, schoolKey.id()) for schoolKey in schoolKeyList])
+		return [runStat for runStat in runStats if runStat is not None]
+
+	"""
+	Returns the report as a dict that can be turned into JSON
+	"""
+	def toJsonDict(self):
+		reportDict = self.to_dict()
+		reportDict['school'] = self.key.id()
+		reportDict['runTime'] = dateTimeOjectToString(self.runTime)
+		return reportDict
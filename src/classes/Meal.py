@@ -2,10 +2,16 @@ from google.appengine.ext import ndb
 from google.appengine.ext.db import TransactionFailedError
 
 import datetime
+import logging
+import time
 
 from Utilities import *
 from User import User
 from School import School
+from MatchingEngine import findMatchesForMeal
+from UpcomingMealsCache import UpcomingMealsCache
+from MatchNotifier import MatchNotifier
+import OpenMealIndex
 import Ratings
 
 """
@@ -13,6 +19,46 @@ Constant that defines the minimum length in minutes that a meal must be
 """
 MINIMUM_MEAL_LENGTH = 30
 
+"""
+Number of unmatched meals fetched per datastore round trip when streaming all of a school's unmatched meals
+"""
+UNMATCHED_MEAL_PAGE_SIZE = 500
+
+"""
+Maximum number of entities written (new meals plus deleted unmatched meals) in one bulk matching transaction
+and the number of entities sent in each of the parallel put / delete calls made inside it
+"""
+MAX_WRITES_PER_MEAL_TRANSACTION = 500
+MEAL_WRITE_BATCH_SIZE = 100
+
+"""
+When true, unmatched meals are matched as soon as they are created or edited if a partner is already waiting
+(the matching cron then only has to deal with the leftovers and expired meals)
+Only the first INCREMENTAL_MATCH_CANDIDATE_LIMIT possible partners are looked at
+"""
+INCREMENTAL_MATCHING = True
+INCREMENTAL_MATCH_CANDIDATE_LIMIT = 200
+
+"""
+Meals used to be root entities and are now written in their school's entity group. The upcoming meals of a user are also
+looked up among the root meals as long as this is true, it can be turned off once every meal matched before the change has started
+"""
+QUERY_ROOT_MEALS = True
+
+"""
+Expired unmatched meals are deleted EXPIRY_PAGE_SIZE keys at a time with at most MAX_PENDING_EXPIRY_DELETES
+deletes in flight at once. A single run stops fetching after EXPIRY_TIME_BUDGET seconds so it finishes well
+within the request deadline
+"""
+EXPIRY_PAGE_SIZE = 500
+MAX_PENDING_EXPIRY_DELETES = 4
+EXPIRY_TIME_BUDGET = 60
+
+"""
+The only properties of a user's upcoming unmatched meals that are read when listing them (the creator is known from the query)
+"""
+UNMATCHED_MEAL_LIST_PROJECTION = ['mealType', 'startRange', 'endRange', 'numPeople', 'created']
+
 #unmatched meals are made descendants of school so can get all meals with strong consistency...
 #it doesn't matter if getting an indidivuals unmatched meals is only eventually consistent but for matching it does
 class UnMatchedMeal(ndb.Model):
@@ -26,7 +72,8 @@ class UnMatchedMeal(ndb.Model):
 
     """
     Creates a new unmatched meal for the given user in the database
-    Returns [bool of success, meal object or error message]
+    Returns [bool of success, meal object or error message]. The meal object is the new matched Meal if the unmatched meal
+    was matched right away (the unmatched meal has been deleted then) and the new UnMatchedMeal otherwise
     """
     @classmethod
     def createNewUnMatchedMeal(cls, userOb, mealType, startRange, endRange, numPeople = 2):
@@ -67,32 +114,122 @@ class UnMatchedMeal(ndb.Model):
             creator = userOb.key
         )
         unMealOb.put()
+        UpcomingMealsCache.invalidateUsers([userOb.key])
+
+        #if someone is already waiting for a meal like this one, match them up right away
+        #otherwise it is now one of the school's open meals
+        if (INCREMENTAL_MATCHING):
+            newMealOb = Meal.matchUnMatchedMealNow(unMealOb)
+            if (newMealOb is not None):
+                return [True, newMealOb]
+        OpenMealIndex.OpenMealIndex.addUnMatchedMeal(unMealOb)
         return [True, unMealOb]
 
     """
-    Returns a list of meal objects for the given school
-    The list of results is ordered by startTime and broken on ties by createdTime
+    Generator over all of the unmatched meals for the given school ordered by startRange
+    The meals are fetched a page at a time using query cursors so only one page is held in memory at once
     """
     @classmethod
-    def getAllUnmatchedMealsForSchool(cls, schoolKey):
-        return cls.query(ancestor = schoolKey).order(cls.startRange).fetch()
+    def iterUnmatchedMealsForSchool(cls, schoolKey, pageSize = UNMATCHED_MEAL_PAGE_SIZE):
+        query = cls.query(ancestor = schoolKey).order(cls.startRange)
+        cursor = None
+        moreMeals = True
+        while (moreMeals):
+            unMatchedMeals, cursor, moreMeals = query.fetch_page(pageSize, start_cursor = cursor)
+            for unMatchedMeal in unMatchedMeals:
+                yield unMatchedMeal
 
     """
-    Gets all the upcoming meals that have been confirmed for a given user
-    Returns a list of Meal objects ordered by the date they occur
+    Gets the unmatched meals at the same school that could possibly be grouped with the given unmatched meal:
+    same meal type and number of people and starting early enough to overlap for a whole meal
+    The meals starting closest to (before) the latest possible start are fetched first so the limit is used up by the meals
+    most likely to still overlap rather than by the oldest ones (which are often already over but not yet expired)
+    Returns a list of at most limit UnMatchedMeal objects ordered by startRange
+    """
+    @classmethod
+    def getPossibleMatchesForUnMatchedMeal(cls, unMatchedMealObj, limit = INCREMENTAL_MATCH_CANDIDATE_LIMIT):
+        latestStartRange = unMatchedMealObj.endRange - datetime.timedelta(minutes = MINIMUM_MEAL_LENGTH)
+        candidateMeals = cls.query(
+            cls.mealType == unMatchedMealObj.mealType,
+            cls.numPeople == unMatchedMealObj.numPeople,
+            cls.startRange <= latestStartRange,
+            ancestor = unMatchedMealObj.key.parent()
+        ).order(-cls.startRange).fetch(limit)
+        candidateMeals.reverse()
+        return candidateMeals
+
+    """
+    Gets the unmatched meals at the school with the given meal type and number of people (the meals of one of the open meal index's buckets)
+    The latest starting ones are fetched first so when there are more than limit it is the earliest starting ones that are left out
+    Returns a future for a list of at most limit UnMatchedMeal objects ordered by startRange
+    """
+    @classmethod
+    @ndb.tasklet
+    def getUnmatchedMealsForBucketAsync(cls, schoolKey, mealType, numPeople, limit):
+        unMatchedMeals = yield cls.query(cls.mealType == mealType, cls.numPeople == numPeople, ancestor = schoolKey).order(-cls.startRange).fetch_async(limit)
+        unMatchedMeals.reverse()
+        raise ndb.Return(unMatchedMeals)
+
+    """
+    Reads only the properties the meal lists need of the user's unmatched meals (the ones starting at or after startRange if it is given)
+    with a projection query. If the user's schoolKey is given it is an ancestor query so it is strongly consistent
+    Returns a future for a list of at most limit (if given) OpenMealRecords ordered by startRange
     """
     @classmethod
-    def getUpcomingUnMatchedMealsForUser(cls, userKey):
+    @ndb.tasklet
+    def getMealRecordsForUserAsync(cls, userKey, schoolKey = None, startRange = None, limit = None):
+        mealQuery = cls.query(cls.creator == userKey, ancestor = schoolKey)
+        if (startRange is not None):
+            mealQuery = mealQuery.filter(cls.startRange >= startRange)
+        projectedMeals = yield mealQuery.order(cls.startRange).fetch_async(limit, projection = UNMATCHED_MEAL_LIST_PROJECTION)
+        userMeals = [OpenMealIndex.OpenMealRecord(
+            key = theMeal.key,
+            mealType = theMeal.mealType,
+            startRange = theMeal.startRange,
+            endRange = theMeal.endRange,
+            numPeople = theMeal.numPeople,
+            creator = userKey,
+            created = theMeal.created
+        ) for theMeal in projectedMeals]
+        raise ndb.Return(userMeals)
+
+    """
+    Gets all the upcoming unmatched meals for a given user
+    If the user's schoolKey is given the meals come from the user's partition of the school's open meal index (no datastore query)
+    otherwise only the properties the meal lists need are read with a projection query
+    Returns a list of OpenMealRecords ordered by the date they occur
+    """
+    @classmethod
+    def getUpcomingUnMatchedMealsForUser(cls, userKey, schoolKey = None):
+        return cls.getUpcomingUnMatchedMealsForUserAsync(userKey, schoolKey).get_result()
+
+    """
+    Same as getUpcomingUnMatchedMealsForUser but doesn't wait for the index or the query
+    Returns a future for the list of OpenMealRecords
+    """
+    @classmethod
+    @ndb.tasklet
+    def getUpcomingUnMatchedMealsForUserAsync(cls, userKey, schoolKey = None):
         nowTime = datetime.datetime.now();
-        return cls.query(cls.creator == userKey, cls.startRange >= nowTime).order(cls.startRange).fetch()
+        if (schoolKey is not None):
+            userMeals = yield OpenMealIndex.OpenMealIndex.getMealsForUserAsync(schoolKey, userKey, nowTime)
+            if (userMeals is not None):
+                raise ndb.Return(userMeals)
+        userMeals = yield cls.getMealRecordsForUserAsync(userKey, schoolKey, nowTime)
+        raise ndb.Return(userMeals)
 
     """
     Edits the specified details (nonempty arguments) of the unMatchedMeal
-    Returns: [SuccessBoolean, ErrorCode] ErroCode: -4, -3, -2
+    Returns: [SuccessBoolean, ErrorCode or the new matched Meal if the edit got the meal matched right away (None if it didn't)] ErroCode: -6, -4, -3, -2
     """
     @classmethod
     def editUnMatchedMeal(cls, mealKey, mealType = None, startRange = None, endRange = None, numPeople = None):
         mealOb = mealKey.get()
+        #the meal was matched (or deleted) since the client got its key
+        if (mealOb is None):
+            return [False, -6]
+        #the index needs to know which bucket the meal was in before the edit
+        oldRecord = OpenMealIndex.OpenMealIndex.recordForUnMatchedMeal(mealOb)
         # edit meal type if it shoud be and valid meal type
         if (mealType != None):
             if (mealType < 0 or mealType > 3):
@@ -132,15 +269,57 @@ class UnMatchedMeal(ndb.Model):
             mealOb.numPeople = numPeople
             
         mealOb.put()
+        UpcomingMealsCache.invalidateUsers([mealOb.creator])
+        OpenMealIndex.OpenMealIndex.addUnMatchedMeal(mealOb, oldRecord)
+
+        #the edit might have made the meal compatible with someone that is already waiting
+        if (INCREMENTAL_MATCHING):
+            return [True, Meal.matchUnMatchedMealNow(mealOb)]
         return [True, None]
 
+    """
+    Deletes all of the unmatched meals that ended before currentTime and so can never be matched
+    Only the keys are queried and they are deleted in async batches so no meal is ever loaded
+    Stops early once timeBudget seconds have passed so the caller can carry on from the returned cursor
+    Returns [number of unmatched meals deleted, cursor to carry on from or None if there are no more]
+    """
+    @classmethod
+    def expireUnMatchedMeals(cls, currentTime, startCursor = None, timeBudget = EXPIRY_TIME_BUDGET):
+        stopTime = time.time() + timeBudget
+        query = cls.query(cls.endRange < currentTime)
+        numExpired = 0
+        pendingDeletes = []
+        cursor = startCursor
+        moreMeals = True
+        while (moreMeals and time.time() < stopTime):
+            unMatchedMealKeys, cursor, moreMeals = query.fetch_page(EXPIRY_PAGE_SIZE, start_cursor = cursor, keys_only = True)
+            if (unMatchedMealKeys):
+                pendingDeletes.append([unMatchedMealKeys, ndb.delete_multi_async(unMatchedMealKeys)])
+                numExpired += len(unMatchedMealKeys)
+            #don't let too many deletes pile up
+            while (len(pendingDeletes) >= MAX_PENDING_EXPIRY_DELETES):
+                cls.__finishExpiryDelete(*pendingDeletes.pop(0))
+        for unMatchedMealKeys, deleteFutures in pendingDeletes:
+            cls.__finishExpiryDelete(unMatchedMealKeys, deleteFutures)
+
+        if (not moreMeals):
+            return [numExpired, None]
+        return [numExpired, cursor]
+
+    #the open meal index doesn't have to be told, it leaves expired meals out of its partitions by itself
+    @classmethod
+    def __finishExpiryDelete(cls, unMatchedMealKeys, deleteFutures):
+        ndb.Future.wait_all(deleteFutures)
+        for deleteFuture in deleteFutures:
+            deleteFuture.check_success()
+
     """
     Removes the specified unmatched meal from the database
     Returns: void
     """
     @classmethod
     def removeUnMatchedMeal(cls, unMatchedMealKey):
-        unMatchedMealKey.delete()
+        cls.removeUnMatchedMeals([unMatchedMealKey])
 
     """
     Removes the list of specified unmatched meals from the database
@@ -149,7 +328,11 @@ class UnMatchedMeal(ndb.Model):
     @classmethod
     def removeUnMatchedMeals(cls, unMatchedMealKeyList):
         if (unMatchedMealKeyList): #only delete keys if the list is not empty
+            #the creators' upcoming meals (and their partitions of the open meal index) change so need to know who they are
+            unMatchedMealObs = [theMeal for theMeal in ndb.get_multi(unMatchedMealKeyList) if theMeal is not None]
             ndb.delete_multi(unMatchedMealKeyList)
+            UpcomingMealsCache.invalidateUsers([theMeal.creator for theMeal in unMatchedMealObs])
+            OpenMealIndex.OpenMealIndex.removeUnMatchedMeals(unMatchedMealObs)
 
 
 
@@ -162,68 +345,202 @@ class Meal(ndb.Model):
     matchedDate = ndb.DateTimeProperty(auto_now_add = True)
 
     """
-    Creates a new matched meal from the list of unMatchedMeals
+    Creates a new matched meal from the list of unMatchedMeals (any number of people)
     Before creating the meal, it will be validated that the meal should be created
-    and it is possible to create a meal from the two given unmatched meals
-    Also deletes the unmatched meals from which the new meal was created
+    and it is possible to create a meal from the given unmatched meals
+    The meal starts at the beginning of the time that all of the unmatched meals have in common
+    The meal is written and the unmatched meals are deleted in a single transaction
     Returns the created new matched meal if successful or None if it is not
     """
     @classmethod
-    def createNewMeal(cls, firstUnMatchedMealObj, secondUnMatchedMealObj):
-        #figure out which meal starts first
-        earlierMeal = None
-        laterMeal = None
-        if (firstUnMatchedMealObj.startRange <= secondUnMatchedMealObj.startRange):
-            earlierMeal = firstUnMatchedMealObj
-            laterMeal = secondUnMatchedMealObj
-        else:
-            earlierMeal = secondUnMatchedMealObj
-            laterMeal = firstUnMatchedMealObj
-
-        #easiest way to determine timing is to just start the new meal at the beginning of the later meal
-        newStartTime = laterMeal.startRange
-        newPeople = [firstUnMatchedMealObj.creator, secondUnMatchedMealObj.creator]
-
-        #validate the user and make sure that they are actually in good standing with the community
-        for person in newPeople:
-            if (not Ratings.Ratings.userIsInGoodStanding(person)):
-                return None
-
-        # now we want to put the new meal in the database and 
-        mealOb = Meal(
-            mealType = firstUnMatchedMealObj.mealType,
-            startTime = newStartTime,
-            numPeople = len(newPeople),
-            people = newPeople
-        )
+    def createNewMeal(cls, unMatchedMealObjs):
+        #all unmatched meals are in their school's entity group so all of them have to be from the same school
+        schoolKey = unMatchedMealObjs[0].key.parent()
+        if (any(theMeal.key.parent() != schoolKey for theMeal in unMatchedMealObjs)):
+            return None
+        createdMeals = cls.createNewMeals(schoolKey, [unMatchedMealObjs])
+        if (not createdMeals):
+            return None
+        return createdMeals[0]
+
+    """
+    Tries to match the given unmatched meal with unmatched meals that are already waiting at the same school
+    Returns the created new matched meal if a match was found and the meal created, otherwise None
+    """
+    @classmethod
+    def matchUnMatchedMealNow(cls, unMatchedMealObj):
+        candidateMeals = OpenMealIndex.OpenMealIndex.getPossibleMatches(unMatchedMealObj, MINIMUM_MEAL_LENGTH)
+        if (candidateMeals is None):
+            candidateMeals = UnMatchedMeal.getPossibleMatchesForUnMatchedMeal(unMatchedMealObj)
+        matchedMeals = findMatchesForMeal(unMatchedMealObj, candidateMeals, datetime.datetime.now(), MINIMUM_MEAL_LENGTH)
+        if (matchedMeals is None):
+            return None
+        return cls.createNewMeal([unMatchedMealObj] + matchedMeals)
 
+    """
+    Creates a new matched meal for every group of unMatchedMeals in the list (all from the given school) in bulk
+    The groups are split into as few transactions on the school's entity group as possible. In each transaction
+    the unmatched meals are read again so any group containing a meal that has been matched, deleted or edited since
+    it was read is skipped, which guarantees an unmatched meal never ends up in two meals
+    Also deletes the unmatched meals from which the new meals were created
+    A transaction that keeps failing (the school's entity group is also written by every new unmatched meal and incremental match)
+    is split in half and retried, down to one group per transaction. If a failedGroups list is given the groups that still
+    couldn't be written are added to it (they stay unmatched so the next run picks them up again)
+    Returns a list of the created new matched meals
+    """
+    @classmethod
+    def createNewMeals(cls, schoolKey, unMatchedMealGroups, failedGroups = None):
+        unMatchedMealGroups = [theMeals for theMeals in unMatchedMealGroups if cls.__canBeGrouped(theMeals)]
+        #validate the users and make sure that they are actually in good standing with the community
+        usersNotInGoodStanding = Ratings.Ratings.getUsersNotInGoodStanding([theMeal.creator for theMeals in unMatchedMealGroups for theMeal in theMeals])
+        unMatchedMealGroups = [theMeals for theMeals in unMatchedMealGroups if not any(theMeal.creator in usersNotInGoodStanding for theMeal in theMeals)]
+
+        createdMeals = []
+        transactionGroups = []
+        numWrites = 0
+        for theMeals in unMatchedMealGroups:
+            #one new meal plus the deletion of each of the unmatched meals
+            groupWrites = len(theMeals) + 1
+            if (transactionGroups and numWrites + groupWrites > MAX_WRITES_PER_MEAL_TRANSACTION):
+                createdMeals.extend(cls.__tryToInsertNewMeals(schoolKey, transactionGroups, failedGroups))
+                transactionGroups = []
+                numWrites = 0
+            transactionGroups.append(theMeals)
+            numWrites += groupWrites
+        if (transactionGroups):
+            createdMeals.extend(cls.__tryToInsertNewMeals(schoolKey, transactionGroups, failedGroups))
+        return createdMeals
+
+    @classmethod
+    def __tryToInsertNewMeals(cls, schoolKey, unMatchedMealGroups, failedGroups = None):
         try:
-            cls.__insertNewMeal(mealOb, firstUnMatchedMealObj, secondUnMatchedMealObj)
+            newMeals, unMatchedMealKeysDeleted = cls.__insertNewMeals(schoolKey, unMatchedMealGroups)
         except TransactionFailedError:
-            return None
+            #a smaller transaction is less likely to collide with the other writes to the school
+            if (len(unMatchedMealGroups) > 1):
+                half = len(unMatchedMealGroups) // 2
+                return (cls.__tryToInsertNewMeals(schoolKey, unMatchedMealGroups[:half], failedGroups) +
+                    cls.__tryToInsertNewMeals(schoolKey, unMatchedMealGroups[half:], failedGroups))
+            logging.warning("Couldn't create a meal for " + str(len(unMatchedMealGroups[0])) + " unmatched meals at " + str(schoolKey.id()) + ", the transaction kept failing")
+            if (failedGroups is not None):
+                failedGroups.extend(unMatchedMealGroups)
+            return []
+        UpcomingMealsCache.invalidateUsers([personKey for theMeal in newMeals for personKey in theMeal.people])
+        MatchNotifier.notifyMatches(newMeals)
+        unMatchedMealKeysDeleted = set(unMatchedMealKeysDeleted)
+        OpenMealIndex.OpenMealIndex.removeUnMatchedMeals([theMeal for theMeals in unMatchedMealGroups for theMeal in theMeals if theMeal.key in unMatchedMealKeysDeleted])
+        return newMeals
+
+    """
+    THIS METHOD SHOULD ONLY BE ACCESSED THROUGH THE createNewMeals method!!
+    Everything is in the school's entity group so a single group transaction covers all of the writes
+    and the puts and deletes are all sent in parallel batches
+    """
+    @classmethod
+    @ndb.transactional
+    def __insertNewMeals(cls, schoolKey, unMatchedMealGroups):
+        unMatchedMealKeys = [theMeal.key for theMeals in unMatchedMealGroups for theMeal in theMeals]
+        currentUnMatchedMeals = dict(zip(unMatchedMealKeys, ndb.get_multi(unMatchedMealKeys)))
+
+        newMeals = []
+        unMatchedMealKeysToDelete = []
+        for theMeals in unMatchedMealGroups:
+            if (not all(cls.__isUnchanged(theMeal, currentUnMatchedMeals[theMeal.key]) for theMeal in theMeals)):
+                continue
+            newMeals.append(cls.__buildMealFromUnMatchedMeals(theMeals, schoolKey))
+            unMatchedMealKeysToDelete.extend([theMeal.key for theMeal in theMeals])
+
+        futures = []
+        for indx in range(0, len(newMeals), MEAL_WRITE_BATCH_SIZE):
+            futures.extend(ndb.put_multi_async(newMeals[indx:indx + MEAL_WRITE_BATCH_SIZE]))
+        for indx in range(0, len(unMatchedMealKeysToDelete), MEAL_WRITE_BATCH_SIZE):
+            futures.extend(ndb.delete_multi_async(unMatchedMealKeysToDelete[indx:indx + MEAL_WRITE_BATCH_SIZE]))
+        ndb.Future.wait_all(futures)
+        #make sure any failed write raises so the whole transaction is rolled back
+        for future in futures:
+            future.check_success()
+        return [newMeals, unMatchedMealKeysToDelete]
+
+    """
+    Determines if a group of unmatched meals can be made into a meal: there are at least two of them, they are
+    all for the same meal type and number of people (the size of the group), they were created by different people
+    and the time all of them have in common is at least as long as the minimum meal length
+    """
+    @classmethod
+    def __canBeGrouped(cls, unMatchedMealObjs):
+        if (len(unMatchedMealObjs) < 2):
+            return False
+        firstMeal = unMatchedMealObjs[0]
+        for theMeal in unMatchedMealObjs:
+            if (theMeal.mealType != firstMeal.mealType or theMeal.numPeople != len(unMatchedMealObjs)):
+                return False
+        if (len(set(theMeal.creator for theMeal in unMatchedMealObjs)) != len(unMatchedMealObjs)):
+            return False
+        latestStart = max(theMeal.startRange for theMeal in unMatchedMealObjs)
+        earliestEnd = min(theMeal.endRange for theMeal in unMatchedMealObjs)
+        return (latestStart <= earliestEnd - datetime.timedelta(minutes = MINIMUM_MEAL_LENGTH))
 
-        return mealOb
+    """
+    Determines if an unmatched meal that was read earlier still exists and hasn't been edited since
+    """
+    @classmethod
+    def __isUnchanged(cls, unMatchedMealObj, currentUnMatchedMealObj):
+        if (currentUnMatchedMealObj is None):
+            return False
+        return (unMatchedMealObj.mealType == currentUnMatchedMealObj.mealType and
+            unMatchedMealObj.startRange == currentUnMatchedMealObj.startRange and
+            unMatchedMealObj.endRange == currentUnMatchedMealObj.endRange and
+            unMatchedMealObj.numPeople == currentUnMatchedMealObj.numPeople)
 
     """
-    THIS METHOD SHOULD ONLY BE ACCESSED THROUGH THE createNewMeal method!!
-    This method is here only so that the new meal and old meals
-    are all inserted and deleted at once in a transaction so that if one fails they all fail
+    Builds (but doesn't put) the meal for a group of unmatched meals
+    The meal starts at the beginning of the latest starting unmatched meal (the start of the time they all have in common)
     """
     @classmethod
-    @ndb.transactional(xg = True)
-    def __insertNewMeal(cls, newMealObj, firstUnMatchedMealObj, secondUnMatchedMealObj):
-        newMealObj.put()
-        UnMatchedMeal.removeUnMatchedMeals([firstUnMatchedMealObj.key, secondUnMatchedMealObj.key])
+    def __buildMealFromUnMatchedMeals(cls, unMatchedMealObjs, parentKey = None):
+        return Meal(
+            parent = parentKey,
+            mealType = unMatchedMealObjs[0].mealType,
+            startTime = max(theMeal.startRange for theMeal in unMatchedMealObjs),
+            numPeople = len(unMatchedMealObjs),
+            people = [theMeal.creator for theMeal in unMatchedMealObjs]
+        )
 
 
     """
     Gets all the upcoming meals that have been confirmed for a given user
+    If the user's schoolKey is given it is an ancestor query (meals are written in their school's entity group)
+    so it is strongly consistent and a meal that was just matched is always in it
+    While QUERY_ROOT_MEALS is true the meals matched before meals were written in their school's entity group (root entities
+    the ancestor query can't see) are read with a second query in parallel and merged in. They were all matched long ago so
+    that query being eventually consistent doesn't matter
     Returns a list of Meal objects ordered by the date they occur
     """
     @classmethod
-    def getUpcomingMealsForUser(cls, userKey):
+    def getUpcomingMealsForUser(cls, userKey, schoolKey = None):
+        return cls.getUpcomingMealsForUserAsync(userKey, schoolKey).get_result()
+
+    """
+    Same as getUpcomingMealsForUser but doesn't wait for the queries
+    Returns a future for the list of Meal objects
+    """
+    @classmethod
+    @ndb.tasklet
+    def getUpcomingMealsForUserAsync(cls, userKey, schoolKey = None):
         nowTime = datetime.datetime.now();
-        return cls.query(cls.people == userKey, cls.startTime >= nowTime).order(cls.startTime).fetch()
+        if (schoolKey is None):
+            upcomingMeals = yield cls.query(cls.people == userKey, cls.startTime >= nowTime).order(cls.startTime).fetch_async()
+            raise ndb.Return(upcomingMeals)
+        if (not QUERY_ROOT_MEALS):
+            upcomingMeals = yield cls.query(cls.people == userKey, cls.startTime >= nowTime, ancestor = schoolKey).order(cls.startTime).fetch_async()
+            raise ndb.Return(upcomingMeals)
+
+        schoolMeals, allMeals = yield (cls.query(cls.people == userKey, cls.startTime >= nowTime, ancestor = schoolKey).order(cls.startTime).fetch_async(),
+            cls.query(cls.people == userKey, cls.startTime >= nowTime).order(cls.startTime).fetch_async())
+        #the school's meals are taken from the ancestor query only, the other query might not have the latest ones yet
+        upcomingMeals = schoolMeals + [theMeal for theMeal in allMeals if theMeal.key.parent() is None]
+        upcomingMeals.sort(key = lambda theMeal: theMeal.startTime)
+        raise ndb.Return(upcomingMeals)
 
     @classmethod
     def getUpcomingMealsForUserInRange(cls, userKey, startRangeDateOb, endRangeDateOb):
@@ -235,16 +552,19 @@ class Meal(ndb.Model):
     """
     @classmethod
     def removeMeal(cls, mealKey):
-        mealKey.delete()
+        cls.removeMeals([mealKey])
 
     """
-    Removes the list of specified unmatched meals from the database
+    Removes the list of specified matched meals from the database
     Returns: void
     """
     @classmethod
     def removeMeals(cls, mealKeyList):
         if (mealKeyList): #only delete keys if the list is not empty
+            #the upcoming meals of everyone in the meals change so need to know who they are
+            mealObs = [theMeal for theMeal in ndb.get_multi(mealKeyList) if theMeal is not None]
             ndb.delete_multi(mealKeyList)
+            UpcomingMealsCache.invalidateUsers([personKey for theMeal in mealObs for personKey in theMeal.people])
 
 
 
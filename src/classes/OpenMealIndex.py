@@ -0,0 +1,236 @@
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+import collections
+import datetime
+import threading
+import time
+
+from LocalCache import LocalCache
+import Meal
+
+"""
+Compact copy of an UnMatchedMeal kept in the index. It has the same attributes as the entity that the matching
+engine and the unmatched meal messages use so it can be used in place of the entity
+"""
+OpenMealRecord = collections.namedtuple('OpenMealRecord', ['key', 'mealType', 'startRange', 'endRange', 'numPeople', 'creator', 'created'])
+
+"""
+The index of a school is split into partitions that are cached and versioned separately: one per (mealType, numPeople)
+bucket, which matching reads, and one per user with the meals they created, which the meal lists read. A write only
+touches the partitions of the meals it changes so the rest of the school's index stays valid on every instance
+Every partition is held in instance memory and in memcache as [version, list of OpenMealRecords ordered by startRange]
+The version stamp is a memcache counter (started from the clock) that every write to the partition increments, so an instance
+can tell its copy is stale when the counter no longer matches and reload just that partition from the datastore
+"""
+INDEX_MEMCACHE_PREFIX = 'openmealindex:'
+VERSION_MEMCACHE_PREFIX = 'openmealindex-version:'
+
+"""
+A partition with more meals than its maximum isn't indexed, lookups in it go to the datastore instead. That bounds both
+the cost of loading a partition and the size of its copies. The marker of a partition that was too big is kept in memcache
+for OVERSIZED_PARTITION_TTL seconds before the partition is loaded again to see whether it has shrunk
+"""
+MAX_OPEN_MEALS_PER_BUCKET = 1000
+MAX_OPEN_MEALS_PER_USER = 50
+OVERSIZED_PARTITION_TTL = 600
+
+"""
+Number of bucket and user partitions each instance keeps in memory
+"""
+INSTANCE_BUCKET_CACHE_SIZE = 50
+INSTANCE_USER_CACHE_SIZE = 1000
+
+
+class OpenMealIndex(object):
+	#partition key -> [version, records] of the partitions this instance has looked at most recently
+	bucketCache = LocalCache(INSTANCE_BUCKET_CACHE_SIZE)
+	userCache = LocalCache(INSTANCE_USER_CACHE_SIZE)
+	instanceLock = threading.Lock()
+
+	"""
+	Gets the open meals at the school that could be grouped with the given unmatched meal: same meal type and
+	number of people and starting early enough to overlap for a whole meal
+	Returns a list of OpenMealRecords ordered by startRange or None if the index can't be used right now
+	"""
+	@classmethod
+	def getPossibleMatches(cls, unMatchedMealObj, minimumMealLength):
+		schoolKey = unMatchedMealObj.key.parent()
+		mealType = unMatchedMealObj.mealType
+		numPeople = unMatchedMealObj.numPeople
+		bucket = cls.__getPartitionAsync(cls.__bucketPartitionKey(schoolKey, mealType, numPeople), cls.bucketCache, MAX_OPEN_MEALS_PER_BUCKET,
+			lambda limit: cls.__loadBucketAsync(schoolKey, mealType, numPeople, limit)).get_result()
+		if (bucket is None):
+			return None
+		latestStartRange = unMatchedMealObj.endRange - datetime.timedelta(minutes = minimumMealLength)
+		return [record for record in bucket if record.startRange <= latestStartRange]
+
+	"""
+	Gets the open meals at the school that were created by the given user and start at or after startRange
+	Nothing blocks (memcache is read with async calls) so other reads started in the same request keep going while it runs
+	Returns a future for a list of OpenMealRecords ordered by startRange or None if the index can't be used right now
+	"""
+	@classmethod
+	@ndb.tasklet
+	def getMealsForUserAsync(cls, schoolKey, userKey, startRange):
+		userMeals = yield cls.__getPartitionAsync(cls.__userPartitionKey(schoolKey, userKey), cls.userCache, MAX_OPEN_MEALS_PER_USER,
+			lambda limit: Meal.UnMatchedMeal.getMealRecordsForUserAsync(userKey, schoolKey, limit = limit))
+		if (userMeals is None):
+			raise ndb.Return(None)
+		raise ndb.Return([record for record in userMeals if record.startRange >= startRange])
+
+	"""
+	Adds (or replaces if it is already there) the given unmatched meal in its school's index
+	oldRecord is the meal's record from before it was edited, if it was, so it can be taken out of its old bucket
+	Returns: void
+	"""
+	@classmethod
+	def addUnMatchedMeal(cls, unMatchedMealObj, oldRecord = None):
+		schoolKey = unMatchedMealObj.key.parent()
+		record = cls.recordForUnMatchedMeal(unMatchedMealObj)
+		if (oldRecord is not None and (oldRecord.mealType, oldRecord.numPeople) != (record.mealType, record.numPeople)):
+			cls.__applyChange(cls.__bucketPartitionKey(schoolKey, oldRecord.mealType, oldRecord.numPeople), cls.bucketCache, MAX_OPEN_MEALS_PER_BUCKET, [record.key], [])
+		cls.__applyChange(cls.__bucketPartitionKey(schoolKey, record.mealType, record.numPeople), cls.bucketCache, MAX_OPEN_MEALS_PER_BUCKET, [record.key], [record])
+		cls.__applyChange(cls.__userPartitionKey(schoolKey, record.creator), cls.userCache, MAX_OPEN_MEALS_PER_USER, [record.key], [record])
+
+	"""
+	Removes the given unmatched meals (or their OpenMealRecords, they can be from any schools) from the index
+	Expired meals don't have to be removed, they are left out of the partitions whenever they change
+	Returns: void
+	"""
+	@classmethod
+	def removeUnMatchedMeals(cls, unMatchedMealObjs):
+		bucketKeys = {}
+		userKeys = {}
+		for theMeal in unMatchedMealObjs:
+			schoolKey = theMeal.key.parent()
+			bucketKeys.setdefault(cls.__bucketPartitionKey(schoolKey, theMeal.mealType, theMeal.numPeople), []).append(theMeal.key)
+			userKeys.setdefault(cls.__userPartitionKey(schoolKey, theMeal.creator), []).append(theMeal.key)
+		for partitionKey, mealKeys in bucketKeys.iteritems():
+			cls.__applyChange(partitionKey, cls.bucketCache, MAX_OPEN_MEALS_PER_BUCKET, mealKeys, [])
+		for partitionKey, mealKeys in userKeys.iteritems():
+			cls.__applyChange(partitionKey, cls.userCache, MAX_OPEN_MEALS_PER_USER, mealKeys, [])
+
+	@classmethod
+	def recordForUnMatchedMeal(cls, unMatchedMealObj):
+		return OpenMealRecord(
+			key = unMatchedMealObj.key,
+			mealType = unMatchedMealObj.mealType,
+			startRange = unMatchedMealObj.startRange,
+			endRange = unMatchedMealObj.endRange,
+			numPeople = unMatchedMealObj.numPeople,
+			creator = unMatchedMealObj.creator,
+			created = unMatchedMealObj.created
+		)
+
+	"""
+	Gets the records of a partition, loading them with loadRecordsAsync(limit) if the cached copies are stale
+	The version and the memcache copy are read with one async get_multi. loadRecordsAsync returns a future and has to use
+	an ancestor query (strongly consistent) so the loaded partition has every write up to now
+	Returns a future for the list of OpenMealRecords or None if the partition is too big to be indexed or memcache is unavailable
+	"""
+	@classmethod
+	@ndb.tasklet
+	def __getPartitionAsync(cls, partitionKey, instanceCache, maxRecords, loadRecordsAsync):
+		versionKey = VERSION_MEMCACHE_PREFIX + partitionKey
+		indexKey = INDEX_MEMCACHE_PREFIX + partitionKey
+		cachedValues = yield memcache.Client().get_multi_async([versionKey, indexKey])
+		version = cachedValues.get(versionKey)
+		if (version is None):
+			#the version stamp was lost so no copy can be trusted, start a new one
+			version = yield memcache.Client().incr_async(versionKey, initial_value = cls.__clockVersion())
+			if (version is None):
+				raise ndb.Return(None)
+
+		instancePartition = instanceCache.get(partitionKey)
+		if (instancePartition is not None and instancePartition[0] == version):
+			raise ndb.Return(instancePartition[1])
+
+		memcachePartition = cachedValues.get(indexKey)
+		if (memcachePartition is not None and memcachePartition[0] == version):
+			if (memcachePartition[1] is not None):
+				instanceCache.set(partitionKey, memcachePartition)
+			raise ndb.Return(memcachePartition[1])
+
+		records = yield loadRecordsAsync(maxRecords + 1)
+		if (len(records) > maxRecords):
+			records = None
+		yield cls.__storePartitionAsync(partitionKey, instanceCache, [version, records])
+		raise ndb.Return(records)
+
+	@classmethod
+	@ndb.tasklet
+	def __loadBucketAsync(cls, schoolKey, mealType, numPeople, limit):
+		unMatchedMeals = yield Meal.UnMatchedMeal.getUnmatchedMealsForBucketAsync(schoolKey, mealType, numPeople, limit)
+		raise ndb.Return([cls.recordForUnMatchedMeal(theMeal) for theMeal in unMatchedMeals])
+
+	"""
+	Removes the records with the given keys from the partition and adds the new records
+	The version is always bumped. The change is only applied to a copy of the partition that was up to date right before
+	the bump (anything else means another write happened in between so the partition will be loaded again on the next read)
+	"""
+	@classmethod
+	def __applyChange(cls, partitionKey, instanceCache, maxRecords, keysToRemove, recordsToAdd):
+		newVersion = memcache.incr(VERSION_MEMCACHE_PREFIX + partitionKey, initial_value = cls.__clockVersion())
+		if (newVersion is None):
+			instanceCache.delete(partitionKey)
+			return
+
+		currentPartition = instanceCache.get(partitionKey)
+		if (currentPartition is None or currentPartition[0] != newVersion - 1):
+			currentPartition = memcache.get(INDEX_MEMCACHE_PREFIX + partitionKey)
+		if (currentPartition is None or currentPartition[0] != newVersion - 1):
+			instanceCache.delete(partitionKey)
+			return
+		if (currentPartition[1] is None):
+			#still too big, there is no point loading it again until the marker runs out
+			cls.__storePartitionAsync(partitionKey, instanceCache, [newVersion, None]).get_result()
+			return
+
+		#build a new list so readers in other threads never see a half applied change
+		nowTime = datetime.datetime.now()
+		keysToRemove = set(keysToRemove)
+		records = [record for record in currentPartition[1] if record.key not in keysToRemove and record.endRange >= nowTime]
+		for record in recordsToAdd:
+			indx = len(records)
+			while (indx > 0 and records[indx - 1].startRange > record.startRange):
+				indx -= 1
+			records.insert(indx, record)
+		if (len(records) > maxRecords):
+			records = None
+		cls.__storePartitionAsync(partitionKey, instanceCache, [newVersion, records]).get_result()
+
+	#only partitions that are indexed are kept in instance memory, the marker of one that is too big is only kept in memcache (for a while)
+	@classmethod
+	@ndb.tasklet
+	def __storePartitionAsync(cls, partitionKey, instanceCache, versionedPartition):
+		if (versionedPartition[1] is None):
+			instanceCache.delete(partitionKey)
+			yield memcache.Client().set_multi_async({INDEX_MEMCACHE_PREFIX + partitionKey: versionedPartition}, time = OVERSIZED_PARTITION_TTL)
+			return
+
+		with cls.instanceLock:
+			instancePartition = instanceCache.get(partitionKey)
+			#never replace a newer copy another thread already stored
+			if (instancePartition is None or instancePartition[0] <= versionedPartition[0]):
+				instanceCache.set(partitionKey, versionedPartition)
+		try:
+			unsetKeys = yield memcache.Client().set_multi_async({INDEX_MEMCACHE_PREFIX + partitionKey: versionedPartition})
+		except ValueError:
+			unsetKeys = [partitionKey]
+		if (unsetKeys):
+			#too big for memcache after all (or memcache failed), the other instances will just have to load their own copy
+			yield memcache.Client().delete_multi_async([INDEX_MEMCACHE_PREFIX + partitionKey])
+
+	#a lost version is started again from the clock so it can't come back to a version an old copy of the partition was stored with
+	@classmethod
+	def __clockVersion(cls):
+		return int(time.time() * 1000)
+
+	@classmethod
+	def __bucketPartitionKey(cls, schoolKey, mealType, numPeople):
+		return schoolKey.urlsafe() + ':' + str(mealType) + ':' + str(numPeople)
+
+	@classmethod
+	def __userPartitionKey(cls, schoolKey, userKey):
+		return schoolKey.urlsafe() + ':user:' + userKey.urlsafe()
@@ -0,0 +1,203 @@
+from google.appengine.ext import ndb
+from google.appengine.api import mail
+from google.appengine.runtime import apiproxy_errors
+
+import datetime
+import logging
+
+from TaskDispatcher import TaskDispatcher
+
+"""
+Queue and url of the worker that sends the queued mail (see mailqueue.py)
+"""
+MAIL_QUEUE_NAME = 'outboundmail'
+SEND_MAIL_URL = '/mailqueue/send'
+
+"""
+Number of queued mails the worker sends per run, the worker queues another run if there were more
+"""
+MAIL_SEND_BATCH_SIZE = 50
+
+"""
+Seconds a mail a task was added for can be sent before it is due, so a worker instance whose clock is a little behind
+the instance that queued the mail still sends it
+"""
+MAIL_CLOCK_SKEW_ALLOWANCE = 60
+
+"""
+A mail that fails to send is tried again after MAIL_RETRY_BASE_DELAY seconds, doubling after every failure up to
+MAIL_RETRY_MAX_DELAY seconds, and dropped after MAX_MAIL_ATTEMPTS tries
+"""
+MAIL_RETRY_BASE_DELAY = 30
+MAIL_RETRY_MAX_DELAY = 3600
+MAX_MAIL_ATTEMPTS = 8
+
+"""
+Mails with a digest key wait this many seconds before being sent so that all of the mails with the same key
+that pile up in the meantime are sent as a single digest
+"""
+MAIL_DIGEST_DELAY = 600
+DIGEST_SEPARATOR = "\n\n--------------------\n\n"
+
+
+"""
+Stand-in for the mail api that keeps the sent mails in memory so mail can be sent and checked offline
+"""
+class LocalMailSink(object):
+	def __init__(self):
+		self.sentMails = []
+
+	def send_mail(self, sender, to, subject, body):
+		self.sentMails.append({'sender': sender, 'to': to, 'subject': subject, 'body': body})
+
+
+# a mail waiting to be sent by the mail queue worker, it is deleted once it has been sent
+class OutboundMail(ndb.Model):
+	sender = ndb.StringProperty(required = True, indexed = False)
+	to = ndb.StringProperty(required = True, indexed = False)
+	subject = ndb.StringProperty(required = True, indexed = False)
+	body = ndb.TextProperty(required = True)
+	digestKey = ndb.StringProperty(indexed = False)
+	numAttempts = ndb.IntegerProperty(default = 0, indexed = False)
+	nextAttempt = ndb.DateTimeProperty(required = True, indexed = True)
+	created = ndb.DateTimeProperty(auto_now_add = True, indexed = False)
+
+	#when set, mail is handed to this (e.g. a LocalMailSink) instead of the mail api
+	mailSink = None
+
+	"""
+	Sends all of the following mail to the given sink (or back to the mail api if None)
+	Returns: void
+	"""
+	@classmethod
+	def useMailSink(cls, mailSink):
+		cls.mailSink = mailSink
+
+	"""
+	Queues a mail to be sent by the mail queue worker
+	Mails with a digestKey are held for MAIL_DIGEST_DELAY seconds and sent as one mail with all of the others with the same key
+	(from the sender and to the address of the first one, so a digest key should only be used for mail between the same addresses)
+	The worker task is given the key of the mail so it finds the mail even if the query for due mails doesn't return it yet
+	Raises InvalidEmailError if the to address isn't valid
+	Returns the queued mail object
+	"""
+	@classmethod
+	def queueMail(cls, sender, to, subject, body, digestKey = None):
+		mail.check_email_valid(to, 'to')
+		delay = MAIL_DIGEST_DELAY if digestKey is not None else 0
+		mailOb = cls(
+			sender = sender,
+			to = to,
+			subject = subject,
+			body = body,
+			digestKey = digestKey,
+			nextAttempt = datetime.datetime.now() + datetime.timedelta(seconds = delay)
+		)
+		mailOb.put()
+		cls.__addSendTask([mailOb.key], delay)
+		return mailOb
+
+	"""
+	Sends up to MAIL_SEND_BATCH_SIZE of the queued mails that are due, the due mails that share a digest key are sent as one mail
+	The mails with the given keys (the ones the task was added for) are read by key, since the query for due mails is only eventually
+	consistent, and sent as well if they are due
+	Sent mails are deleted and mails that failed are pushed back (or dropped once they have been tried MAX_MAIL_ATTEMPTS times)
+	Queues another run of the worker if there is still mail left to send
+	Returns [number of mails sent, number of mails that failed]
+	"""
+	@classmethod
+	def sendDueMails(cls, currentTime, mailKeys = None):
+		dueMailsFuture = cls.query(cls.nextAttempt <= currentTime).order(cls.nextAttempt).fetch_async(MAIL_SEND_BATCH_SIZE)
+		keyedMails = ndb.get_multi(mailKeys) if mailKeys else []
+		dueMails = dueMailsFuture.get_result()
+		moreMailsDue = (len(dueMails) == MAIL_SEND_BATCH_SIZE)
+		dueKeys = set(mailOb.key for mailOb in dueMails)
+		latestDueTime = currentTime + datetime.timedelta(seconds = MAIL_CLOCK_SKEW_ALLOWANCE)
+		for mailOb in keyedMails:
+			#a mail that isn't there anymore was already sent by another run
+			if (mailOb is not None and mailOb.key not in dueKeys and mailOb.nextAttempt <= latestDueTime):
+				dueMails.append(mailOb)
+				dueKeys.add(mailOb.key)
+
+		mailGroups = []
+		digestGroups = {}
+		for mailOb in dueMails:
+			if (mailOb.digestKey is None):
+				mailGroups.append([mailOb])
+			elif (mailOb.digestKey in digestGroups):
+				digestGroups[mailOb.digestKey].append(mailOb)
+			else:
+				digestGroups[mailOb.digestKey] = [mailOb]
+				mailGroups.append(digestGroups[mailOb.digestKey])
+
+		numSent = 0
+		numFailed = 0
+		sentKeys = []
+		failedMails = []
+		for mailGroup in mailGroups:
+			if (cls.__sendMailGroup(mailGroup)):
+				sentKeys.extend(mailOb.key for mailOb in mailGroup)
+				numSent += 1
+				continue
+
+			numFailed += 1
+			for mailOb in mailGroup:
+				mailOb.numAttempts += 1
+				if (mailOb.numAttempts >= MAX_MAIL_ATTEMPTS):
+					logging.error("Giving up on mail to " + mailOb.to + " with subject " + mailOb.subject)
+					sentKeys.append(mailOb.key)
+				else:
+					retryDelay = min(MAIL_RETRY_BASE_DELAY * 2 ** (mailOb.numAttempts - 1), MAIL_RETRY_MAX_DELAY)
+					mailOb.nextAttempt = currentTime + datetime.timedelta(seconds = retryDelay)
+					failedMails.append(mailOb)
+
+		deleteFutures = ndb.delete_multi_async(sentKeys)
+		putFutures = ndb.put_multi_async(failedMails)
+		ndb.Future.wait_all(deleteFutures + putFutures)
+		#a sent mail that isn't deleted would be sent again so its delete is tried once more (and the run fails if that fails too)
+		unDeletedKeys = [mailKey for mailKey, deleteFuture in zip(sentKeys, deleteFutures) if deleteFuture.get_exception() is not None]
+		if (unDeletedKeys):
+			logging.warning("Deleting " + str(len(unDeletedKeys)) + " sent mails failed, trying again")
+			ndb.delete_multi(unDeletedKeys)
+		for putFuture in putFutures:
+			putFuture.check_success()
+
+		if (moreMailsDue):
+			cls.__addSendTask([], 0)
+		#every retry gets a task with the keys of its mails so it doesn't depend on the query either
+		retryKeys = {}
+		for mailOb in failedMails:
+			retryKeys.setdefault(mailOb.nextAttempt, []).append(mailOb.key)
+		for nextAttempt, mailKeysToRetry in retryKeys.iteritems():
+			cls.__addSendTask(mailKeysToRetry, (nextAttempt - currentTime).total_seconds())
+		return [numSent, numFailed]
+
+	#the keys are passed as one comma separated param (urlsafe keys never contain a comma)
+	@classmethod
+	def __addSendTask(cls, mailKeys, countdown):
+		TaskDispatcher.addTask(MAIL_QUEUE_NAME, SEND_MAIL_URL, {'mailKeys': ','.join(mailKey.urlsafe() for mailKey in mailKeys)}, countdown = countdown)
+
+	"""
+	Sends the group of mails as one mail (the first mail of the group with the bodies of all of them)
+	Returns true if the mail was sent
+	"""
+	@classmethod
+	def __sendMailGroup(cls, mailGroup):
+		firstMail = mailGroup[0]
+		subject = firstMail.subject
+		if (len(mailGroup) > 1):
+			subject += " (and " + str(len(mailGroup) - 1) + " more)"
+		body = DIGEST_SEPARATOR.join(mailOb.body for mailOb in mailGroup)
+
+		mailSender = cls.mailSink if cls.mailSink is not None else mail
+		try:
+			mailSender.send_mail(
+				sender = firstMail.sender,
+				to = firstMail.to,
+				subject = subject,
+				body = body
+			)
+			return True
+		except (mail.Error, apiproxy_errors.Error):
+			logging.exception("Failed to send mail to " + firstMail.to)
+			return False
@@ -1,26 +1,117 @@
 from google.appengine.ext import ndb
-from google.appengine.api import mail
+from google.appengine.api import memcache
 import datetime
+import random
 
 from Utilities import *
 
-from Meal import Meal
 from User import User
+from LocalCache import LocalCache
+from OutboundMail import OutboundMail
+from TaskDispatcher import TaskDispatcher
 
 
+#the meal properties name their kind instead of importing Meal since Meal imports this module (a cycle that breaks whichever of them is imported first)
 class Report(ndb.Model):
 	reportType = ndb.IntegerProperty(required = True, indexed = True)
 	comments = ndb.StringProperty(indexed = False)
 	giver = ndb.KeyProperty(required = True, kind = User, indexed = True)
-	meal = ndb.KeyProperty(required = True, kind = Meal, indexed = True)
+	meal = ndb.KeyProperty(required = True, kind = 'Meal', indexed = True)
 	added = ndb.DateTimeProperty(auto_now_add = True)
 
 class Rating(ndb.Model):
-	meal = ndb.KeyProperty(required = True, kind = Meal, indexed = True)
+	meal = ndb.KeyProperty(required = True, kind = 'Meal', indexed = True)
 	giver = ndb.KeyProperty(required = True, kind = User, indexed = True)
 	added = ndb.DateTimeProperty(auto_now_add = True)
 
-# the aggregate object that is actually assigned to the user
+# a single rating of the receiver given by the giver for the meal
+# rating events are root entities keyed by (giver, receiver, meal) so the same rating is never stored twice
+class RatingEvent(ndb.Model):
+	receiver = ndb.KeyProperty(required = True, kind = User, indexed = True)
+	giver = ndb.KeyProperty(required = True, kind = User, indexed = True)
+	meal = ndb.KeyProperty(required = True, kind = 'Meal', indexed = True)
+	isPositive = ndb.BooleanProperty(required = True, indexed = True)
+	added = ndb.DateTimeProperty(auto_now_add = True)
+
+# a single report of the receiver made by the giver for the meal, keyed the same way as the rating events
+class ReportEvent(ndb.Model):
+	receiver = ndb.KeyProperty(required = True, kind = User, indexed = True)
+	giver = ndb.KeyProperty(required = True, kind = User, indexed = True)
+	meal = ndb.KeyProperty(required = True, kind = 'Meal', indexed = True)
+	reportType = ndb.IntegerProperty(required = True, indexed = True)
+	comments = ndb.StringProperty(indexed = False)
+	added = ndb.DateTimeProperty(auto_now_add = True)
+
+# one shard of a user's rating counts, the counts of a user are the sums over all of their shards
+# every shard is its own entity group so ratings for the same user can be written at the same time
+class RatingCounterShard(ndb.Model):
+	numPositiveRatings = ndb.IntegerProperty(default = 0, indexed = False)
+	numNegativeRatings = ndb.IntegerProperty(default = 0, indexed = False)
+	numReports = ndb.IntegerProperty(default = 0, indexed = False)
+
+"""
+Number of counter shards per user, roughly how many ratings of the same user can be written each second
+"""
+NUM_RATING_COUNTER_SHARDS = 10
+
+# precomputed standing of the user it is a child of, updated every time the user gets a rating or report
+# users without one have never gotten any feedback and are in good standing
+class UserStanding(ndb.Model):
+	isInGoodStanding = ndb.BooleanProperty(required = True, indexed = True)
+	numPositiveRatings = ndb.IntegerProperty(required = True, indexed = False)
+	numNegativeRatings = ndb.IntegerProperty(required = True, indexed = False)
+	numReports = ndb.IntegerProperty(required = True, indexed = False)
+	updated = ndb.DateTimeProperty(auto_now = True, indexed = False)
+
+"""
+Thresholds for good standing. A user falls out of good standing once they have been reported MAX_REPORTS_IN_GOOD_STANDING + 1 times
+or once they have at least MIN_RATINGS_FOR_STANDING ratings of which more than MAX_NEGATIVE_RATING_FRACTION are negative
+"""
+MAX_REPORTS_IN_GOOD_STANDING = 2
+MIN_RATINGS_FOR_STANDING = 10
+MAX_NEGATIVE_RATING_FRACTION = 0.5
+
+"""
+Id of every user's standing object and how standings are cached (memcache and a shorter lived copy in instance memory)
+"""
+USER_STANDING_ID = 'standing'
+STANDING_MEMCACHE_PREFIX = 'standing:'
+STANDING_MEMCACHE_TTL = 3600
+STANDING_LOCAL_CACHE_SIZE = 5000
+STANDING_LOCAL_CACHE_TTL = 60
+
+"""
+Digest key of the report emails, reports that come in close together are emailed as one digest
+"""
+REPORT_MAIL_DIGEST_KEY = 'reports'
+
+"""
+Number of times a rating or report write is retried when it collides with another write
+"""
+RATING_TRANSACTION_RETRIES = 5
+
+"""
+Queue and urls of the tasks that every stored rating and report adds (see ratingtasks.py)
+A standing is recomputed STANDING_UPDATE_DELAY seconds after the rating so that the first recompute of a burst of ratings
+of the same user counts most of them and the recomputes after it find nothing to write
+"""
+RATINGS_QUEUE_NAME = 'ratings'
+UPDATE_STANDING_URL = '/ratingtasks/standing'
+EMAIL_REPORT_URL = '/ratingtasks/reportmail'
+STANDING_UPDATE_DELAY = 10
+
+# marker that the user it is a child of has given feedback for the meal whose urlsafe key is its id
+# markers are keyed so whether feedback was given for a whole list of meals can be checked with one get_multi
+class FeedbackGiven(ndb.Model):
+	added = ndb.DateTimeProperty(auto_now_add = True, indexed = False)
+
+"""
+Id of the marker recording that the markers of a user have been created for all of the feedback they gave before markers existed
+"""
+FEEDBACK_MARKERS_BACKFILLED_ID = '__backfilled__'
+
+# the aggregate object that ratings used to be stored on (one per user, as a child of the user)
+# nothing is added to it anymore but the counts of users rated before the counter shards existed still include it
 class Ratings(ndb.Model):
 	numPositiveRatings = ndb.IntegerProperty(required = True, indexed = True)
 	numNegativeRatings = ndb.IntegerProperty(required = True, indexed = True)
@@ -28,14 +119,107 @@ class Ratings(ndb.Model):
 	positiveRatings = ndb.StructuredProperty(Rating, repeated = True, indexed = True)
 	reports = ndb.StructuredProperty(Report, repeated = True, indexed = True)
 
+	#urlsafe user key -> whether the user is in good standing
+	standingCache = LocalCache(STANDING_LOCAL_CACHE_SIZE, STANDING_LOCAL_CACHE_TTL)
+
 
 	"""
 	Validates that a user is in good standing with the community
-	Returns true always currently
+	Reads the user's precomputed standing through the cache
+	Returns true if the user is in good standing
 	"""
 	@classmethod
 	def userIsInGoodStanding(cls, userKey):
-		return True
+		return (userKey not in cls.getUsersNotInGoodStanding([userKey]))
+
+	"""
+	Checks the standing of all of the users in the list (which can have repeats) at once
+	Standings are read from instance memory, then with one memcache get_multi and then with one datastore get_multi
+	Returns the set of the user keys that are not in good standing
+	"""
+	@classmethod
+	def getUsersNotInGoodStanding(cls, userKeyList):
+		keyStringToStanding = {}
+		for userKey in set(userKeyList):
+			keyStringToStanding[userKey.urlsafe()] = cls.standingCache.get(userKey.urlsafe())
+
+		missingKeyStrings = [keyString for keyString, isInGoodStanding in keyStringToStanding.iteritems() if isInGoodStanding is None]
+		if (missingKeyStrings):
+			cachedStandings = memcache.get_multi(missingKeyStrings, key_prefix = STANDING_MEMCACHE_PREFIX)
+			for keyString, isInGoodStanding in cachedStandings.iteritems():
+				keyStringToStanding[keyString] = isInGoodStanding
+				cls.standingCache.set(keyString, isInGoodStanding)
+
+			missingKeyStrings = [keyString for keyString in missingKeyStrings if keyString not in cachedStandings]
+			if (missingKeyStrings):
+				standingObs = ndb.get_multi([cls.__standingKey(ndb.Key(urlsafe = keyString)) for keyString in missingKeyStrings])
+				fetchedStandings = {}
+				for keyString, standingOb in zip(missingKeyStrings, standingObs):
+					fetchedStandings[keyString] = standingOb is None or standingOb.isInGoodStanding
+				cls.__cacheStandings(fetchedStandings)
+				keyStringToStanding.update(fetchedStandings)
+
+		return set(ndb.Key(urlsafe = keyString) for keyString, isInGoodStanding in keyStringToStanding.iteritems() if not isInGoodStanding)
+
+	"""
+	Recomputes the user's standing from their rating counts, stores it and drops the cached standing
+	Run by the task every rating and report adds (see ratingtasks.py), so it is retried until it succeeds
+	Returns a future for whether the user is in good standing
+	"""
+	@classmethod
+	@ndb.tasklet
+	def updateStandingForUserAsync(cls, userKey):
+		counts = yield cls.getRatingCountsForUserAsync(userKey)
+		isInGoodStanding = yield cls.__storeStandingAsync(userKey, counts)
+		#updates that finish at the same time could cache their standings in either order so the cache is only ever
+		#dropped, the next check reads the standing that was stored last
+		memcache.delete(STANDING_MEMCACHE_PREFIX + userKey.urlsafe())
+		cls.standingCache.delete(userKey.urlsafe())
+		raise ndb.Return(isInGoodStanding)
+
+	"""
+	Stores the standing computed from the given counts in a transaction on the user's entity group (the counter shards aren't part of it)
+	Counts only ever go up, so every count is merged with the stored one by taking the larger of the two. A recompute that read
+	its counts before another one never undoes it, and a recompute that finds nothing new (the ratings of a burst after the first
+	one) doesn't write anything
+	Returns a future for whether the user is in good standing
+	"""
+	@classmethod
+	@ndb.transactional_tasklet(retries = RATING_TRANSACTION_RETRIES)
+	def __storeStandingAsync(cls, userKey, counts):
+		standingKey = cls.__standingKey(userKey)
+		standingOb = yield standingKey.get_async()
+		if (standingOb is not None):
+			storedCounts = [standingOb.numPositiveRatings, standingOb.numNegativeRatings, standingOb.numReports]
+			if (all(storedCount >= count for storedCount, count in zip(storedCounts, counts))):
+				raise ndb.Return(standingOb.isInGoodStanding)
+			counts = [max(storedCount, count) for storedCount, count in zip(storedCounts, counts)]
+
+		numPositiveRatings, numNegativeRatings, numReports = counts
+		numRatings = numPositiveRatings + numNegativeRatings
+		isInGoodStanding = numReports <= MAX_REPORTS_IN_GOOD_STANDING
+		if (numRatings >= MIN_RATINGS_FOR_STANDING and numNegativeRatings > MAX_NEGATIVE_RATING_FRACTION * numRatings):
+			isInGoodStanding = False
+
+		standingOb = UserStanding(
+			key = standingKey,
+			isInGoodStanding = isInGoodStanding,
+			numPositiveRatings = numPositiveRatings,
+			numNegativeRatings = numNegativeRatings,
+			numReports = numReports
+		)
+		yield standingOb.put_async()
+		raise ndb.Return(isInGoodStanding)
+
+	@classmethod
+	def __cacheStandings(cls, keyStringToStanding):
+		memcache.set_multi(keyStringToStanding, time = STANDING_MEMCACHE_TTL, key_prefix = STANDING_MEMCACHE_PREFIX)
+		for keyString, isInGoodStanding in keyStringToStanding.iteritems():
+			cls.standingCache.set(keyString, isInGoodStanding)
+
+	@classmethod
+	def __standingKey(cls, userKey):
+		return ndb.Key(UserStanding, USER_STANDING_ID, parent = userKey)
 
 	"""
 	Checks if a user has given feedback for a meal
@@ -45,94 +229,222 @@ class Ratings(ndb.Model):
 	"""
 	@classmethod
 	def userHasGivenFeedbackForMeal(cls, userKey, mealKey):
-		ratingUserHasGiven = cls.query(
+		return (mealKey in cls.getMealsUserHasGivenFeedbackFor(userKey, [mealKey]))
+
+	"""
+	Checks which of the meals in the list the user has given feedback for
+	Looks up the user's feedback markers for all of the meals with a single get_multi. The first time a user is looked up
+	their markers are created from the feedback they gave before markers existed (one extra query, only ever done once)
+	Returns the set of the meal keys the user has given feedback for
+	"""
+	@classmethod
+	def getMealsUserHasGivenFeedbackFor(cls, userKey, mealKeyList):
+		markerKeys = [cls.__feedbackMarkerKey(userKey, mealKey) for mealKey in mealKeyList]
+		markerKeys.append(ndb.Key(FeedbackGiven, FEEDBACK_MARKERS_BACKFILLED_ID, parent = userKey))
+		markers = ndb.get_multi(markerKeys)
+
+		ratedMealKeys = set(mealKey for mealKey, marker in zip(mealKeyList, markers) if marker is not None)
+		if (markers[-1] is None):
+			ratedMealKeys.update(cls.__backfillFeedbackMarkers(userKey) & set(mealKeyList))
+		return ratedMealKeys
+
+	"""
+	Creates the feedback markers for all of the ratings the user gave before markers existed
+	Returns the set of the meal keys the user had given feedback for
+	"""
+	@classmethod
+	def __backfillFeedbackMarkers(cls, userKey):
+		ratingObs = cls.query(
 			ndb.OR(
-				cls.positiveRatings == Rating(giver = userKey, meal = mealKey),
-				cls.negativeRatings == Rating(giver = userKey, meal = mealKey)
+				cls.positiveRatings.giver == userKey,
+				cls.negativeRatings.giver == userKey
 			)
-		).get()
-		if (ratingUserHasGiven == None):
-			return False
-		return True
+		).fetch()
+		ratedMealKeys = set()
+		for ratingOb in ratingObs:
+			for rating in ratingOb.positiveRatings + ratingOb.negativeRatings:
+				if (rating.giver == userKey):
+					ratedMealKeys.add(rating.meal)
+
+		markers = [FeedbackGiven(key = cls.__feedbackMarkerKey(userKey, mealKey)) for mealKey in ratedMealKeys]
+		markers.append(FeedbackGiven(id = FEEDBACK_MARKERS_BACKFILLED_ID, parent = userKey))
+		ndb.put_multi(markers)
+		return ratedMealKeys
+
+	@classmethod
+	def __feedbackMarkerKey(cls, userKey, mealKey):
+		return ndb.Key(FeedbackGiven, mealKey.urlsafe(), parent = userKey)
+
+	"""
+	Gets the number of positive ratings, negative ratings and reports the user has received
+	The counter shards and the old aggregate object (if the user has one) are read in parallel
+	Returns a future for the list of [numPositiveRatings, numNegativeRatings, numReports]
+	"""
+	@classmethod
+	@ndb.tasklet
+	def getRatingCountsForUserAsync(cls, userKey):
+		shards, ratingOb = yield ndb.get_multi_async([cls.__counterShardKey(userKey, shardIndex) for shardIndex in range(NUM_RATING_COUNTER_SHARDS)]), cls.query(ancestor = userKey).get_async()
+
+		counts = [0, 0, 0]
+		if (ratingOb is not None):
+			counts = [ratingOb.numPositiveRatings, ratingOb.numNegativeRatings, len(ratingOb.reports)]
+		for shard in shards:
+			if (shard is not None):
+				counts[0] += shard.numPositiveRatings
+				counts[1] += shard.numNegativeRatings
+				counts[2] += shard.numReports
+		raise ndb.Return(counts)
 
 	"""
 	Adds a positive rating to the to the user specified by the given userKey
 	given by the user specified in the raterUserKey for the meal in the mealKey
+	A rating that was already given is ignored so the request can safely be retried
+	Returns true if the rating was added
 	"""
 	@classmethod
 	def addPositiveRating(cls, userKey, mealKey, raterUserKey):
-		ratingOb = cls.getOrCreateRatingsObjectForUser(userKey)
-		ratingOb.numPositiveRatings += 1
-		newRating = Rating(
-			meal = mealKey,
-			giver = raterUserKey
-		)
-		ratingOb.positiveRatings.append(newRating)
-		ratingOb.put()
+		return cls.addPositiveRatingAsync(userKey, mealKey, raterUserKey).get_result()
+
+	"""
+	Same as addPositiveRating but doesn't wait for the write
+	Returns a future for whether the rating was added
+	"""
+	@classmethod
+	@ndb.tasklet
+	def addPositiveRatingAsync(cls, userKey, mealKey, raterUserKey):
+		wasAdded = yield cls.__addRatingAsync(userKey, mealKey, raterUserKey, True)
+		raise ndb.Return(wasAdded)
 
 	"""
 	Adds a negative rating to the to the user specified by the given userKey
 	given by the user specified in the raterUserKey for the meal in the mealKey
+	A rating that was already given is ignored so the request can safely be retried
+	Returns true if the rating was added
 	"""
 	@classmethod
 	def addNegativeRating(cls, userKey, mealKey, raterUserKey):
-		ratingOb = cls.getOrCreateRatingsObjectForUser(userKey)
-		ratingOb.numNegativeRatings += 1
-		newRating = Rating(
-			meal = mealKey,
-			giver = raterUserKey
-		)
-		ratingOb.negativeRatings.append(newRating)
-		ratingOb.put()
+		return cls.addNegativeRatingAsync(userKey, mealKey, raterUserKey).get_result()
+
+	"""
+	Same as addNegativeRating but doesn't wait for the write
+	Returns a future for whether the rating was added
+	"""
+	@classmethod
+	@ndb.tasklet
+	def addNegativeRatingAsync(cls, userKey, mealKey, raterUserKey):
+		wasAdded = yield cls.__addRatingAsync(userKey, mealKey, raterUserKey, False)
+		raise ndb.Return(wasAdded)
 
 	"""
 	Adds a report (bad) to the user specified in the userKey
+	A report that was already made (by the same user for the same meal) is ignored and not emailed again
+	Returns true if the report was added
 	"""
 	@classmethod
 	def addReportToUser(cls, userKey, reportType, fromUserKey, mealKey, comments = ""):
-		userOb = User.getUserObjectForkey(userKey)
+		return cls.addReportToUserAsync(userKey, reportType, fromUserKey, mealKey, comments).get_result()
 
-		# first lets email Turnblad and I
-		mailSender = "Caf Buddy <noreply@cafbuddy.appspotmail.com>"
-		mailTo = "jforster959@gmail.com, aturnblad3@gmail.com"
-		mailSubject = "User " + userOb.firstName + " " + userOb.lastName + " Was Reported"
-		mailBody = "User " + userOb.firstName + " " + userOb.lastName + " was reported at about " + dateTimeOjectToString(datetime.datetime.now()) + ". The comments read:\n" + comments + "\nCheck the datastore to see more information."
-		mail.send_mail(
-			sender = mailSender,
-			to = mailTo,
-			subject = mailSubject,
-			body = mailBody
+	"""
+	Same as addReportToUser but doesn't wait for the write
+	Returns a future for whether the report was added
+	"""
+	@classmethod
+	@ndb.tasklet
+	def addReportToUserAsync(cls, userKey, reportType, fromUserKey, mealKey, comments = ""):
+		wasAdded = yield cls.__addReportAsync(userKey, reportType, fromUserKey, mealKey, comments)
+		raise ndb.Return(wasAdded)
+
+	"""
+	Stores the rating as its own entity, counts it in one of the user's counter shards and marks that the rater gave feedback
+	for the meal, all in one transaction that is retried if it collides with another write
+	The task that recomputes the user's standing is added in the same transaction so it is added if and only if the rating is stored
+	Returns a future for true if the rating was added, false if the same rating was already stored
+	"""
+	@classmethod
+	@ndb.transactional_tasklet(xg = True, retries = RATING_TRANSACTION_RETRIES)
+	def __addRatingAsync(cls, userKey, mealKey, raterUserKey, isPositive):
+		ratingKey = ndb.Key(RatingEvent, cls.__eventId(raterUserKey, userKey, mealKey))
+		existingRating = yield ratingKey.get_async()
+		if (existingRating is not None):
+			raise ndb.Return(False)
+
+		shard = yield cls.__incrementedCounterShardAsync(userKey, 'numPositiveRatings' if isPositive else 'numNegativeRatings')
+		newRating = RatingEvent(
+			key = ratingKey,
+			receiver = userKey,
+			giver = raterUserKey,
+			meal = mealKey,
+			isPositive = isPositive
 		)
+		yield ndb.put_multi_async([newRating, shard, FeedbackGiven(key = cls.__feedbackMarkerKey(raterUserKey, mealKey))])
+		cls.__addStandingTask(userKey)
+		raise ndb.Return(True)
 
-		# then lets add the report to the user
-		ratingOb = cls.getOrCreateRatingsObjectForUser(userKey)
-		newReport = Report(
-			reportType = reportType,
-			comments = comments,
+	"""
+	Stores the report as its own entity and counts it in one of the user's counter shards in one transaction
+	The tasks that recompute the user's standing and email the report are added in the same transaction
+	Returns a future for true if the report was added, false if the same report was already stored
+	"""
+	@classmethod
+	@ndb.transactional_tasklet(xg = True, retries = RATING_TRANSACTION_RETRIES)
+	def __addReportAsync(cls, userKey, reportType, fromUserKey, mealKey, comments):
+		reportKey = ndb.Key(ReportEvent, cls.__eventId(fromUserKey, userKey, mealKey))
+		existingReport = yield reportKey.get_async()
+		if (existingReport is not None):
+			raise ndb.Return(False)
+
+		shard = yield cls.__incrementedCounterShardAsync(userKey, 'numReports')
+		newReport = ReportEvent(
+			key = reportKey,
+			receiver = userKey,
 			giver = fromUserKey,
-			meal = mealKey
+			meal = mealKey,
+			reportType = reportType,
+			comments = comments
 		)
-		ratingOb.reports.append(newReport)
-		ratingOb.put()
+		yield ndb.put_multi_async([newReport, shard])
+		cls.__addStandingTask(userKey)
+		TaskDispatcher.addTask(RATINGS_QUEUE_NAME, EMAIL_REPORT_URL, {'userKey': userKey.urlsafe(), 'comments': comments}, transactional = True)
+		raise ndb.Return(True)
 
 	"""
-	Gets the ratings object for a given user if it already exists
-	Otherwise, if one does not yet exist, it creates a rating object for the user
-	Returns the rating object
+	Gets a random one of the user's counter shards with one added to the named count (it still has to be put)
+	Returns a future for the shard
 	"""
 	@classmethod
-	def getOrCreateRatingsObjectForUser(cls, userKey):	
-		ratingOb = cls.query(ancestor = userKey).get()
-		if (ratingOb is None):
-			ratingOb = Ratings(
-				parent = userKey,
-				numPositiveRatings = 0,
-				numNegativeRatings = 0,
-				positiveRatings = [],
-				negativeRatings = [],
-				reports = []
-			)
-			ratingOb.put()
-		return ratingOb
+	@ndb.tasklet
+	def __incrementedCounterShardAsync(cls, userKey, countName):
+		shardKey = cls.__counterShardKey(userKey, random.randint(0, NUM_RATING_COUNTER_SHARDS - 1))
+		shard = yield shardKey.get_async()
+		if (shard is None):
+			shard = RatingCounterShard(key = shardKey)
+		setattr(shard, countName, getattr(shard, countName) + 1)
+		raise ndb.Return(shard)
 
+	"""
+	Queues an email to Turnblad and I that the user was reported
+	Run by the task every report adds (see ratingtasks.py)
+	Returns: void
+	"""
+	@classmethod
+	def emailReport(cls, userKey, comments):
+		userOb = userKey.get()
+		mailSender = "Caf Buddy <noreply@cafbuddy.appspotmail.com>"
+		mailTo = "jforster959@gmail.com, aturnblad3@gmail.com"
+		mailSubject = "User " + userOb.firstName + " " + userOb.lastName + " Was Reported"
+		mailBody = "User " + userOb.firstName + " " + userOb.lastName + " was reported at about " + dateTimeOjectToString(datetime.datetime.now()) + ". The comments read:\n" + comments + "\nCheck the datastore to see more information."
+		OutboundMail.queueMail(mailSender, mailTo, mailSubject, mailBody, REPORT_MAIL_DIGEST_KEY)
+
+	#has to be called inside the transaction that stores the rating or report
+	@classmethod
+	def __addStandingTask(cls, userKey):
+		TaskDispatcher.addTask(RATINGS_QUEUE_NAME, UPDATE_STANDING_URL, {'userKey': userKey.urlsafe()}, countdown = STANDING_UPDATE_DELAY, transactional = True)
 
+	@classmethod
+	def __counterShardKey(cls, userKey, shardIndex):
+		return ndb.Key(RatingCounterShard, userKey.urlsafe() + ':' + str(shardIndex))
+
+	#the urlsafe keys never contain a ':' so the ids of different (giver, receiver, meal)s never collide
+	@classmethod
+	def __eventId(cls, giverKey, receiverKey, mealKey):
+		return giverKey.urlsafe() + ':' + receiverKey.urlsafe() + ':' + mealKey.urlsafe()
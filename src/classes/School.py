@@ -1,6 +1,7 @@
 from google.appengine.ext import ndb
 
 from Utilities import *
+import SchoolRegistry
 
 class School(ndb.Model):
 	name = ndb.StringProperty() #This is our best guess at a name unless it is set explicitly. Initially it is just set by taking the part between @ and . in the email.
@@ -30,10 +31,12 @@ class School(ndb.Model):
 			return [True, schoolOb]
 		schoolOb = School(name = schoolName, emailDomain = emailDomain, id = emailDomain)
 		schoolOb.put()
+		SchoolRegistry.SchoolRegistry.addSchool(schoolOb)
 		return [True, schoolOb]
 
 	"""
 	Gets a school object by any email address associated with that school
+	Schools are keyed by their email domain so this is served from the school registry's cache or a single get
 	Returns the school object if it is found, otherwise it returns None
 	"""
 	@classmethod
@@ -41,7 +44,7 @@ class School(ndb.Model):
 		(success, emailDomain) = getEmailDomainFromEmailAddress(emailAddress)
 		if (not success):
 			return None
-		return School.query(School.emailDomain == emailDomain).get()
+		return SchoolRegistry.SchoolRegistry.getSchool(emailDomain)
 
 	"""
 	Returns a list of all of the school objects that are stored in the database
@@ -49,3 +52,10 @@ class School(ndb.Model):
 	@classmethod
 	def getAllSchoolObjects(cls):
 		return cls.query().fetch()
+
+	"""
+	Returns a list of the keys of all of the schools that are stored in the database
+	"""
+	@classmethod
+	def getAllSchoolKeys(cls):
+		return cls.query().fetch(keys_only = True)
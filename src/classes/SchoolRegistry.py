@@ -0,0 +1,60 @@
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from LocalCache import LocalCache
+import School
+
+"""
+Number of schools each instance keeps in memory (they are kept until the instance shuts down unless there are more than this)
+and the prefix of the memcache keys they are stored under
+"""
+SCHOOL_REGISTRY_SIZE = 1000
+SCHOOL_MEMCACHE_PREFIX = 'school:'
+
+
+"""
+Resolves email domains to School objects. Schools almost never change once they are created so they are cached
+in instance memory indefinitely, backed by memcache and by a (strongly consistent) get of the School keyed by the domain
+"""
+class SchoolRegistry(object):
+	localCache = LocalCache(SCHOOL_REGISTRY_SIZE)
+
+	"""
+	Gets the school with the given email domain
+	Returns the school object or None if there isn't a school for the domain
+	"""
+	@classmethod
+	def getSchool(cls, emailDomain):
+		schoolOb = cls.localCache.get(emailDomain)
+		if (schoolOb is not None):
+			return schoolOb
+
+		schoolOb = memcache.get(SCHOOL_MEMCACHE_PREFIX + emailDomain)
+		if (schoolOb is None):
+			schoolOb = ndb.Key(School.School, emailDomain).get()
+			if (schoolOb is None):
+				return None
+			memcache.set(SCHOOL_MEMCACHE_PREFIX + emailDomain, schoolOb)
+		cls.localCache.set(emailDomain, schoolOb)
+		return schoolOb
+
+	"""
+	Adds a school that was just created (or changed) to the registry
+	Returns: void
+	"""
+	@classmethod
+	def addSchool(cls, schoolOb):
+		memcache.set(SCHOOL_MEMCACHE_PREFIX + schoolOb.emailDomain, schoolOb)
+		cls.localCache.set(schoolOb.emailDomain, schoolOb)
+
+	"""
+	Loads every school into this instance's memory (and memcache) so that no request has to look them up
+	Returns the number of schools loaded
+	"""
+	@classmethod
+	def warm(cls):
+		schoolObs = School.School.getAllSchoolObjects()
+		memcache.set_multi(dict((schoolOb.emailDomain, schoolOb) for schoolOb in schoolObs), key_prefix = SCHOOL_MEMCACHE_PREFIX)
+		for schoolOb in schoolObs:
+			cls.localCache.set(schoolOb.emailDomain, schoolOb)
+		return len(schoolObs)
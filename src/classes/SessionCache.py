@@ -0,0 +1,74 @@
+from google.appengine.api import memcache
+
+import hashlib
+import threading
+
+"""
+How long (in seconds) a validated log in is trusted without checking its auth token in the datastore again
+"""
+SESSION_CACHE_TTL = 300
+SESSION_MEMCACHE_PREFIX = 'session:'
+
+
+"""
+Cache of validated log ins keyed by (emailAddress, authToken)
+memcache holds a small marker (the user id) for every valid log in and is checked on every lookup, so deleting the
+marker revokes the log in on every instance straight away. Only the log in is cached, the user object is always
+read by id (which ndb answers from its own caches, kept up to date on every put) so a change to the user is seen straight away
+"""
+class SessionCache(object):
+	countLock = threading.Lock()
+	counts = {'hits': 0, 'misses': 0}
+
+	"""
+	Gets the user object for a log in that has already been validated
+	userClass is used to get the user by id
+	Returns the user object or None if the log in isn't cached (it might still be valid)
+	"""
+	@classmethod
+	def getUser(cls, emailAddress, authToken, userClass):
+		userId = memcache.get(SESSION_MEMCACHE_PREFIX + cls.__cacheKey(emailAddress, authToken))
+		if (userId is None):
+			cls.__count('misses')
+			return None
+
+		userOb = userClass.get_by_id(userId)
+		if (userOb is None):
+			cls.__count('misses')
+			return None
+		cls.__count('hits')
+		return userOb
+
+	"""
+	Remembers that the log in is valid for the given user
+	Returns: void
+	"""
+	@classmethod
+	def addUser(cls, emailAddress, authToken, userOb):
+		memcache.set(SESSION_MEMCACHE_PREFIX + cls.__cacheKey(emailAddress, authToken), userOb.key.id(), time = SESSION_CACHE_TTL)
+
+	"""
+	Forgets the log in so that it has to be validated against the datastore again (on every instance)
+	Returns: void
+	"""
+	@classmethod
+	def invalidate(cls, emailAddress, authToken):
+		memcache.delete(SESSION_MEMCACHE_PREFIX + cls.__cacheKey(emailAddress, authToken))
+
+	"""
+	Returns a dict with the number of lookups answered from the cache (hits) and lookups that had to be validated
+	against the datastore (misses)
+	"""
+	@classmethod
+	def getStats(cls):
+		return dict(cls.counts)
+
+	@classmethod
+	def __count(cls, countName):
+		with cls.countLock:
+			cls.counts[countName] += 1
+
+	#the auth token is hashed so it never shows up in memcache keys
+	@classmethod
+	def __cacheKey(cls, emailAddress, authToken):
+		return hashlib.sha256(emailAddress.encode('utf-8') + '\0' + authToken.encode('utf-8')).hexdigest()
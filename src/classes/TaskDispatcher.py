@@ -0,0 +1,77 @@
+from google.appengine.api import taskqueue
+
+import webapp2
+
+
+"""
+Maximum number of tasks the task queue accepts in a single add call
+"""
+MAX_TASKS_PER_ADD = 100
+
+
+"""
+In-process stand-in for the App Engine task queue so that anything that fans out work to task handlers
+can be run and tested offline. Tasks are kept in memory and only run when runTasks is called
+"""
+class LocalTaskQueue(object):
+	def __init__(self):
+		self.tasks = []
+
+	#the countdown is ignored, the tasks only run when runTasks is called anyways. There are no transactions offline either
+	#so a transactional task is added right away (and once for every time its transaction is retried)
+	def add(self, queueName, url, params, countdown = None, transactional = False):
+		self.tasks.append([queueName, url, params])
+
+	"""
+	Runs the queued tasks (including any tasks added while running them) against the given webapp2 application
+	Returns a list of [url, params, response] for every task that was run
+	"""
+	def runTasks(self, application):
+		results = []
+		while (self.tasks):
+			queueName, url, params = self.tasks.pop(0)
+			request = webapp2.Request.blank(url, POST = params)
+			request.headers['X-AppEngine-QueueName'] = queueName
+			results.append([url, params, request.get_response(application)])
+		return results
+
+
+class TaskDispatcher(object):
+	#when set, tasks are put on this LocalTaskQueue instead of the real task queue
+	localQueue = None
+
+	"""
+	Sends all of the following tasks to the given LocalTaskQueue (or back to the real task queue if None)
+	Returns: void
+	"""
+	@classmethod
+	def useLocalQueue(cls, localQueue):
+		cls.localQueue = localQueue
+
+	"""
+	Adds a task that will POST the given params to the url on the given queue (after countdown seconds if given)
+	A transactional task has to be added inside a datastore transaction and is only added if that transaction commits
+	Returns: void
+	"""
+	@classmethod
+	def addTask(cls, queueName, url, params, countdown = None, transactional = False):
+		cls.addTasks(queueName, url, [params], countdown, transactional)
+
+	"""
+	Adds one task per entry in the paramsList that will POST those params to the url on the given queue
+	The tasks are added to the queue in as few calls as possible and run after countdown seconds if one is given
+	At most 5 transactional tasks can be added in one transaction
+	Returns: void
+	"""
+	@classmethod
+	def addTasks(cls, queueName, url, paramsList, countdown = None, transactional = False):
+		if (cls.localQueue is not None):
+			for params in paramsList:
+				cls.localQueue.add(queueName, url, params, countdown, transactional)
+			return
+
+		queue = taskqueue.Queue(queueName)
+		tasks = [taskqueue.Task(url = url, params = params, countdown = countdown) for params in paramsList]
+		for indx in range(0, len(tasks), MAX_TASKS_PER_ADD):
+			queue.add(tasks[indx:indx + MAX_TASKS_PER_ADD], transactional = transactional)
+
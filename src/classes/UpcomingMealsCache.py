@@ -0,0 +1,97 @@
+from google.appengine.api import memcache
+
+import datetime
+import time
+
+"""
+Prefixes of the memcache keys of each user's generation number and of their cached responses
+and the longest (in seconds) a response is ever cached for
+"""
+GENERATION_MEMCACHE_PREFIX = 'upcoming-generation:'
+RESPONSE_MEMCACHE_PREFIX = 'upcoming:'
+UPCOMING_MEALS_CACHE_TTL = 600
+
+
+"""
+Cache of each user's serialized upcoming meals responses
+Every user has a generation number in memcache that is bumped whenever anything changes their upcoming meals
+(matching, creating, editing or deleting an unmatched meal). Responses are stored along with the generation they
+were built in and are only used while that is still the user's generation, so a lookup is one memcache get_multi
+of the generation and the response
+"""
+class UpcomingMealsCache(object):
+
+	"""
+	Gets the named cached response of the user
+	Returns [generation, serialized response or None if there isn't an up to date one]
+	The generation has to be passed to setResponse when storing a freshly built response
+	"""
+	@classmethod
+	def getResponse(cls, userKey, responseName):
+		generationKey = cls.__generationKey(userKey)
+		responseKey = cls.__responseKey(userKey, responseName)
+		cachedValues = memcache.get_multi([generationKey, responseKey])
+		generation = cachedValues.get(generationKey)
+		if (generation is None):
+			return [cls.__startGeneration(generationKey), None]
+
+		cachedResponse = cachedValues.get(responseKey)
+		if (cachedResponse is None or cachedResponse[0] != generation):
+			return [generation, None]
+		return [generation, cachedResponse[1]]
+
+	"""
+	Gets the user's current generation (it changes every time something changes the user's upcoming meals)
+	Returns the generation or None if memcache is unavailable
+	"""
+	@classmethod
+	def getGeneration(cls, userKey):
+		generationKey = cls.__generationKey(userKey)
+		generation = memcache.get(generationKey)
+		if (generation is None):
+			return cls.__startGeneration(generationKey)
+		return generation
+
+	"""
+	Stores the named serialized response of the user that was built in the given generation
+	The response is dropped at expiresAt (e.g. when the first meal in it starts and it is no longer upcoming) if that is sooner than the ttl
+	Returns: void
+	"""
+	@classmethod
+	def setResponse(cls, userKey, responseName, generation, serializedResponse, expiresAt = None):
+		if (generation is None):
+			return
+		cacheTime = UPCOMING_MEALS_CACHE_TTL
+		if (expiresAt is not None):
+			cacheTime = min(cacheTime, int((expiresAt - datetime.datetime.now()).total_seconds()))
+		if (cacheTime <= 0):
+			return
+		memcache.set(cls.__responseKey(userKey, responseName), [generation, serializedResponse], time = cacheTime)
+
+	"""
+	Bumps the generation of all of the users in the list (which can have repeats) with one memcache call
+	so none of their cached responses are used again
+	Returns: void
+	"""
+	@classmethod
+	def invalidateUsers(cls, userKeyList):
+		generationOffsets = dict((cls.__generationKey(userKey), 1) for userKey in userKeyList)
+		if (generationOffsets):
+			memcache.offset_multi(generationOffsets, initial_value = cls.__clockGeneration())
+
+	#a lost generation is started again from the clock so it can't come back to a generation an old response was stored with
+	@classmethod
+	def __startGeneration(cls, generationKey):
+		return memcache.incr(generationKey, initial_value = cls.__clockGeneration())
+
+	@classmethod
+	def __clockGeneration(cls):
+		return int(time.time() * 1000)
+
+	@classmethod
+	def __generationKey(cls, userKey):
+		return GENERATION_MEMCACHE_PREFIX + userKey.urlsafe()
+
+	@classmethod
+	def __responseKey(cls, userKey, responseName):
+		return RESPONSE_MEMCACHE_PREFIX + responseName + ':' + userKey.urlsafe()
@@ -1,5 +1,4 @@
 from google.appengine.ext import ndb
-from google.appengine.api import mail
 from google.appengine.api.mail import InvalidEmailError
 
 import webapp2_extras.appengine.auth.models
@@ -9,10 +8,11 @@ from webapp2_extras.auth import InvalidPasswordError
 
 from Utilities import *
 from School import School
+from SessionCache import SessionCache
+from OutboundMail import OutboundMail
 
  
 class User(webapp2_extras.appengine.auth.models.User):
-
 	#sets the password for the current user to the given raw_password
 	#def set_password(self, newRawPassword):
 		#self.password = security.generate_password_hash(newRawPassword, length=12)
@@ -21,10 +21,10 @@ class User(webapp2_extras.appengine.auth.models.User):
 	#used for resetting passwords
 
 	"""
-	Creates a new sign up token and sends a verification email to the specified email address
+	Creates a new sign up token and queues a verification email to the specified email address (it is sent by the mail queue worker)
 	The userId argument is not necessary as it can be found from the email address but saves on a db call if we have it
-	Returns true if a new token was generated and an email successfully sent
-	Returns false if a verification email was not generated and sent due to bad email, unknown user, or problems sending the email
+	Returns true if a new token was generated and an email successfully queued
+	Returns false if a verification email was not generated and queued due to bad email or unknown user
 	"""
 	@classmethod
 	def sendVerificationEmail(cls, emailAddress, userId = -1):
@@ -54,12 +54,7 @@ class User(webapp2_extras.appengine.auth.models.User):
 			mailBody += " Click the following link or copy and paste it into your favorite browser and you will be all set to meet tons of new people and never eat alone again."
 			mailBody += "\n\n http://cafbuddy.appspot.com/verifyemail?email=" + emailAddress + "&signupTok=" + signupToken
 			mailBody += "\n\n If you did not sign up for Caf Buddy or were not expecting this email then you can safely ignore it."
-			mail.send_mail(
-				sender = mailSender,
-				to = mailTo,
-				subject = mailSubject,
-				body = mailBody
-			)
+			OutboundMail.queueMail(mailSender, mailTo, mailSubject, mailBody)
 			return True
 
 		except InvalidEmailError:
@@ -179,14 +174,27 @@ class User(webapp2_extras.appengine.auth.models.User):
 		if not userOb:
 			return False
 
-		#deletes token from database
+		#deletes token from database (which also removes it from the session cache)
 		userOb.delete_auth_token(userOb.key.id(), authToken)
 		return True
+
+	"""
+	Deletes the given auth token for the user with the given id
+	Overridden so that the log in is removed from the session cache as well and stops working straight away
+	Returns: void
+	"""
+	@classmethod
+	def delete_auth_token(cls, user_id, token):
+		super(User, cls).delete_auth_token(user_id, token)
+		userOb = cls.get_by_id(user_id)
+		if userOb:
+			SessionCache.invalidate(userOb.emailAddress, token)
 	
 	"""
 	Determines if a given user exists in the database and is logged in 
 	Returns false and None if the user doesn't exist or the authentication token is bad (user isn't logged in)
 	Returns true and the user object if the user is logged in
+	Log ins that were validated recently are answered from the session cache
 	"""
 	@classmethod     
 	def validateLogIn(cls, emailAddress, authToken):
@@ -194,6 +202,10 @@ class User(webapp2_extras.appengine.auth.models.User):
 		if (authToken == "" or emailAddress == "" or "@" not in emailAddress or "." not in emailAddress):
 			return [False, None]
 
+		userOb = SessionCache.getUser(emailAddress, authToken, cls)
+		if userOb:
+			return [True, userOb]
+
 		#gets user object for authId and returns false if user doesn't exist in database
 		userOb = cls.get_by_auth_id("own:" + emailAddress)
 		if not userOb:
@@ -202,6 +214,7 @@ class User(webapp2_extras.appengine.auth.models.User):
 		#validates authentication token and returns userKey if user is logged in and false if not
 		userTokenOb = userOb.validate_token(userOb.key.id(), 'auth', authToken)
 		if userTokenOb:
+			SessionCache.addUser(emailAddress, authToken, userOb)
 			return [True, userOb]
 		return [False, None]
 
@@ -234,6 +247,32 @@ class User(webapp2_extras.appengine.auth.models.User):
 		return keyToUserObList
 
 
+	"""
+	Gets the first and last names of all of the users in the userKeyList (which can have repeats)
+	All of the users are fetched with one get_multi of the distinct keys. ndb answers it from memcache for the users it has cached
+	there, and every put of a user clears that copy, so names changed on another instance are never served
+	Returns a dict of urlsafe userKey -> [firstName, lastName] for all userKeys that were found
+	"""
+	@classmethod
+	def getUserNamesForKeyList(cls, userKeyList):
+		return cls.getUserNamesForKeyListAsync(userKeyList).get_result()
+
+	"""
+	Same as getUserNamesForKeyList but doesn't wait for the get_multi
+	Returns a future for the dict of urlsafe userKey -> [firstName, lastName]
+	"""
+	@classmethod
+	@ndb.tasklet
+	def getUserNamesForKeyListAsync(cls, userKeyList):
+		keysToFetch = list(set(userKeyList))
+		keyStringToNames = {}
+		if (keysToFetch):
+			userObList = yield ndb.get_multi_async(keysToFetch)
+			for userKey, userOb in zip(keysToFetch, userObList):
+				if (userOb is not None):
+					keyStringToNames[userKey.urlsafe()] = [userOb.firstName, userOb.lastName]
+		raise ndb.Return(keyStringToNames)
+
 	"""
 	Gets the user object for a given userKey
 	Returns a tuple of [userKey, userOb]
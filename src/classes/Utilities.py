@@ -3,6 +3,8 @@ This file contains miscellaneous functions used throughout the APIs and classes
 """
 import datetime
 
+from DateTimeCodec import DateTimeCodec
+
 """
 Capitalizes the first letter of every word in the name
 and lowercases the rest. Also capitalizes the first
@@ -42,9 +44,10 @@ def getEmailDomainFromEmailAddress(emailAddress):
 Standard utility function used to convert strings received from the client into a datetime
 object in order to store it in the database
 Expects string in format 'Month Day Year Hour(24):Minute:Second' (e.g. 'January 03 2016 00:43:58')
+Raises ValueError if the string isn't in that format
 """
 def stringToDateTimeObject(str):
-	return datetime.datetime.strptime(str, '%B %d %Y %H:%M:%S')
+	return DateTimeCodec.parse(str)
 
 """
 Standard utility function used to convert datetime objects in the database into the standard
@@ -52,4 +55,4 @@ format string expected by the client
 Returns string in format 'Month Day Year Hour(24):Minute:Second' (e.g. 'January 03 2016 00:43:58')
 """
 def dateTimeOjectToString(dateTimeOb):
-	return dateTimeOb.strftime('%B %d %Y %H:%M:%S')
\ No newline at end of file
+	return DateTimeCodec.format(dateTimeOb)
\ No newline at end of file
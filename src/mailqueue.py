@@ -0,0 +1,22 @@
+import webapp2
+from google.appengine.ext import ndb
+
+import datetime
+import logging
+
+from classes.OutboundMail import OutboundMail, SEND_MAIL_URL
+from classes.Instrumentation import Instrumentation
+
+
+"""
+Worker for the outbound mail queue, run by the tasks OutboundMail adds whenever mail is queued or has to be retried
+The mailKeys param is a comma separated list of the urlsafe keys of the mails the task was added for
+"""
+class SendQueuedMail(webapp2.RequestHandler):
+    def post(self):
+        mailKeys = [ndb.Key(urlsafe = keyString) for keyString in self.request.get('mailKeys').split(',') if keyString]
+        numSent, numFailed = OutboundMail.sendDueMails(datetime.datetime.now(), mailKeys)
+        logging.info("Sent " + str(numSent) + " mails, " + str(numFailed) + " failed")
+
+
+application = Instrumentation.instrumentApplication(webapp2.WSGIApplication([(SEND_MAIL_URL, SendQueuedMail)], debug = False))
@@ -1,71 +1,165 @@
 import webapp2
+from google.appengine.ext import ndb
+from google.appengine.datastore.datastore_query import Cursor
 
 import datetime
+import json
+import logging
+import time
 
 from classes.Utilities import *
 from classes.School import School
 from classes.Meal import *
 from classes.User import User
-
-
+from classes.MatchingEngine import matchMealStream, maximumMatchMeals, MATCHED_MEALS, EXPIRED_MEAL
+from classes.TaskDispatcher import TaskDispatcher
+from classes.Instrumentation import Instrumentation
+from classes.MatchingRunStats import MatchingRunStats
+
+
+"""
+When true the cron handler fans the matching out into one task per school instead of matching every school itself
+"""
+FAN_OUT_MATCHING = True
+MATCHING_QUEUE_NAME = 'mealmatching'
+MATCH_SCHOOL_URL = '/mealmatching/school'
+EXPIRE_MEALS_URL = '/mealmatching/expire'
+MATCHING_STATS_URL = '/mealmatching/stats'
+
+"""
+Which matcher the cron uses: 'greedy' streams the meals through the first-fit matching engine,
+'maximum' loads all of a school's meals and matches as many of them as it can (see maximumMatchMeals)
+"""
+GREEDY_MATCHING = 'greedy'
+MAXIMUM_MATCHING = 'maximum'
+MATCHING_MODE = GREEDY_MATCHING
+
+"""
+Number of matched groups that are collected before they are written to the datastore
+"""
+MATCHING_COMMIT_CHUNK_SIZE = 500
+
+"""
+Runs the matching for a single school: streams the school's unmatched meals (ordered by startRange) through the
+datastore free matching engine and writes the matches to the datastore a chunk at a time as they come out,
+so only the meals that could still overlap with each other are ever held in memory
+Expired meals are skipped here, deleting them is left to the expiry pipeline (ExpireUnMatchedMeals)
+If a debugLog list is given every [MATCHED_MEALS, group] / [EXPIRED_MEAL, meal] result is also added to it
+The run is timed (reading the meals, matching them and writing the new meals) and its datastore calls are counted
+into a MatchingRunStats report which replaces the school's previous one
+Returns the MatchingRunStats object
+"""
+def matchMealsForSchool(schoolKey, currentTime, debugLog = None):
+    runStats = MatchingRunStats.newRunForSchool(schoolKey, currentTime, MATCHING_MODE)
+    record = Instrumentation.startRecording()
+    try:
+        #reading the meals happens inside the matcher as it pulls them, so the time spent in the iterator is taken out of the matching time
+        fetchTimer = [0.0, 0]
+        unMatchedMeals = timedIter(UnMatchedMeal.iterUnmatchedMealsForSchool(schoolKey), fetchTimer)
+        commitSeconds = 0.0
+        failedGroups = []
+        unMatchedMealsToMatch = []
+        for resultType, result in matchingResults(unMatchedMeals, currentTime):
+            if (debugLog is not None):
+                debugLog.append([resultType, result])
+            if (resultType == MATCHED_MEALS):
+                unMatchedMealsToMatch.append(result)
+                runStats.numGroups += 1
+                runStats.numMatched += len(result)
+            else:
+                runStats.numExpired += 1
+
+            #for the meals that can be grouped... turn them into meals all at once
+            if (len(unMatchedMealsToMatch) >= MATCHING_COMMIT_CHUNK_SIZE):
+                commitStart = time.time()
+                runStats.numMealsCreated += len(Meal.createNewMeals(schoolKey, unMatchedMealsToMatch, failedGroups))
+                commitSeconds += time.time() - commitStart
+                unMatchedMealsToMatch = []
+        if (unMatchedMealsToMatch):
+            commitStart = time.time()
+            runStats.numMealsCreated += len(Meal.createNewMeals(schoolKey, unMatchedMealsToMatch, failedGroups))
+            commitSeconds += time.time() - commitStart
+    finally:
+        Instrumentation.stopRecording()
+
+    runStats.numScanned = fetchTimer[1]
+    runStats.numGroupsFailed = len(failedGroups)
+    runStats.numUnMatched = runStats.numScanned - runStats.numExpired - runStats.numMatched
+    runStats.fetchMs = int(fetchTimer[0] * 1000)
+    runStats.commitMs = int(commitSeconds * 1000)
+    runStats.matchMs = max(0, int(record.getElapsedMs()) - runStats.fetchMs - runStats.commitMs)
+    runStats.numDatastoreCalls = record.getNumDatastoreCalls()
+    runStats.datastoreCalls = dict((callName, callStats[0]) for callName, callStats in record.datastoreCalls.iteritems())
+    runStats.put()
+    return runStats
+
+"""
+Yields the items of the iterator, adding the seconds spent getting each one to timer[0] and counting them in timer[1]
+"""
+def timedIter(iterator, timer):
+    iterator = iter(iterator)
+    while True:
+        startTime = time.time()
+        try:
+            item = next(iterator)
+        finally:
+            timer[0] += time.time() - startTime
+        timer[1] += 1
+        yield item
+
+"""
+Runs the meals (ordered by startRange) through the matcher picked by MATCHING_MODE
+Returns an iterable of [MATCHED_MEALS, group] / [EXPIRED_MEAL, meal] results
+"""
+def matchingResults(orderedUnMatchedMeals, currentTime):
+    if (MATCHING_MODE != MAXIMUM_MATCHING):
+        return matchMealStream(orderedUnMatchedMeals, currentTime, MINIMUM_MEAL_LENGTH)
+    mealGroups, expiredMeals = maximumMatchMeals(orderedUnMatchedMeals, currentTime, MINIMUM_MEAL_LENGTH)
+    return [[EXPIRED_MEAL, theMeal] for theMeal in expiredMeals] + [[MATCHED_MEALS, mealGroup] for mealGroup in mealGroups]
+
+
+"""
+Handles the matching cron. It starts the expiry pipeline and then, in fan out mode, only adds one matching task
+per school to the matching queue so that every school is matched in its own request (spread across instances)
+by MatchSchoolMeals. Otherwise (or when asked for the debug output with ?debug=1) the schools are matched one after another
+"""
 class MatchMeals(webapp2.RequestHandler):
     def get(self):
+        TaskDispatcher.addTask(MATCHING_QUEUE_NAME, EXPIRE_MEALS_URL, {'currentTime': dateTimeOjectToString(datetime.datetime.now())})
+
+        #the debug output holds on to every result so it is only built when asked for with ?debug=1
+        debugMode = (self.request.get('debug') == '1')
+        if (FAN_OUT_MATCHING and not debugMode):
+            schoolKeys = School.getAllSchoolKeys()
+            TaskDispatcher.addTasks(MATCHING_QUEUE_NAME, MATCH_SCHOOL_URL, [{'schoolKey': schoolKey.urlsafe()} for schoolKey in schoolKeys])
+            self.response.write("<p>Queued matching for " + str(len(schoolKeys)) + " schools</p>")
+            return
+
         currentTime = datetime.datetime.now()
         #perform the algorithm one at a time on the schools
         schools = School.getAllSchoolObjects()
         for school in schools:
-            #get all the meals for a particular school and go through meals one by one
-            unMatchedMealsToDelete = []
-            unMatchedMealsToMatch = []
-            unMatchedMeals = UnMatchedMeal.getAllUnmatchedMealsForSchool(school.key)
-            indx = 0
-            numUnMatchedMeals = len(unMatchedMeals)
-            while (indx < numUnMatchedMeals):
-                #if the meal has already "happened" but never got matched, we should delete it, so add it to the list
-                if (unMatchedMeals[indx].endRange < currentTime):
-                    unMatchedMealsToDelete.append(unMatchedMeals[indx])
-                    indx += 1
-                #else lets try to match this meal
-                else:
-                    numMatched = 1 #number of meals matched with this meal so far
-                    searchIndx = indx + 1 #current meal trying to match with this meal
-                    matchedMeals = [] #the meals and their index that we have matched with this meal so far
-                    # continue while we have fewer matched meals than we want, we haven't gone through all unmatched meals
-                    # and we haven't hit the point where any meals after that wont match because their start time is later than
-                    # the end time of the meal we are looking at minus the minimum length of a meal
-                    while (numMatched < unMatchedMeals[indx].numPeople and searchIndx < numUnMatchedMeals and (unMatchedMeals[indx].endRange - datetime.timedelta(minutes = MINIMUM_MEAL_LENGTH)) >= unMatchedMeals[searchIndx].startRange):
-                        mealTypesMatch = (unMatchedMeals[indx].mealType == unMatchedMeals[searchIndx].mealType)
-                        numPeopleMatch = (unMatchedMeals[searchIndx].numPeople == unMatchedMeals[indx].numPeople)
-                        notSameCreator = (unMatchedMeals[searchIndx].creator != unMatchedMeals[indx].creator)
-                        if (mealTypesMatch and numPeopleMatch and notSameCreator):
-                            numMatched += 1
-                            matchedMeals.append([searchIndx, unMatchedMeals[searchIndx]])
-                        searchIndx += 1
-
-                    #if successfully was able to find matches for a given meal... then add those unmatched meals to be turned into meals later
-                    if (numMatched >= unMatchedMeals[indx].numPeople):
-                        listToAddToMealsToMatch = [unMatchedMeals[indx]]
-                        for matchedIndx, matchedMeal in matchedMeals:
-                            del unMatchedMeals[matchedIndx]
-                            listToAddToMealsToMatch.append(matchedMeal)
-                            numUnMatchedMeals -= 1;
-                        unMatchedMealsToMatch.append(listToAddToMealsToMatch)
-                    # else weren't able to find enough matches for a given meal so take no action and just skip it :/
-                    indx += 1
-
-
-           ###############################
-           # This section is just debugging info that could really be deleted
-           ################################         
-            self.response.write("<h1> To Delete </h1>");
-            for todelete in unMatchedMealsToDelete:
+            debugLog = [] if debugMode else None
+            runStats = matchMealsForSchool(school.key, currentTime, debugLog)
+            self.response.write("<p>" + school.emailDomain + ": " + str(runStats.numGroups) + " meals matched, " + str(runStats.numExpired) + " expired meals skipped</p>")
+            if (debugMode):
+                self.writeDebugLog(debugLog)
+
+    ###############################
+    # This section is just debugging info
+    ################################
+    def writeDebugLog(self, debugLog):
+        self.response.write("<h1> To Delete </h1>");
+        for resultType, todelete in debugLog:
+            if (resultType == EXPIRED_MEAL):
                 self.response.write("<p> Meal Type : ")
                 self.response.write(todelete.mealType)
                 self.response.write("   " + dateTimeOjectToString(todelete.startRange) + " - " + dateTimeOjectToString(todelete.endRange) + "     Created: " + dateTimeOjectToString(todelete.created) + "</p>")
 
-            self.response.write("<h1> To Meal </h1>");
-            mealNum = 0
-            for theMatchedMeals in unMatchedMealsToMatch:
+        self.response.write("<h1> To Meal </h1>");
+        mealNum = 0
+        for resultType, theMatchedMeals in debugLog:
+            if (resultType == MATCHED_MEALS):
                 for theMatchedMeal in theMatchedMeals:
                     self.response.write("<p>")
                     self.response.write(mealNum)
@@ -74,33 +168,62 @@ class MatchMeals(webapp2.RequestHandler):
                     self.response.write("   " + dateTimeOjectToString(theMatchedMeal.startRange) + " - " + dateTimeOjectToString(theMatchedMeal.endRange) + "     Created: " + dateTimeOjectToString(theMatchedMeal.created) + "</p>")
                     mealNum += 1
 
-            # suc, userOb = User.validateLogIn("", "")
-            # ummls = UnMatchedMeal.getUpcomingUnMatchedMealsForUser(userOb.key.urlsafe())
-            # self.response.write("<h1> Unmatched Meals </h1>")
-            # for um in ummls:
-            #     self.response.write("<p>")
-            #     self.response.write(um.startRange)
-            #     self.response.write("</p>")
 
-            # mmls = Meal.getUpcomingMealsForUser(userOb.key.urlsafe())
-            # self.response.write("<h1> Matched Meals </h1>")
-            # for um in mmls:
-            #     self.response.write("<p>")
-            #     self.response.write(um.startTime)
-            #     self.response.write("</p>")
 
+"""
+Task handler that matches the unmatched meals of the single school given by the schoolKey param
+"""
+class MatchSchoolMeals(webapp2.RequestHandler):
+    def post(self):
+        schoolKey = ndb.Key(urlsafe = self.request.get('schoolKey'))
+        runStats = matchMealsForSchool(schoolKey, datetime.datetime.now())
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(runStats.toJsonDict()))
 
-        #delete the meals that are past and never got matched
-        unMatchedMealKeysToDelete = [theMeal.key for theMeal in unMatchedMealsToDelete]
-        UnMatchedMeal.removeUnMatchedMeals(unMatchedMealKeysToDelete)
 
-        #for the meals that can be paired... pair them
-        for theMatchedMeals in unMatchedMealsToMatch:
-            firstMeal, secondMeal = theMatchedMeals
-            Meal.createNewMeal(firstMeal, secondMeal)
-
-
-
-application = webapp2.WSGIApplication([('/mealmatching', MatchMeals)], debug = False)
+"""
+Returns (as JSON) the report of the latest matching run of every school: meals scanned, expired, matched and left unmatched,
+groups matched and meals created, milliseconds spent in the fetch, match and commit phases and the datastore calls made
+"""
+class MatchingStats(webapp2.RequestHandler):
+    def get(self):
+        runStats = MatchingRunStats.getLatestRunsForSchools(School.getAllSchoolKeys())
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps({'schools': [runStat.toJsonDict() for runStat in runStats]}))
+
+
+"""
+Task handler for the expiry pipeline: deletes the unmatched meals that ended before the currentTime param
+When it runs out of time it adds a task for itself to carry on from where it stopped (the cursor param)
+keeping count of the number of meals deleted so far (the expiredSoFar param)
+"""
+class ExpireUnMatchedMeals(webapp2.RequestHandler):
+    def post(self):
+        currentTime = stringToDateTimeObject(self.request.get('currentTime'))
+        startCursor = None
+        if (self.request.get('cursor')):
+            startCursor = Cursor(urlsafe = self.request.get('cursor'))
+        expiredSoFar = int(self.request.get('expiredSoFar', '0'))
+
+        numExpired, nextCursor = UnMatchedMeal.expireUnMatchedMeals(currentTime, startCursor)
+        expiredSoFar += numExpired
+        if (nextCursor is not None):
+            TaskDispatcher.addTask(MATCHING_QUEUE_NAME, EXPIRE_MEALS_URL, {
+                'currentTime': self.request.get('currentTime'),
+                'cursor': nextCursor.urlsafe(),
+                'expiredSoFar': str(expiredSoFar)
+            })
+            self.response.write("<p>" + str(expiredSoFar) + " unmatched meals expired so far, continuing in a new task</p>")
+        else:
+            logging.info("Expired " + str(expiredSoFar) + " unmatched meals")
+            self.response.write("<p>" + str(expiredSoFar) + " unmatched meals expired</p>")
+
+
+application = Instrumentation.instrumentApplication(webapp2.WSGIApplication([
+    ('/mealmatching', MatchMeals),
+    (MATCH_SCHOOL_URL, MatchSchoolMeals),
+    (EXPIRE_MEALS_URL, ExpireUnMatchedMeals),
+    (MATCHING_STATS_URL, MatchingStats)
+], debug = False))
 
 
@@ -0,0 +1,25 @@
+import webapp2
+from google.appengine.ext import ndb
+
+from classes.Ratings import Ratings, UPDATE_STANDING_URL, EMAIL_REPORT_URL
+from classes.Instrumentation import Instrumentation
+
+
+"""
+Recomputes the standing of the user with the given urlsafe userKey, added by every rating and report of the user
+A recompute that fails makes the task fail so the task queue retries it
+"""
+class UpdateStanding(webapp2.RequestHandler):
+    def post(self):
+        Ratings.updateStandingForUserAsync(ndb.Key(urlsafe = self.request.get('userKey'))).get_result()
+
+
+"""
+Queues the mail about a report of the user with the given urlsafe userKey, added by every report
+"""
+class EmailReport(webapp2.RequestHandler):
+    def post(self):
+        Ratings.emailReport(ndb.Key(urlsafe = self.request.get('userKey')), self.request.get('comments'))
+
+
+application = Instrumentation.instrumentApplication(webapp2.WSGIApplication([(UPDATE_STANDING_URL, UpdateStanding), (EMAIL_REPORT_URL, EmailReport)], debug = False))
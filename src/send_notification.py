@@ -0,0 +1,135 @@
+import webapp2
+from google.appengine.ext import ndb
+
+import datetime
+import json
+import threading
+import time
+
+from classes.Utilities import *
+from classes.User import User
+from classes.Meal import Meal
+from classes.UpcomingMealsCache import UpcomingMealsCache
+from classes.MatchNotifier import MatchNotifier
+from classes.Instrumentation import Instrumentation
+
+
+"""
+A long poll is answered after at most LONG_POLL_TIMEOUT seconds. The user's generation is first checked again after
+LONG_POLL_INTERVAL seconds and the wait between checks then grows by LONG_POLL_BACKOFF up to LONG_POLL_MAX_INTERVAL seconds,
+so a poll that times out costs a handful of memcache gets rather than one a second
+"""
+LONG_POLL_TIMEOUT = 25
+LONG_POLL_INTERVAL = 1
+LONG_POLL_BACKOFF = 1.5
+LONG_POLL_MAX_INTERVAL = 5
+
+"""
+A held poll takes up one of the instance's concurrent request slots for as long as it waits, so each instance holds at most
+MAX_HELD_LONG_POLLS at once. Any other poll (and every poll while memcache is unavailable) is answered right away like a short
+poll and tells the client to call again after SHORT_POLL_INTERVAL seconds
+"""
+MAX_HELD_LONG_POLLS = 4
+SHORT_POLL_INTERVAL = 10
+
+heldPollSlots = threading.BoundedSemaphore(MAX_HELD_LONG_POLLS)
+
+
+"""
+Long-polling endpoint clients wait on for their matches instead of polling getAllUpcomingMeals
+POST emailAddress, authToken and the generation the client last saw (leave it out on the first call)
+The request is held until the user's upcoming meals generation is different from the given one (or the poll times out) and answered with
+{"errorNumber": 200, "generation": current generation, "changed": true if it changed, "matchEvents": the user's recent match events,
+"matchedMeals": the upcoming meals of those events (only when it changed), "retryAfter": seconds to wait before the next call}
+If the instance is already holding as many polls as it can, or memcache is unavailable, the request isn't held and retryAfter is
+SHORT_POLL_INTERVAL. When memcache is unavailable "generation" is null and "changed" is false, the client should call again with the
+generation it already had
+Every match event has the key of its meal and the meals are read by key, which is strongly consistent, so a meal that was just matched
+is always there (a query for the user's meals right after the match might not return it yet). Each meal is
+{"mealKey", "mealType", "startTime", "numPeople", "people": urlsafe keys of everyone in the meal}
+When "changed" is true the client should update its meals (its unmatched meals that were matched are gone) and wait on the new generation
+Nothing is pushed to clients: MatchNotifier has no pusher outside of offline runs (see LocalPushSink), so polling this is the only way
+a client finds out about a match
+On Error: {"errorNumber": -100} if the user isn't logged in
+"""
+class WaitForMatches(webapp2.RequestHandler):
+    def post(self):
+        self.response.headers['Content-Type'] = 'application/json'
+        isLoggedIn, userOb = User.validateLogIn(self.request.get('emailAddress'), self.request.get('authToken'))
+        if (not isLoggedIn):
+            self.response.write(json.dumps({'errorNumber': -100}))
+            return
+
+        knownGeneration = self.request.get('generation')
+        generation = UpcomingMealsCache.getGeneration(userOb.key)
+        retryAfter = 0
+        if (generation is not None and knownGeneration and str(generation) == knownGeneration):
+            if (heldPollSlots.acquire(False)):
+                try:
+                    generation = self.waitForNewGeneration(userOb.key, knownGeneration)
+                finally:
+                    heldPollSlots.release()
+            else:
+                retryAfter = SHORT_POLL_INTERVAL
+
+        #memcache is unavailable so there is no generation to compare or wait on
+        if (generation is None):
+            self.response.write(json.dumps({
+                'errorNumber': 200,
+                'generation': None,
+                'changed': False,
+                'matchEvents': [],
+                'retryAfter': SHORT_POLL_INTERVAL
+            }))
+            return
+
+        changed = str(generation) != knownGeneration
+        matchEvents = MatchNotifier.getMatchEvents(userOb.key)
+        response = {
+            'errorNumber': 200,
+            'generation': generation,
+            'changed': changed,
+            'matchEvents': matchEvents,
+            'retryAfter': retryAfter
+        }
+        if (changed):
+            response['matchedMeals'] = self.getUpcomingMatchedMeals(matchEvents)
+        self.response.write(json.dumps(response))
+
+    """
+    Waits until the user's generation is different from knownGeneration or the poll times out
+    Returns the user's generation (None if memcache stopped answering, the wait ends right away then)
+    """
+    def waitForNewGeneration(self, userKey, knownGeneration):
+        stopTime = time.time() + LONG_POLL_TIMEOUT
+        interval = LONG_POLL_INTERVAL
+        generation = knownGeneration
+        while (generation is not None and str(generation) == knownGeneration and time.time() < stopTime):
+            time.sleep(min(interval, max(0, stopTime - time.time())))
+            interval = min(interval * LONG_POLL_BACKOFF, LONG_POLL_MAX_INTERVAL)
+            generation = UpcomingMealsCache.getGeneration(userKey)
+        return generation
+
+    """
+    Gets the meals of the match events by key (the ones that still exist and haven't started)
+    Returns a list of meal dicts ordered by startTime
+    """
+    def getUpcomingMatchedMeals(self, matchEvents):
+        mealKeys = []
+        for matchEvent in matchEvents:
+            mealKey = ndb.Key(urlsafe = matchEvent['mealKey'])
+            if (mealKey not in mealKeys):
+                mealKeys.append(mealKey)
+        nowTime = datetime.datetime.now()
+        upcomingMeals = [theMeal for theMeal in ndb.get_multi(mealKeys) if theMeal is not None and theMeal.startTime >= nowTime]
+        upcomingMeals.sort(key = lambda theMeal: theMeal.startTime)
+        return [{
+            'mealKey': theMeal.key.urlsafe(),
+            'mealType': theMeal.mealType,
+            'startTime': dateTimeOjectToString(theMeal.startTime),
+            'numPeople': theMeal.numPeople,
+            'people': [personKey.urlsafe() for personKey in theMeal.people]
+        } for theMeal in upcomingMeals]
+
+
+application = Instrumentation.instrumentApplication(webapp2.WSGIApplication([('/sendnotification/wait', WaitForMatches)], debug = False))
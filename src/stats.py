@@ -0,0 +1,32 @@
+import webapp2
+
+import json
+
+from classes.Instrumentation import Instrumentation
+from classes.SessionCache import SessionCache
+from classes.Ratings import Ratings
+from classes.SchoolRegistry import SchoolRegistry
+from classes.OpenMealIndex import OpenMealIndex
+
+
+"""
+Admin page with the request instrumentation and the cache stats of the instance that serves it, as JSON
+?clear=1 clears the instrumentation stats after returning them
+"""
+class InstanceStats(webapp2.RequestHandler):
+    def get(self):
+        stats = Instrumentation.getStats()
+        stats['caches'] = {
+            'sessions': SessionCache.getStats(),
+            'userStandings': Ratings.standingCache.getStats(),
+            'schools': SchoolRegistry.localCache.getStats(),
+            'openMealBuckets': OpenMealIndex.bucketCache.getStats(),
+            'openMealUsers': OpenMealIndex.userCache.getStats()
+        }
+        if (self.request.get('clear') == '1'):
+            Instrumentation.clearStats()
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(stats, indent = 2, sort_keys = True))
+
+
+application = webapp2.WSGIApplication([('/stats', InstanceStats)], debug = False)
@@ -1,6 +1,7 @@
 import webapp2
 
 from classes.User import User
+from classes.Instrumentation import Instrumentation
 
 class EmailVerifier(webapp2.RequestHandler):
     def get(self):
@@ -12,4 +13,4 @@ class EmailVerifier(webapp2.RequestHandler):
     		self.response.write("Oh no! Something went wrong and we weren't able to verify the email " + emailAddress + ". Please try again by using the app to send a new verification email.")
 
 
-application = webapp2.WSGIApplication([('/verifyemail', EmailVerifier)], debug = False)
+application = Instrumentation.instrumentApplication(webapp2.WSGIApplication([('/verifyemail', EmailVerifier)], debug = False))
@@ -0,0 +1,17 @@
+import webapp2
+
+import logging
+
+from classes.SchoolRegistry import SchoolRegistry
+
+
+"""
+Handles the warmup request App Engine sends to a new instance before it gets any traffic
+"""
+class Warmup(webapp2.RequestHandler):
+    def get(self):
+        numSchools = SchoolRegistry.warm()
+        logging.info("Warmed up the school registry with " + str(numSchools) + " schools")
+
+
+application = webapp2.WSGIApplication([('/_ah/warmup', Warmup)], debug = False)
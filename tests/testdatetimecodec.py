@@ -0,0 +1,76 @@
+"""
+Tests that the hand-rolled wire format codec (classes/DateTimeCodec.py) gives exactly what strptime / strftime give
+"""
+import datetime
+import random
+import unittest
+
+import testsetup
+from classes.DateTimeCodec import DateTimeCodec, WIRE_FORMAT
+
+
+class DateTimeCodecTest(unittest.TestCase):
+	def setUp(self):
+		DateTimeCodec.parseMemo.clear()
+		DateTimeCodec.formatMemo.clear()
+
+	"""
+	Checks that parsing the string gives the same datetime as strptime or raises ValueError when strptime does
+	"""
+	def assertParsesLikeStrptime(self, dateTimeString):
+		try:
+			expected = datetime.datetime.strptime(dateTimeString, WIRE_FORMAT)
+		except ValueError:
+			with self.assertRaises(ValueError):
+				DateTimeCodec.parse(dateTimeString)
+			return
+		self.assertEqual(DateTimeCodec.parse(dateTimeString), expected)
+		#the second time it comes from the memo
+		self.assertEqual(DateTimeCodec.parse(dateTimeString), expected)
+
+	def testParsesCanonicalStrings(self):
+		for dateTimeString in ['January 03 2016 00:43:58', 'December 31 1999 23:59:59', 'February 29 2016 12:00:00', 'September 09 2009 09:09:09']:
+			self.assertParsesLikeStrptime(dateTimeString)
+
+	def testParsesOtherFormsLikeStrptime(self):
+		#forms strptime accepts that aren't what strftime produces
+		for dateTimeString in ['january 03 2016 00:43:58', 'JANUARY 03 2016 00:43:58', 'Jan 03 2016 00:43:58', 'January 3 2016 00:43:58',
+				'January 03 2016 0:43:58', 'January  03 2016 00:43:58', 'January 03 2016 00:43:58 ', u'January 03 2016 00:43:58', 'January 03 0999 00:43:58']:
+			self.assertParsesLikeStrptime(dateTimeString)
+
+	def testRejectsInvalidStringsLikeStrptime(self):
+		for dateTimeString in ['', 'January 03 2016', 'Janvier 03 2016 00:43:58', 'February 30 2016 00:00:00', 'February 29 2015 00:00:00',
+				'January 32 2016 00:00:00', 'January 00 2016 00:00:00', 'January 03 2016 24:00:00', 'January 03 2016 00:60:00',
+				'January 03 2016 00:00:60', 'January 03 2016 00:00:61', 'January 03 2016 00-43-58', 'January 03 20a6 00:43:58',
+				'January 03 2016 +0:43:58', u'Janu\xe4ry 03 2016 00:43:58', 'January 03 2016 00:43:58.5']:
+			self.assertParsesLikeStrptime(dateTimeString)
+
+	def testFormatsLikeStrftime(self):
+		randomGen = random.Random(2016)
+		for indx in range(1000):
+			dateTimeOb = datetime.datetime(randomGen.randint(1900, 2100), randomGen.randint(1, 12), randomGen.randint(1, 28),
+				randomGen.randint(0, 23), randomGen.randint(0, 59), randomGen.randint(0, 59), randomGen.randint(0, 999999))
+			self.assertEqual(DateTimeCodec.format(dateTimeOb), dateTimeOb.strftime(WIRE_FORMAT))
+
+	def testRejectsYearsBefore1900LikeStrftime(self):
+		with self.assertRaises(ValueError):
+			DateTimeCodec.format(datetime.datetime(1899, 12, 31, 23, 59, 59))
+
+	def testRoundTrips(self):
+		randomGen = random.Random(7)
+		for indx in range(1000):
+			dateTimeOb = datetime.datetime(randomGen.randint(1900, 2100), randomGen.randint(1, 12), randomGen.randint(1, 28),
+				randomGen.randint(0, 23), randomGen.randint(0, 59), randomGen.randint(0, 59))
+			self.assertEqual(DateTimeCodec.parse(DateTimeCodec.format(dateTimeOb)), dateTimeOb)
+
+	def testMemosAreBounded(self):
+		import classes.DateTimeCodec
+		startTime = datetime.datetime(2016, 1, 1)
+		for indx in range(classes.DateTimeCodec.DATETIME_MEMO_SIZE + 10):
+			DateTimeCodec.parse(DateTimeCodec.format(startTime + datetime.timedelta(seconds = indx)))
+		self.assertTrue(len(DateTimeCodec.parseMemo) <= classes.DateTimeCodec.DATETIME_MEMO_SIZE)
+		self.assertTrue(len(DateTimeCodec.formatMemo) <= classes.DateTimeCodec.DATETIME_MEMO_SIZE)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,202 @@
+"""
+Tests for the datastore free matching engine (classes/MatchingEngine.py)
+"""
+import datetime
+import random
+import unittest
+
+import testsetup
+from classes.MatchingEngine import MealRecord, matchMeals, matchMealStream, maximumMatchMeals, findMatchesForMeal, MATCHED_MEALS, EXPIRED_MEAL
+
+MINIMUM_MEAL_LENGTH = 30
+DAY_START = datetime.datetime(2016, 1, 4, 7, 0)
+
+
+def createRecord(mealType, startMinutes, endMinutes, creator, numPeople = 2):
+	return MealRecord(
+		mealType = mealType,
+		startRange = DAY_START + datetime.timedelta(minutes = startMinutes),
+		endRange = DAY_START + datetime.timedelta(minutes = endMinutes),
+		numPeople = numPeople,
+		creator = creator
+	)
+
+"""
+Random workload of numRequests meals over one day from a fixed seed, with few enough users that some of them
+have several overlapping meals (the case the matchers have to be careful with)
+"""
+def generateWorkload(seed, numRequests, maxPeople = 2):
+	randomGen = random.Random(seed)
+	numUsers = max(2, numRequests / 3)
+	records = []
+	for indx in range(numRequests):
+		startMinutes = randomGen.randint(0, 600)
+		records.append(createRecord(
+			randomGen.randint(0, 2),
+			startMinutes,
+			startMinutes + randomGen.randint(MINIMUM_MEAL_LENGTH - 10, 180),
+			randomGen.randint(0, numUsers - 1),
+			randomGen.randint(2, maxPeople)
+		))
+	return records
+
+
+"""
+Checks that every group a matcher returns could really be made into a meal and that no meal is used twice
+Returns the number of meals that were matched
+"""
+def checkMatching(testCase, unMatchedMeals, mealGroups, mealsToExpire, currentTime):
+	minimumLength = datetime.timedelta(minutes = MINIMUM_MEAL_LENGTH)
+	usedMeals = set()
+	for mealGroup in mealGroups:
+		testCase.assertEqual(len(mealGroup), mealGroup[0].numPeople)
+		testCase.assertEqual(len(set(theMeal.mealType for theMeal in mealGroup)), 1)
+		testCase.assertEqual(len(set(theMeal.numPeople for theMeal in mealGroup)), 1)
+		testCase.assertEqual(len(set(theMeal.creator for theMeal in mealGroup)), len(mealGroup))
+		latestStart = max(theMeal.startRange for theMeal in mealGroup)
+		earliestEnd = min(theMeal.endRange for theMeal in mealGroup)
+		testCase.assertTrue(latestStart <= earliestEnd - minimumLength)
+		for theMeal in mealGroup:
+			testCase.assertTrue(theMeal.endRange >= currentTime)
+			testCase.assertNotIn(id(theMeal), usedMeals)
+			usedMeals.add(id(theMeal))
+
+	expectedExpired = set(id(theMeal) for theMeal in unMatchedMeals if theMeal.endRange < currentTime)
+	testCase.assertEqual(set(id(theMeal) for theMeal in mealsToExpire), expectedExpired)
+	return len(usedMeals)
+
+
+class MatchMealsTest(unittest.TestCase):
+	def testMatchesOverlappingMealsOfDifferentUsers(self):
+		first = createRecord(1, 0, 60, 'alice')
+		second = createRecord(1, 20, 90, 'bob')
+		mealGroups, mealsToExpire = matchMeals([second, first], DAY_START, MINIMUM_MEAL_LENGTH)
+		self.assertEqual(mealGroups, [[first, second]])
+		self.assertEqual(mealsToExpire, [])
+
+	def testDoesNotMatchTheSameUser(self):
+		mealGroups, mealsToExpire = matchMeals([createRecord(1, 0, 60, 'alice'), createRecord(1, 0, 60, 'alice')], DAY_START, MINIMUM_MEAL_LENGTH)
+		self.assertEqual(mealGroups, [])
+
+	def testDoesNotMatchMealsThatOverlapForLessThanTheMinimumLength(self):
+		mealGroups, mealsToExpire = matchMeals([createRecord(1, 0, 60, 'alice'), createRecord(1, 31, 90, 'bob')], DAY_START, MINIMUM_MEAL_LENGTH)
+		self.assertEqual(mealGroups, [])
+
+	def testDoesNotMatchDifferentMealTypesOrSizes(self):
+		mealGroups, mealsToExpire = matchMeals([
+			createRecord(1, 0, 60, 'alice'),
+			createRecord(2, 0, 60, 'bob'),
+			createRecord(1, 0, 60, 'carol', numPeople = 3)
+		], DAY_START, MINIMUM_MEAL_LENGTH)
+		self.assertEqual(mealGroups, [])
+
+	def testExpiresMealsThatAreOver(self):
+		expiredMeal = createRecord(1, 0, 60, 'alice')
+		currentTime = DAY_START + datetime.timedelta(minutes = 61)
+		mealGroups, mealsToExpire = matchMeals([expiredMeal, createRecord(1, 0, 120, 'bob')], currentTime, MINIMUM_MEAL_LENGTH)
+		self.assertEqual(mealGroups, [])
+		self.assertEqual(mealsToExpire, [expiredMeal])
+
+	def testMatchesGroupsOfMoreThanTwo(self):
+		meals = [createRecord(0, 0, 60, 'alice', 3), createRecord(0, 10, 70, 'bob', 3), createRecord(0, 20, 80, 'carol', 3)]
+		mealGroups, mealsToExpire = matchMeals(meals, DAY_START, MINIMUM_MEAL_LENGTH)
+		self.assertEqual(mealGroups, [meals])
+
+	def testRandomWorkloadsOnlyMakeValidGroups(self):
+		currentTime = DAY_START + datetime.timedelta(minutes = 120)
+		for seed in range(20):
+			meals = generateWorkload(seed, 300, maxPeople = 4)
+			mealGroups, mealsToExpire = matchMeals(meals, currentTime, MINIMUM_MEAL_LENGTH)
+			checkMatching(self, meals, mealGroups, mealsToExpire, currentTime)
+
+	def testStreamRejectsUnorderedMeals(self):
+		meals = [createRecord(1, 30, 90, 'alice'), createRecord(1, 0, 60, 'bob')]
+		with self.assertRaises(ValueError):
+			list(matchMealStream(meals, DAY_START, MINIMUM_MEAL_LENGTH))
+
+	def testStreamGivesTheSameResultsAsMatchMeals(self):
+		meals = sorted(generateWorkload(7, 300), key = lambda theMeal: theMeal.startRange)
+		currentTime = DAY_START + datetime.timedelta(minutes = 120)
+		mealGroups, mealsToExpire = matchMeals(meals, currentTime, MINIMUM_MEAL_LENGTH)
+		results = list(matchMealStream(meals, currentTime, MINIMUM_MEAL_LENGTH))
+		self.assertEqual(sorted(result for resultType, result in results if resultType == MATCHED_MEALS), sorted(mealGroups))
+		self.assertEqual(sorted(result for resultType, result in results if resultType == EXPIRED_MEAL), sorted(mealsToExpire))
+
+
+class FindMatchesForMealTest(unittest.TestCase):
+	def testFindsTheFirstCompatibleCandidates(self):
+		newMeal = createRecord(1, 0, 90, 'alice', 3)
+		candidates = [
+			createRecord(1, 0, 40, 'alice', 3),
+			createRecord(1, 10, 80, 'bob', 3),
+			createRecord(1, 20, 90, 'carol', 3),
+			createRecord(1, 30, 90, 'dave', 3)
+		]
+		self.assertEqual(findMatchesForMeal(newMeal, candidates, DAY_START, MINIMUM_MEAL_LENGTH), candidates[1:3])
+
+	def testReturnsNoneWithoutEnoughCandidates(self):
+		newMeal = createRecord(1, 0, 90, 'alice', 3)
+		candidates = [createRecord(1, 10, 80, 'bob', 3), createRecord(1, 70, 120, 'carol', 3)]
+		self.assertIsNone(findMatchesForMeal(newMeal, candidates, DAY_START, MINIMUM_MEAL_LENGTH))
+
+	def testIgnoresExpiredCandidates(self):
+		currentTime = DAY_START + datetime.timedelta(minutes = 50)
+		newMeal = createRecord(1, 20, 120, 'alice')
+		self.assertIsNone(findMatchesForMeal(newMeal, [createRecord(1, 0, 45, 'bob')], currentTime, MINIMUM_MEAL_LENGTH))
+
+
+class MaximumMatchMealsTest(unittest.TestCase):
+	def testMatchesMoreThanFirstFit(self):
+		#first-fit pairs the first two meals and leaves the other two without a partner
+		meals = [
+			createRecord(1, 0, 100, 'alice'),
+			createRecord(1, 0, 40, 'bob'),
+			createRecord(1, 60, 100, 'carol'),
+			createRecord(1, 10, 45, 'dave')
+		]
+		greedyGroups = matchMeals(meals, DAY_START, MINIMUM_MEAL_LENGTH)[0]
+		maximumGroups, mealsToExpire = maximumMatchMeals(meals, DAY_START, MINIMUM_MEAL_LENGTH)
+		self.assertEqual(checkMatching(self, meals, maximumGroups, mealsToExpire, DAY_START), 4)
+		self.assertTrue(sum(len(mealGroup) for mealGroup in greedyGroups) < 4)
+
+	def testMatchesAtLeastAsManyMealsAsFirstFit(self):
+		currentTime = DAY_START + datetime.timedelta(minutes = 120)
+		for seed in range(30):
+			meals = generateWorkload(seed, 200, maxPeople = 3)
+			greedyGroups, greedyExpired = matchMeals(meals, currentTime, MINIMUM_MEAL_LENGTH)
+			maximumGroups, maximumExpired = maximumMatchMeals(meals, currentTime, MINIMUM_MEAL_LENGTH)
+			numGreedyMatched = checkMatching(self, meals, greedyGroups, greedyExpired, currentTime)
+			numMaximumMatched = checkMatching(self, meals, maximumGroups, maximumExpired, currentTime)
+			self.assertTrue(numMaximumMatched >= numGreedyMatched, "seed " + str(seed) + ": " + str(numMaximumMatched) + " < " + str(numGreedyMatched))
+
+	def testIsExactOnSmallWorkloads(self):
+		#brute force the largest number of pairs on workloads small enough to try every matching
+		for seed in range(40):
+			meals = generateWorkload(seed, 10)
+			maximumGroups, mealsToExpire = maximumMatchMeals(meals, DAY_START, MINIMUM_MEAL_LENGTH)
+			numMatched = checkMatching(self, meals, maximumGroups, mealsToExpire, DAY_START)
+			self.assertEqual(numMatched, 2 * largestNumberOfPairs(meals))
+
+
+"""
+Largest number of disjoint compatible pairs among the meals (all for two people), found by trying every matching
+"""
+def largestNumberOfPairs(meals):
+	minimumLength = datetime.timedelta(minutes = MINIMUM_MEAL_LENGTH)
+	def compatible(first, second):
+		return (first.mealType == second.mealType and first.creator != second.creator and
+			max(first.startRange, second.startRange) <= min(first.endRange, second.endRange) - minimumLength)
+	def largestFrom(remaining):
+		if (len(remaining) < 2):
+			return 0
+		first = remaining[0]
+		best = largestFrom(remaining[1:])
+		for indx in range(1, len(remaining)):
+			if (compatible(first, remaining[indx])):
+				best = max(best, 1 + largestFrom(remaining[1:indx] + remaining[indx + 1:]))
+		return best
+	return largestFrom(list(meals))
+
+
+if __name__ == '__main__':
+	unittest.main()
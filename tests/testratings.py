@@ -0,0 +1,106 @@
+"""
+Tests that ratings and reports are stored once however many times they are retried, that they are counted in the
+counter shards and that the standing recompute merges counts (classes/Ratings.py), run against the testbed stubs
+"""
+import unittest
+
+import testsetup
+
+if (testsetup.HAS_APP_ENGINE_SDK):
+	from google.appengine.ext import ndb
+	from classes.TaskDispatcher import TaskDispatcher, LocalTaskQueue
+	from classes.Ratings import Ratings, RatingEvent, ReportEvent, RatingCounterShard, UserStanding, USER_STANDING_ID
+	from classes.Ratings import UPDATE_STANDING_URL, EMAIL_REPORT_URL, MAX_REPORTS_IN_GOOD_STANDING
+
+
+@unittest.skipIf(not testsetup.HAS_APP_ENGINE_SDK, testsetup.SDK_MISSING_REASON)
+class RatingsTest(unittest.TestCase):
+	def setUp(self):
+		self.testbed = testsetup.activateTestbed()
+		self.localQueue = LocalTaskQueue()
+		TaskDispatcher.useLocalQueue(self.localQueue)
+		Ratings.standingCache.clear()
+		self.receiverKey = ndb.Key('User', 1)
+		self.giverKey = ndb.Key('User', 2)
+		self.mealKey = ndb.Key('Meal', 1)
+
+	def tearDown(self):
+		TaskDispatcher.useLocalQueue(None)
+		self.testbed.deactivate()
+
+	def getShardTotals(self):
+		shards = RatingCounterShard.query().fetch()
+		return [sum(shard.numPositiveRatings for shard in shards), sum(shard.numNegativeRatings for shard in shards), sum(shard.numReports for shard in shards)]
+
+	def getTaskUrls(self):
+		return [url for queueName, url, params in self.localQueue.tasks]
+
+	def testRetriedRatingIsStoredOnce(self):
+		self.assertTrue(Ratings.addPositiveRating(self.receiverKey, self.mealKey, self.giverKey))
+		self.assertFalse(Ratings.addPositiveRating(self.receiverKey, self.mealKey, self.giverKey))
+		#a retry with the other rating for the same meal is still the same rating
+		self.assertFalse(Ratings.addNegativeRating(self.receiverKey, self.mealKey, self.giverKey))
+
+		self.assertEqual(RatingEvent.query().count(), 1)
+		self.assertEqual(self.getShardTotals(), [1, 0, 0])
+		self.assertEqual(Ratings.getRatingCountsForUserAsync(self.receiverKey).get_result(), [1, 0, 0])
+		self.assertEqual(self.getTaskUrls(), [UPDATE_STANDING_URL])
+		self.assertTrue(Ratings.userHasGivenFeedbackForMeal(self.giverKey, self.mealKey))
+
+	def testRatingsOfOtherMealsAndGiversAreCounted(self):
+		otherGiverKey = ndb.Key('User', 3)
+		otherMealKey = ndb.Key('Meal', 2)
+		self.assertTrue(Ratings.addPositiveRating(self.receiverKey, self.mealKey, self.giverKey))
+		self.assertTrue(Ratings.addNegativeRating(self.receiverKey, self.mealKey, otherGiverKey))
+		self.assertTrue(Ratings.addNegativeRating(self.receiverKey, otherMealKey, self.giverKey))
+		self.assertEqual(self.getShardTotals(), [1, 2, 0])
+		self.assertEqual(Ratings.getRatingCountsForUserAsync(self.receiverKey).get_result(), [1, 2, 0])
+
+	def testRetriedReportIsStoredAndEmailedOnce(self):
+		self.assertTrue(Ratings.addReportToUser(self.receiverKey, 1, self.giverKey, self.mealKey, "comments"))
+		self.assertFalse(Ratings.addReportToUser(self.receiverKey, 1, self.giverKey, self.mealKey, "comments"))
+
+		self.assertEqual(ReportEvent.query().count(), 1)
+		self.assertEqual(self.getShardTotals(), [0, 0, 1])
+		self.assertEqual(sorted(self.getTaskUrls()), sorted([UPDATE_STANDING_URL, EMAIL_REPORT_URL]))
+
+	def testStandingIsRecomputedFromTheCounts(self):
+		self.assertTrue(Ratings.userIsInGoodStanding(self.receiverKey))
+		for indx in range(MAX_REPORTS_IN_GOOD_STANDING + 1):
+			Ratings.addReportToUser(self.receiverKey, 1, ndb.Key('User', 10 + indx), self.mealKey)
+		#the cached standing is only dropped by the recompute
+		self.assertTrue(Ratings.userIsInGoodStanding(self.receiverKey))
+
+		self.assertFalse(Ratings.updateStandingForUserAsync(self.receiverKey).get_result())
+		self.assertFalse(Ratings.userIsInGoodStanding(self.receiverKey))
+		standingOb = ndb.Key(UserStanding, USER_STANDING_ID, parent = self.receiverKey).get()
+		self.assertEqual([standingOb.numPositiveRatings, standingOb.numNegativeRatings, standingOb.numReports], [0, 0, MAX_REPORTS_IN_GOOD_STANDING + 1])
+
+	def testStandingKeepsTheLargerOfEachCount(self):
+		#a standing stored by a recompute that saw more reports than the shards give now (a stale read) is never undone
+		UserStanding(
+			key = ndb.Key(UserStanding, USER_STANDING_ID, parent = self.receiverKey),
+			isInGoodStanding = False,
+			numPositiveRatings = 0,
+			numNegativeRatings = 0,
+			numReports = MAX_REPORTS_IN_GOOD_STANDING + 1
+		).put()
+		Ratings.addPositiveRating(self.receiverKey, self.mealKey, self.giverKey)
+
+		self.assertFalse(Ratings.updateStandingForUserAsync(self.receiverKey).get_result())
+		standingOb = ndb.Key(UserStanding, USER_STANDING_ID, parent = self.receiverKey).get()
+		self.assertEqual([standingOb.numPositiveRatings, standingOb.numNegativeRatings, standingOb.numReports], [1, 0, MAX_REPORTS_IN_GOOD_STANDING + 1])
+
+	def testRecomputeWithNothingNewDoesNotWrite(self):
+		Ratings.addPositiveRating(self.receiverKey, self.mealKey, self.giverKey)
+		Ratings.updateStandingForUserAsync(self.receiverKey).get_result()
+		standingKey = ndb.Key(UserStanding, USER_STANDING_ID, parent = self.receiverKey)
+		firstUpdated = standingKey.get().updated
+
+		self.assertTrue(Ratings.updateStandingForUserAsync(self.receiverKey).get_result())
+		ndb.get_context().clear_cache()
+		self.assertEqual(standingKey.get().updated, firstUpdated)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,44 @@
+"""
+Shared setup for the unit tests: puts src on the path (like the benchmarks do) and, if the App Engine SDK is installed,
+the SDK's libraries as well so the tests that need the datastore or memcache can run against the testbed stubs
+Those tests are skipped when the SDK isn't there (SDK_MISSING_REASON says why)
+
+Run all of the tests from the repository root with: python -m unittest discover -s tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+try:
+	import dev_appserver
+	dev_appserver.fix_sys_path()
+except ImportError:
+	pass
+
+try:
+	from google.appengine.ext import testbed
+	from google.appengine.datastore import datastore_stub_util
+except ImportError:
+	testbed = None
+	datastore_stub_util = None
+
+HAS_APP_ENGINE_SDK = testbed is not None
+SDK_MISSING_REASON = "the App Engine SDK isn't installed"
+
+
+"""
+Activates a testbed with the datastore (high replication, every write applied straight away so queries see it),
+memcache and task queue stubs and a fresh ndb context
+Returns the testbed, call deactivate() on it when the test is done
+"""
+def activateTestbed():
+	from google.appengine.ext import ndb
+
+	theTestbed = testbed.Testbed()
+	theTestbed.activate()
+	theTestbed.init_datastore_v3_stub(consistency_policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(probability = 1))
+	theTestbed.init_memcache_stub()
+	theTestbed.init_taskqueue_stub()
+	ndb.get_context().clear_cache()
+	return theTestbed
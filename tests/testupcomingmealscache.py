@@ -0,0 +1,73 @@
+"""
+Tests that cached upcoming meals responses (classes/UpcomingMealsCache.py) stop being used once anything changes the
+user's upcoming meals, run against the testbed stubs
+"""
+import datetime
+import unittest
+
+import testsetup
+
+if (testsetup.HAS_APP_ENGINE_SDK):
+	from google.appengine.api import memcache
+	from google.appengine.ext import ndb
+	from classes.UpcomingMealsCache import UpcomingMealsCache
+	from classes.Meal import Meal
+
+
+@unittest.skipIf(not testsetup.HAS_APP_ENGINE_SDK, testsetup.SDK_MISSING_REASON)
+class UpcomingMealsCacheTest(unittest.TestCase):
+	def setUp(self):
+		self.testbed = testsetup.activateTestbed()
+		self.userKey = ndb.Key('User', 1)
+		self.otherUserKey = ndb.Key('User', 2)
+
+	def tearDown(self):
+		self.testbed.deactivate()
+
+	def cacheResponse(self, userKey, serializedResponse):
+		generation, cachedResponse = UpcomingMealsCache.getResponse(userKey, 'upcoming')
+		self.assertIsNone(cachedResponse)
+		UpcomingMealsCache.setResponse(userKey, 'upcoming', generation, serializedResponse)
+		self.assertEqual(UpcomingMealsCache.getResponse(userKey, 'upcoming')[1], serializedResponse)
+
+	def testInvalidatingUsersDropsOnlyTheirResponses(self):
+		self.cacheResponse(self.userKey, 'first')
+		self.cacheResponse(self.otherUserKey, 'other')
+		generation = UpcomingMealsCache.getGeneration(self.userKey)
+
+		UpcomingMealsCache.invalidateUsers([self.userKey, self.userKey])
+		newGeneration, cachedResponse = UpcomingMealsCache.getResponse(self.userKey, 'upcoming')
+		self.assertIsNone(cachedResponse)
+		self.assertNotEqual(newGeneration, generation)
+		self.assertEqual(UpcomingMealsCache.getResponse(self.otherUserKey, 'upcoming')[1], 'other')
+
+	def testResponseBuiltBeforeAnInvalidationIsNotUsed(self):
+		generation = UpcomingMealsCache.getResponse(self.userKey, 'upcoming')[0]
+		UpcomingMealsCache.invalidateUsers([self.userKey])
+		#the response was built from what the user's meals were before they changed
+		UpcomingMealsCache.setResponse(self.userKey, 'upcoming', generation, 'stale')
+		self.assertIsNone(UpcomingMealsCache.getResponse(self.userKey, 'upcoming')[1])
+
+	def testLostGenerationDoesNotBringBackOldResponses(self):
+		self.cacheResponse(self.userKey, 'first')
+		memcache.flush_all()
+		self.assertIsNone(UpcomingMealsCache.getResponse(self.userKey, 'upcoming')[1])
+
+	def testResponseIsNotCachedPastItsExpiry(self):
+		generation = UpcomingMealsCache.getResponse(self.userKey, 'upcoming')[0]
+		UpcomingMealsCache.setResponse(self.userKey, 'upcoming', generation, 'over', datetime.datetime.now() - datetime.timedelta(minutes = 1))
+		self.assertIsNone(UpcomingMealsCache.getResponse(self.userKey, 'upcoming')[1])
+
+	def testRemovingMealsInvalidatesEveryoneInThem(self):
+		mealKey = Meal(mealType = 1, startTime = datetime.datetime.now() + datetime.timedelta(days = 1), numPeople = 2, people = [self.userKey, self.otherUserKey]).put()
+		self.cacheResponse(self.userKey, 'first')
+		self.cacheResponse(self.otherUserKey, 'other')
+
+		Meal.removeMeal(mealKey)
+		self.assertIsNone(mealKey.get())
+		self.assertIsNone(UpcomingMealsCache.getResponse(self.userKey, 'upcoming')[1])
+		self.assertIsNone(UpcomingMealsCache.getResponse(self.otherUserKey, 'upcoming')[1])
+
+
+if __name__ == '__main__':
+	unittest.main()